@@ -1,18 +1,60 @@
 import os
 import sys
-from flask import Flask, request, abort, jsonify, make_response
+from datetime import date
+from flask import Flask, request, abort
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.exc import SQLAlchemyError, DataError
+from sqlalchemy.orm import load_only, selectinload
 from flask_cors import CORS
 from werkzeug.exceptions import NotFound
-from models import setup_db, Actor, Movie
-from auth.auth import AuthError, requires_auth
+from models import (setup_db, catalog_version, db, existing_ids,
+                    insert_rows, movie_actor_assoc, reserve_ids, set_links,
+                    Actor, Movie)
+from auth.auth import AuthError, jwks_cache, requires_auth
+from bulk import (check_actor, check_movie, get_bulk_items, get_linked_ids,
+                  validate_items)
+from cache import response_cache
+from compression import compressor
+from conditional import conditional
+from counts import count_cache, count_rows, get_count_mode
+from fieldsets import get_fieldset
+from filters import (ACTOR_FILTERS, ACTOR_SORTS, MOVIE_FILTERS, MOVIE_SORTS,
+                     get_filters, list_columns_changed)
+from metrics import metrics
+from pagination import get_page_args, iter_batches, paginate
+from replicas import replica_router
+from serializers import (json_backend, json_response, row_serializer,
+                         serialize_row)
+from streaming import stream_list, wants_stream
+from timing import server_timing
 
 
 def create_app(test_config=None):
     app = Flask(__name__)
+    app.config.from_object('config')
+    if test_config:
+        app.config.update(test_config)
     CORS(app)
     setup_db(app)
+    response_cache.init_app(app)
+    count_cache.init_app(app)
+    json_backend.init_app(app)
+    compressor.init_app(app)
+    replica_router.init_app(app)
+    server_timing.init_app(app)
+
+    def database_pools():
+        pools = {'primary': db.engine}
+        for index, engine in enumerate(replica_router.engines):
+            pools['replica%d' % index] = engine
+        return pools
+    metrics.init_app(app, database_pools)
+
+    @app.before_request
+    def before_request():
+        metrics.start()
+        server_timing.start()
+        replica_router.route()
 
     @app.after_request
     def after_request(response):
@@ -22,41 +64,129 @@ def create_app(test_config=None):
         response.headers.add(
             'Access-Control-Allow-Methods',
             'GET,POST,DELETE,PATCH')
-        return response
+        replica_router.record_write(response)
+        response = compressor.compress(response)
+        response = server_timing.finish(response)
+        return metrics.finish(response)
 
     @app.route('/')
     def index():
-        return jsonify({'hello': 'world'})
+        return json_response({'hello': 'world'})
+
+    @app.route('/metrics')
+    def get_metrics():
+        if not metrics.enabled:
+            abort(404)
+        return metrics.response()
 
     # MOVIES ROUTES
     '''
       Movies routes helpers
     '''
-    def get_movie_by_id(movie_id):
-        movie = Movie.query.get(movie_id)
+    def bulk_errors(errors):
+        response = {
+            "success": False,
+            "error": 422,
+            "message": 'Unprocessable - ' + str(len(errors)) +
+            ' items cannot be created, nothing was created',
+            "errors": errors
+        }
+        return json_response(response, 422)
+
+    def get_link_ids(data, key, model, name):
+        '''
+            returns the ids listed under key, None if key is not given
+            aborts with 400 if they are not a list of ids and with 404
+            naming every id that does not exist, found with one IN query
+        '''
+        if data.get(key, None) is None:
+            return None
+        ids = get_linked_ids(data, key)
+        if ids is None:
+            abort(400, 'Bad request - ' + key + ' must be a list of ' +
+                  name + ' ids')
+        found = existing_ids(model, ids)
+        missing = [str(x) for x in ids if x not in found]
+        if missing:
+            abort(404, 'Could not find ' + name + ' with id ' +
+                  ', '.join(missing))
+        return ids
+
+    def get_movie_by_id(movie_id, *options):
+        movie = Movie.query.options(*options).get(movie_id)
         if movie is None:
             return abort(404, 'Could not find movie with id ' + str(movie_id))
         else:
             return movie
+
+    def movie_load_options(fields, include, sort=None):
+        # the next cursor of a sorted page holds the sort value of its
+        # last row, which is loaded even when it is not returned
+        options = [load_only(*fields, *([sort.key] if sort else []))]
+        if 'actors' in include:
+            # load the actors of every row in one extra query
+            options.append(selectinload(Movie.actors))
+        return options
+
+    def movie_cache_tags(movie, include_actors=True):
+        tags = ['movie:' + str(movie.id)]
+        if include_actors:
+            tags += list(map(lambda x: 'actor:' + str(x.id), movie.actors))
+        return tags
     '''
-        GET /movies
+        GET /movies?limit=int&after=movie_id
         returns status code 200 and json
+        {"success": True, "movies": movies, "total_movies": int,
+         "next_cursor": movie_id}
+        where movies is a page of up to limit movies after the cursor,
+        total_movies is the count of all matching movies and next_cursor is
+        the value of after for the next page (null on the last page)
+
+        ?release_from=date&release_to=date&title_prefix=str filter the movies
+        and ?sort=release_date|title|id (prefixed with - for descending)
+        orders them, see filters.py for the combinations allowed
+
+        GET /movies?stream=1
+        streams every movie (after the cursor, if given) as
         {"success": True, "movies": movies, "total_movies": int}
-        where movies is the list of movies and total_movies is the count of all movies
+
+        ?fields=id,title returns only those fields of each movie and
+        ?include=actors embeds the actors; once either is given the actors
+        are only loaded and embedded if included
     '''
     @app.route('/movies', methods=['GET'])
     @requires_auth('read:movies')
+    @response_cache.cached
+    @conditional(catalog_version)
     def get_movies(token):
+        fields, include = get_fieldset(Movie.fields, ['actors'])
+        include_actors = 'actors' in include
+        criteria, sort, descending = get_filters(
+            Movie, MOVIE_FILTERS, MOVIE_SORTS)
+        limit, after = get_page_args(sort=sort)
+        count_mode = get_count_mode()
+        query = Movie.query.options(
+            *movie_load_options(fields, include, sort)).filter(*criteria)
+        serialize = row_serializer(
+            Movie, fields, 'actors' if include_actors else None)
+        if wants_stream():
+            return stream_list('movies', iter_batches(
+                query, Movie.id, app.config['STREAM_BATCH_SIZE'], after,
+                sort, descending), serialize)
         try:
-            movies = Movie.query.order_by(Movie.id).all()
-            formatted_movies = list(map(lambda x: x.format(), movies))
-            total_movies = len(formatted_movies)
+            movies, next_cursor = paginate(
+                query, Movie.id, limit, after, sort, descending)
+            total_movies = count_rows(Movie, criteria, count_mode)
+            response_cache.tag('movies')
+            for movie in movies:
+                response_cache.tag(*movie_cache_tags(movie, include_actors))
             response = {
                 "success": True,
-                "movies": formatted_movies,
-                "total_movies": total_movies
+                "total_movies": total_movies,
+                "next_cursor": next_cursor
             }
-            return make_response(jsonify(response), 200)
+            return json_response(
+                response, 200, raw={'movies': serialize(movies)})
         except DataError as e:
             print(sys.exc_info())
             error = str(e.__dict__['orig'])
@@ -87,20 +217,20 @@ def create_app(test_config=None):
             release_date = movie_data.get('release_date', None)
             if ((not release_date) or (release_date is None)):
                 abort(400, 'Bad request - release_date is required')
+            actor_ids = get_link_ids(movie_data, 'actors', Actor, 'actor')
             try:
                 movie = Movie(title=title, release_date=release_date)
-                actors = movie_data.get('actors', [])
-                if(len(actors) > 0):
-                    for actor_id in actors:
-                        actor = get_actor_by_id(actor_id)
-                        movie.actors.append(actor)
-                movie.insert()
-                formatted_movie = movie.format()
-                response = {
-                    "success": True,
-                    "movie": formatted_movie
-                }
-                return make_response(jsonify(response), 201)
+                db.session.add(movie)
+                db.session.flush()
+                if actor_ids:
+                    set_links(movie_actor_assoc.c.movie_id, movie.id,
+                              actor_ids, new_owner=True)
+                db.session.commit()
+                formatted_movie = serialize_row(movie, Movie.fields, 'actors')
+                response_cache.invalidate('movies', *movie_cache_tags(movie))
+                count_cache.invalidate('movies')
+                return json_response(
+                    {"success": True}, 201, raw={"movie": formatted_movie})
             except NotFound as e:
                 print(sys.exc_info())
                 return abort(404, str(e))
@@ -116,22 +246,86 @@ def create_app(test_config=None):
                 print(sys.exc_info())
                 return abort(500)
 
+    '''
+        POST /movies/bulk
+        takes a json list of movies, each in the same format as POST /movies
+        returns status code 201 and json
+        {"success": True, "movies": [{"index": int, "id": int}],
+         "total_created": int}
+        where movies has the id of the movie created for each item
+
+        every item is validated before anything is written, if any item is
+        invalid or links a missing actor nothing is created and the status
+        code is 422 with {"errors": [{"index": int, "message": str}]}
+    '''
+    @app.route('/movies/bulk', methods=['POST'])
+    @requires_auth('create:movies')
+    def create_movies_bulk(token):
+        items = get_bulk_items('movies')
+        errors = validate_items(items, check_movie, 'actors', Actor, 'actor')
+        if errors:
+            return bulk_errors(errors)
+        try:
+            # rows and links are written with multi-row INSERTs, so the
+            # new ids are taken from the sequence first
+            movie_ids = reserve_ids(Movie, len(items))
+            insert_rows(Movie.__table__, [{
+                'id': movie_id,
+                'title': item['title'],
+                'release_date': date.fromisoformat(item['release_date'])
+            } for movie_id, item in zip(movie_ids, items)])
+            links = [{'movie_id': movie_id, 'actor_id': actor_id}
+                     for movie_id, item in zip(movie_ids, items)
+                     for actor_id in get_linked_ids(item, 'actors')]
+            insert_rows(movie_actor_assoc, links)
+            db.session.commit()
+            response_cache.invalidate(
+                'movies', *['movie:' + str(x) for x in movie_ids],
+                *set('actor:' + str(x['actor_id']) for x in links))
+            count_cache.invalidate('movies')
+            response = {
+                "success": True,
+                "movies": [{'index': index, 'id': movie_id}
+                           for index, movie_id in enumerate(movie_ids)],
+                "total_created": len(movie_ids)
+            }
+            return json_response(response, 201)
+        except DataError as e:
+            db.session.rollback()
+            print(sys.exc_info())
+            error = str(e.__dict__['orig'])
+            return abort(422, error)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            print(sys.exc_info())
+            error = str(e.__dict__['orig'])
+            return abort(500, error)
+        except:
+            db.session.rollback()
+            print(sys.exc_info())
+            return abort(500)
+
     '''
         GET /movies/movie_id
         returns status code 200 and json
         {"success": True, "movie": movie}
+        takes the same ?fields= and ?include= params as GET /movies
     '''
     @app.route('/movies/<int:movie_id>', methods=['GET'])
     @requires_auth('read:movies')
+    @response_cache.cached
+    @conditional(Movie.version)
     def get_movie(token, movie_id):
-        movie = get_movie_by_id(movie_id)
+        fields, include = get_fieldset(Movie.fields, ['actors'])
+        include_actors = 'actors' in include
+        movie = get_movie_by_id(
+            movie_id, *movie_load_options(fields, include))
         try:
-            formatted_movie = movie.format()
-            response = {
-                'success': True,
-                'movie': formatted_movie
-            }
-            return make_response(jsonify(response), 200)
+            formatted_movie = serialize_row(
+                movie, fields, 'actors' if include_actors else None)
+            response_cache.tag(*movie_cache_tags(movie, include_actors))
+            return json_response(
+                {'success': True}, 200, raw={'movie': formatted_movie})
         except DataError as e:
             print(sys.exc_info())
             error = str(e.__dict__['orig'])
@@ -157,6 +351,7 @@ def create_app(test_config=None):
         if movie_data is None:
             abort(400, 'Bad request - movie_data is required')
         else:
+            actor_ids = get_link_ids(movie_data, 'actors', Actor, 'actor')
             try:
                 movie = get_movie_by_id(movie_id)
                 title = movie_data.get('title', None)
@@ -165,18 +360,23 @@ def create_app(test_config=None):
                 release_date = movie_data.get('release_date', None)
                 if (release_date):
                     movie.release_date = release_date
-                actors = movie_data.get('actors', [])
-                if(len(actors) > 0):
-                    for actor_id in actors:
-                        actor = get_actor_by_id(actor_id)
-                        movie.actors.append(actor)
+                # a new title or release date can move the movie into or
+                # out of filtered and sorted pages; checked before
+                # set_links, whose SELECT autoflushes the change
+                cache_tags = ['movies'] if list_columns_changed(
+                    movie, MOVIE_FILTERS, MOVIE_SORTS) else []
+                if actor_ids is not None:
+                    set_links(movie_actor_assoc.c.movie_id, movie.id,
+                              actor_ids)
                 movie.update()
-                formatted_movie = movie.format()
-                response = {
-                    "success": True,
-                    "movie": formatted_movie
-                }
-                return make_response(jsonify(response), 200)
+                formatted_movie = serialize_row(movie, Movie.fields, 'actors')
+                # entries for removed actors embed the movie, so they
+                # carry its tag too
+                response_cache.invalidate(
+                    *cache_tags, *movie_cache_tags(movie))
+                count_cache.invalidate('movies')
+                return json_response(
+                    {"success": True}, 200, raw={"movie": formatted_movie})
             except NotFound as e:
                 print(sys.exc_info())
                 return abort(404, str(e))
@@ -202,12 +402,15 @@ def create_app(test_config=None):
     def delete_movie(token, movie_id):
         movie = get_movie_by_id(movie_id)
         try:
+            cache_tags = movie_cache_tags(movie)
             movie.delete()
+            response_cache.invalidate('movies', *cache_tags)
+            count_cache.invalidate('movies')
             response = {
                 'success': True,
                 'movie_id': movie_id
             }
-            return make_response(jsonify(response), 200)
+            return json_response(response, 200)
         except DataError as e:
             print(sys.exc_info())
             error = str(e.__dict__['orig'])
@@ -224,31 +427,81 @@ def create_app(test_config=None):
     '''
       Actors routes helpers
     '''
-    def get_actor_by_id(actor_id):
-        actor = Actor.query.get(actor_id)
+    def get_actor_by_id(actor_id, *options):
+        actor = Actor.query.options(*options).get(actor_id)
         if actor is None:
             return abort(404, 'Could not find actor with id ' + str(actor_id))
         else:
             return actor
+
+    def actor_load_options(fields, include, sort=None):
+        # the next cursor of a sorted page holds the sort value of its
+        # last row, which is loaded even when it is not returned
+        options = [load_only(*fields, *([sort.key] if sort else []))]
+        if 'movies' in include:
+            # load the movies of every row in one extra query
+            options.append(selectinload(Actor.movies))
+        return options
+
+    def actor_cache_tags(actor, include_movies=True):
+        tags = ['actor:' + str(actor.id)]
+        if include_movies:
+            tags += list(map(lambda x: 'movie:' + str(x.id), actor.movies))
+        return tags
     '''
-        GET /actors
+        GET /actors?limit=int&after=actor_id
         returns status code 200 and json
+        {"success": True, "actors": actors, "total_actors": int,
+         "next_cursor": actor_id}
+        where actors is a page of up to limit actors after the cursor,
+        total_actors is the count of all matching actors and next_cursor is
+        the value of after for the next page (null on the last page)
+
+        ?min_age=int&max_age=int&gender=str&name_prefix=str filter the actors
+        and ?sort=age|name|id (prefixed with - for descending) orders them,
+        see filters.py for the combinations allowed
+
+        GET /actors?stream=1
+        streams every actor (after the cursor, if given) as
         {"success": True, "actors": actors, "total_actors": int}
-        where movies is the list of movies and total_movies is the count of all movies
+
+        ?fields=id,name returns only those fields of each actor and
+        ?include=movies embeds the movies; once either is given the movies
+        are only loaded and embedded if included
     '''
     @app.route('/actors', methods=['GET'])
     @requires_auth('read:actors')
+    @response_cache.cached
+    @conditional(catalog_version)
     def get_actors(token):
+        fields, include = get_fieldset(Actor.fields, ['movies'])
+        include_movies = 'movies' in include
+        criteria, sort, descending = get_filters(
+            Actor, ACTOR_FILTERS, ACTOR_SORTS)
+        limit, after = get_page_args(sort=sort)
+        count_mode = get_count_mode()
+        query = Actor.query.options(
+            *actor_load_options(fields, include, sort)).filter(*criteria)
+        serialize = row_serializer(
+            Actor, fields, 'movies' if include_movies else None)
+        if wants_stream():
+            return stream_list('actors', iter_batches(
+                query, Actor.id, app.config['STREAM_BATCH_SIZE'], after,
+                sort, descending), serialize)
         try:
-            actors = Actor.query.order_by(Actor.id).all()
-            formatted_actors = list(map(lambda x: x.format(), actors))
-            total_actors = len(formatted_actors)
+            actors, next_cursor = paginate(
+                query, Actor.id, limit, after, sort, descending)
+            total_actors = count_rows(Actor, criteria, count_mode)
+            response_cache.tag('actors')
+            for actor in actors:
+                response_cache.tag(*actor_cache_tags(actor, include_movies))
             response = {
                 "success": True,
-                "actors": formatted_actors,
-                "total_actors": total_actors
+                "total_actors": total_actors,
+                "next_cursor": next_cursor
             }
-            return make_response(jsonify(response), 200)
+            return json_response(
+                response, 200, raw={'actors': serialize(actors)})
         except DataError as e:
             print(sys.exc_info())
             error = str(e.__dict__['orig'])
@@ -284,22 +537,20 @@ def create_app(test_config=None):
             gender = actor_data.get('gender', None)
             if ((not gender) or (gender is None)):
                 abort(400, 'Bad request - gender is required')
+            movie_ids = get_link_ids(actor_data, 'movies', Movie, 'movie')
             try:
                 actor = Actor(name=name, age=age, gender=gender)
-                actor.insert()
-
-                movies = actor_data.get('movies', [])
-                if(len(movies) > 0):
-                    for movie_id in movies:
-                        movie = get_movie_by_id(movie_id)
-                        actor.movies.append(movie)
-                actor.insert()
-                formatted_actor = actor.format()
-                response = {
-                    "success": True,
-                    "actor": formatted_actor
-                }
-                return make_response(jsonify(response), 201)
+                db.session.add(actor)
+                db.session.flush()
+                if movie_ids:
+                    set_links(movie_actor_assoc.c.actor_id, actor.id,
+                              movie_ids, new_owner=True)
+                db.session.commit()
+                formatted_actor = serialize_row(actor, Actor.fields, 'movies')
+                response_cache.invalidate('actors', *actor_cache_tags(actor))
+                count_cache.invalidate('actors')
+                return json_response(
+                    {"success": True}, 201, raw={"actor": formatted_actor})
             except NotFound as e:
                 print(sys.exc_info())
                 return abort(404, str(e))
@@ -314,22 +565,85 @@ def create_app(test_config=None):
             except:
                 print(sys.exc_info())
                 return abort(500)
+
+    '''
+        POST /actors/bulk
+        takes a json list of actors, each in the same format as POST /actors
+        returns status code 201 and json
+        {"success": True, "actors": [{"index": int, "id": int}],
+         "total_created": int}
+        where actors has the id of the actor created for each item
+
+        every item is validated before anything is written, if any item is
+        invalid or links a missing movie nothing is created and the status
+        code is 422 with {"errors": [{"index": int, "message": str}]}
+    '''
+    @app.route('/actors/bulk', methods=['POST'])
+    @requires_auth('create:actors')
+    def create_actors_bulk(token):
+        items = get_bulk_items('actors')
+        errors = validate_items(items, check_actor, 'movies', Movie, 'movie')
+        if errors:
+            return bulk_errors(errors)
+        try:
+            actor_ids = reserve_ids(Actor, len(items))
+            insert_rows(Actor.__table__, [{
+                'id': actor_id,
+                'name': item['name'],
+                'age': item['age'],
+                'gender': item['gender']
+            } for actor_id, item in zip(actor_ids, items)])
+            links = [{'movie_id': movie_id, 'actor_id': actor_id}
+                     for actor_id, item in zip(actor_ids, items)
+                     for movie_id in get_linked_ids(item, 'movies')]
+            insert_rows(movie_actor_assoc, links)
+            db.session.commit()
+            response_cache.invalidate(
+                'actors', *['actor:' + str(x) for x in actor_ids],
+                *set('movie:' + str(x['movie_id']) for x in links))
+            count_cache.invalidate('actors')
+            response = {
+                "success": True,
+                "actors": [{'index': index, 'id': actor_id}
+                           for index, actor_id in enumerate(actor_ids)],
+                "total_created": len(actor_ids)
+            }
+            return json_response(response, 201)
+        except DataError as e:
+            db.session.rollback()
+            print(sys.exc_info())
+            error = str(e.__dict__['orig'])
+            return abort(422, error)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            print(sys.exc_info())
+            error = str(e.__dict__['orig'])
+            return abort(500, error)
+        except:
+            db.session.rollback()
+            print(sys.exc_info())
+            return abort(500)
     '''
         GET /actors/actor_id
         returns status code 200 and json
         {"success": True, "actor": actor}
+        takes the same ?fields= and ?include= params as GET /actors
     '''
     @app.route('/actors/<int:actor_id>', methods=['GET'])
     @requires_auth('read:actors')
+    @response_cache.cached
+    @conditional(Actor.version)
     def get_actor(token, actor_id):
-        actor = get_actor_by_id(actor_id)
+        fields, include = get_fieldset(Actor.fields, ['movies'])
+        include_movies = 'movies' in include
+        actor = get_actor_by_id(
+            actor_id, *actor_load_options(fields, include))
         try:
-            formatted_actor = actor.format()
-            response = {
-                'success': True,
-                'actor': formatted_actor
-            }
-            return make_response(jsonify(response), 200)
+            formatted_actor = serialize_row(
+                actor, fields, 'movies' if include_movies else None)
+            response_cache.tag(*actor_cache_tags(actor, include_movies))
+            return json_response(
+                {'success': True}, 200, raw={'actor': formatted_actor})
         except DataError as e:
             print(sys.exc_info())
             error = str(e.__dict__['orig'])
@@ -356,6 +670,7 @@ def create_app(test_config=None):
             abort(400, 'Bad request - actor_data is required')
         else:
             actor = get_actor_by_id(actor_id)
+            movie_ids = get_link_ids(actor_data, 'movies', Movie, 'movie')
             name = actor_data.get('name', None)
             if (name):
                 actor.name = name
@@ -366,18 +681,23 @@ def create_app(test_config=None):
             if (age):
                 actor.age = age
             try:
-                movies = actor_data.get('movies', [])
-                if(len(movies) > 0):
-                    for movie_id in movies:
-                        movie = get_movie_by_id(movie_id)
-                        actor.movies.append(movie)
+                # a new name, age or gender can move the actor into or out
+                # of filtered and sorted pages; checked before set_links,
+                # whose SELECT autoflushes the change
+                cache_tags = ['actors'] if list_columns_changed(
+                    actor, ACTOR_FILTERS, ACTOR_SORTS) else []
+                if movie_ids is not None:
+                    set_links(movie_actor_assoc.c.actor_id, actor.id,
+                              movie_ids)
                 actor.update()
-                formatted_actor = actor.format()
-                response = {
-                    "success": True,
-                    "actor": formatted_actor
-                }
-                return make_response(jsonify(response), 200)
+                formatted_actor = serialize_row(actor, Actor.fields, 'movies')
+                # entries for removed movies embed the actor, so they
+                # carry its tag too
+                response_cache.invalidate(
+                    *cache_tags, *actor_cache_tags(actor))
+                count_cache.invalidate('actors')
+                return json_response(
+                    {"success": True}, 200, raw={"actor": formatted_actor})
             except NotFound as e:
                 print(sys.exc_info())
                 return abort(404, str(e))
@@ -403,12 +723,15 @@ def create_app(test_config=None):
     def delete_actor(token, actor_id):
         actor = get_actor_by_id(actor_id)
         try:
+            cache_tags = actor_cache_tags(actor)
             actor.delete()
+            response_cache.invalidate('actors', *cache_tags)
+            count_cache.invalidate('actors')
             response = {
                 'success': True,
                 'actor_id': actor_id
             }
-            return make_response(jsonify(response), 200)
+            return json_response(response, 200)
         except DataError as e:
             print(sys.exc_info())
             error = str(e.__dict__['orig'])
@@ -428,46 +751,70 @@ def create_app(test_config=None):
     @app.errorhandler(422)
     def unprocessable(error):
         message = error.description if error.description else 'bad request'
-        return jsonify({
+        return json_response({
             "success": False,
             "error": 422,
             "message": message
-        }), 422
+        }, 422)
 
     @app.errorhandler(400)
     def bad_request(error):
         message = error.description if error.description else 'bad request'
-        return jsonify({
+        return json_response({
             "success": False,
             "error": 400,
             "message": message
-        }), 400
+        }, 400)
 
     @app.errorhandler(500)
     def internal_server(error):
-        return jsonify({
+        return json_response({
             "success": False,
             "error": 500,
             "message": 'internal server error'
-        }), 500
+        }, 500)
 
     @app.errorhandler(404)
     def not_found(error):
         message = error.description if error.description else 'resource not found'
-        return jsonify({
+        return json_response({
             "success": False,
             "error": 404,
             "message": message
-        }), 404
+        }, 404)
 
     @app.errorhandler(AuthError)
     def auth_error(error):
-        return jsonify(error.error), error.status_code
+        return json_response(error.error, error.status_code)
 
     return app
 
 
-app = create_app()
+def warm_up(app):
+    '''
+    does the one-off work of a worker's first request ahead of time: loads
+    the signing keys, connects once to each database, which imports the
+    driver and sets up the dialect, and loads a movie and an actor with
+    their relationships from the primary, which sets up the loaders the
+    routes use. The connections are closed after, so that processes forked
+    afterwards do not share them
+    '''
+    try:
+        jwks_cache.ensure_fresh()
+    except AuthError:
+        print(sys.exc_info())
+    with app.app_context():
+        try:
+            for engine in replica_router.engines:
+                engine.connect().close()
+            Movie.query.options(selectinload(Movie.actors)).limit(1).all()
+            Actor.query.options(selectinload(Actor.movies)).limit(1).all()
+        except SQLAlchemyError:
+            print(sys.exc_info())
+        db.session.remove()
+        for engine in [db.engine] + replica_router.engines:
+            engine.dispose()
+
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
+    create_app().run(host='0.0.0.0', port=8080, debug=True)
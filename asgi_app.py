@@ -0,0 +1,698 @@
+import asyncio
+import json
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import date
+from functools import wraps
+from asyncpg.exceptions import DataError, PostgresError
+from databases import Database
+from quart import Quart, Response, jsonify, request
+from quart.exceptions import HTTPException as QuartHTTPException
+from quart.json import JSONEncoder as QuartJSONEncoder
+from sqlalchemy import Integer, and_, cast, func, select
+from sqlalchemy.dialects import postgresql
+from werkzeug.exceptions import HTTPException, NotFound, abort
+from werkzeug.http import http_date
+from models import (BULK_INSERT_CHUNK, database_path, movie_actor_assoc,
+                    Actor, Movie)
+from auth.auth import (AuthError, check_permissions, get_token_auth_header,
+                       jwks_cache, token_cache, verify_decode_jwt)
+from bulk import (all_linked_ids, check_actor, check_bulk_items,
+                  check_items, check_links, check_movie, get_linked_ids)
+from counts import count_cache, count_key, count_statement, get_count_mode
+from db_pool import database_options
+from fieldsets import get_fieldset
+from filters import (ACTOR_FILTERS, ACTOR_SORTS, MOVIE_FILTERS, MOVIE_SORTS,
+                     get_filters)
+from pagination import (after_cursor, get_page_args, make_cursor, order,
+                        read_cursor)
+from streaming import wants_stream
+
+'''
+Asyncio serving mode
+    The routes of app.py on Quart, an ASGI framework, with every query sent
+    through asyncpg, so a worker serves many requests at once on one event
+    loop instead of one request per thread. The models, the query param
+    parsing and the auth checks are shared with app.py; the queries are
+    built from the same tables with SQLAlchemy core.
+
+        hypercorn asgi_app:app
+
+    Not ported: the response cache and the ETag / If-None-Match handling,
+    and ?count=estimated with filters, which counts exactly.
+'''
+
+'''
+(column of the owner, column of the linked row, linked model)
+for each relationship a route can embed
+'''
+RELATIONSHIPS = {
+    'actors': (movie_actor_assoc.c.movie_id, movie_actor_assoc.c.actor_id,
+               Actor),
+    'movies': (movie_actor_assoc.c.actor_id, movie_actor_assoc.c.movie_id,
+               Movie),
+}
+
+
+class JSONEncoder(QuartJSONEncoder):
+    # dates are sent in the same format as app.py sends them
+    def default(self, object_):
+        if isinstance(object_, date):
+            return http_date(object_.timetuple())
+        return super().default(object_)
+
+
+def parse_date(name, value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        abort(422, 'Unprocessable - ' + name + ' must be a YYYY-MM-DD date')
+
+
+def create_app(test_config=None):
+    app = Quart(__name__)
+    app.config.from_object('config')
+    if test_config:
+        app.config.update(test_config)
+    app.json_encoder = JSONEncoder
+    count_cache.init_app(app)
+    database = Database(app.config.get('DATABASE_URL', database_path),
+                        **database_options(app.config))
+    app.database = database
+
+    @app.before_serving
+    async def connect():
+        await database.connect()
+
+    @app.after_serving
+    async def disconnect():
+        await database.disconnect()
+
+    @app.after_request
+    async def after_request(response):
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        response.headers.add(
+            'Access-Control-Allow-Headers',
+            'Content-Type, Authorization')
+        response.headers.add(
+            'Access-Control-Allow-Methods',
+            'GET,POST,DELETE,PATCH')
+        return response
+
+    def requires_auth(permission=''):
+        '''
+            the auth check of auth.requires_auth; fetching the key set and
+            verifying a token that is not cached yet run in a worker thread
+            so they do not block the event loop
+        '''
+        def requires_auth_decorator(f):
+            @wraps(f)
+            async def wrapper(*args, **kwargs):
+                token = get_token_auth_header(request.headers)
+                loop = asyncio.get_event_loop()
+                if jwks_cache.is_stale():
+                    await loop.run_in_executor(None, jwks_cache.ensure_fresh)
+                payload = token_cache.get(token)
+                if payload is None:
+                    start = time.perf_counter()
+                    payload = await loop.run_in_executor(
+                        None, verify_decode_jwt, token)
+                    token_cache.set(
+                        token, payload, time.perf_counter() - start)
+                check_permissions(permission, payload)
+                return await f(payload, *args, **kwargs)
+
+            return wrapper
+        return requires_auth_decorator
+
+    @asynccontextmanager
+    async def transaction():
+        async with database.transaction():
+            # behind PgBouncer the timeout is not set on the connection,
+            # see db_pool.py
+            if app.config['DB_PGBOUNCER'] and \
+                    app.config['DB_STATEMENT_TIMEOUT']:
+                await database.execute(
+                    'SET LOCAL statement_timeout = %d' %
+                    app.config['DB_STATEMENT_TIMEOUT'])
+            yield
+
+    @app.route('/')
+    async def index():
+        return jsonify({'hello': 'world'})
+
+    '''
+      Routes helpers, the async counterparts of the helpers in app.py,
+      pagination.py, counts.py and models.py
+    '''
+    def bulk_errors(errors):
+        response = {
+            "success": False,
+            "error": 422,
+            "message": 'Unprocessable - ' + str(len(errors)) +
+            ' items cannot be created, nothing was created',
+            "errors": errors
+        }
+        return jsonify(response), 422
+
+    def database_error(e):
+        print(sys.exc_info())
+        if isinstance(e, DataError):
+            return abort(422, str(e))
+        return abort(500, str(e))
+
+    async def existing_ids(model, ids):
+        if not ids:
+            return set()
+        rows = await database.fetch_all(
+            select([model.id]).where(model.id.in_(set(ids))))
+        return set(row[0] for row in rows)
+
+    async def get_link_ids(data, key, model, name):
+        if data.get(key, None) is None:
+            return None
+        ids = get_linked_ids(data, key)
+        if ids is None:
+            abort(400, 'Bad request - ' + key + ' must be a list of ' +
+                  name + ' ids')
+        found = await existing_ids(model, ids)
+        missing = [str(x) for x in ids if x not in found]
+        if missing:
+            abort(404, 'Could not find ' + name + ' with id ' +
+                  ', '.join(missing))
+        return ids
+
+    async def reserve_ids(model, count):
+        rows = await database.fetch_all(
+            select([func.nextval(model.__tablename__ + '_id_seq')])
+            .select_from(func.generate_series(1, cast(count, Integer))))
+        return [row[0] for row in rows]
+
+    async def insert_rows(table, rows):
+        for start in range(0, len(rows), BULK_INSERT_CHUNK):
+            await database.execute(
+                table.insert().values(rows[start:start + BULK_INSERT_CHUNK]))
+
+    async def set_links(relationship, owner_id, ids, new_owner=False):
+        owner_column, other_column, model = RELATIONSHIPS[relationship]
+        current = set()
+        if not new_owner:
+            rows = await database.fetch_all(
+                select([other_column]).where(owner_column == owner_id))
+            current = set(row[0] for row in rows)
+        wanted = set(ids)
+        await insert_rows(movie_actor_assoc, [
+            {owner_column.name: owner_id, other_column.name: other_id}
+            for other_id in sorted(wanted - current)])
+        removed = current - wanted
+        if removed:
+            await database.execute(movie_actor_assoc.delete().where(
+                owner_column == owner_id).where(other_column.in_(removed)))
+
+    async def fetch_linked(relationship, ids):
+        '''
+            returns {owner id: [linked rows]} for the owners in ids,
+            with one query
+        '''
+        owner_column, other_column, model = RELATIONSHIPS[relationship]
+        table = model.__table__
+        linked = {x: [] for x in ids}
+        if not ids:
+            return linked
+        rows = await database.fetch_all(
+            select([owner_column.label('owner_id')] +
+                   [table.c[field] for field in model.fields])
+            .select_from(movie_actor_assoc.join(
+                table, table.c.id == other_column))
+            .where(owner_column.in_(ids))
+            .order_by(owner_column, table.c.id))
+        for row in rows:
+            linked[row['owner_id']].append(
+                {field: row[field] for field in model.fields})
+        return linked
+
+    async def format_rows(rows, fields, relationship=None):
+        linked = {}
+        if relationship:
+            linked = await fetch_linked(relationship, [x['id'] for x in rows])
+        formatted = []
+        for row in rows:
+            item = {field: row[field] for field in fields}
+            if relationship:
+                items = linked[row['id']]
+                item[relationship] = {
+                    relationship: items,
+                    'total_' + relationship: len(items)
+                }
+            formatted.append(item)
+        return formatted
+
+    def select_fields(model, fields, sort=None):
+        table = model.__table__
+        # the id is always selected, it is the cursor and the link key,
+        # and so is the sort column, the next cursor of a sorted page
+        # holds its value
+        extra = [sort.key] if sort is not None and sort.key not in fields \
+            else []
+        return select([table.c.id] + [
+            table.c[field] for field in list(fields) + extra
+            if field != 'id'])
+
+    async def fetch_page(query, column, limit, after=None, sort=None,
+                         descending=False):
+        if after is not None:
+            query = query.where(after_cursor(column, after, sort, descending))
+        rows = await database.fetch_all(query.order_by(
+            *order(column, sort, descending)).limit(limit + 1))
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            return rows, make_cursor(
+                last['id'], sort, None if sort is None else last[sort.key])
+        return rows, None
+
+    async def count_rows(model, criteria, mode):
+        if mode == 'estimated' and not criteria:
+            estimate = await database.fetch_val(
+                'SELECT reltuples FROM pg_class '
+                'WHERE oid = to_regclass(:table)',
+                {'table': model.__tablename__})
+            if estimate is not None and estimate > 0:
+                return int(estimate)
+        table = model.__tablename__
+        statement = count_statement(model, criteria)
+        key = count_key(statement, postgresql.dialect())
+        count = count_cache.get(table, key)
+        if count is None:
+            count = await database.fetch_val(statement)
+            count_cache.set(table, key, count)
+        return count
+
+    def stream_rows(key, query, column, fields, relationship, after, sort,
+                    descending):
+        '''
+            the async counterpart of streaming.stream_list
+        '''
+        batch_size = app.config['STREAM_BATCH_SIZE']
+
+        async def generate():
+            yield ('{"success": true, "%s": [' % key).encode()
+            total = 0
+            cursor = after
+            try:
+                while True:
+                    rows, cursor = await fetch_page(
+                        query, column, batch_size, cursor, sort, descending)
+                    if rows:
+                        chunk = ', '.join(
+                            json.dumps(x, cls=JSONEncoder) for x in
+                            await format_rows(rows, fields, relationship))
+                        yield ((', ' + chunk) if total else chunk).encode()
+                        total += len(rows)
+                    if cursor is None:
+                        break
+                    cursor = read_cursor(cursor, sort)
+            except:
+                print(sys.exc_info())
+                raise
+            yield ('], "total_%s": %d}' % (key, total)).encode()
+
+        return Response(generate(), mimetype=app.config['JSONIFY_MIMETYPE'])
+
+    async def list_rows(key, model, filters, sorts, relationship):
+        '''
+            the body of GET /movies and GET /actors, see app.py
+        '''
+        fields, include = get_fieldset(
+            model.fields, [relationship], request.args)
+        if relationship not in include:
+            relationship = None
+        criteria, sort, descending = get_filters(
+            model, filters, sorts, request.args)
+        limit, after = get_page_args(request.args, app.config, sort)
+        count_mode = get_count_mode(request.args)
+        query = select_fields(model, fields, sort).where(and_(*criteria))
+        column = model.__table__.c.id
+        if wants_stream(request.args):
+            return stream_rows(key, query, column, fields, relationship,
+                               after, sort, descending)
+        try:
+            rows, next_cursor = await fetch_page(
+                query, column, limit, after, sort, descending)
+            formatted = await format_rows(rows, fields, relationship)
+            total = await count_rows(model, criteria, count_mode)
+            response = {
+                "success": True,
+                key: formatted,
+                "total_" + key: total,
+                "next_cursor": next_cursor
+            }
+            return jsonify(response), 200
+        except PostgresError as e:
+            return database_error(e)
+
+    async def get_row_by_id(model, row_id, fields=None, relationship=None):
+        '''
+            returns the formatted row, aborts with 404 if it does not exist
+        '''
+        fields = model.fields if fields is None else fields
+        row = await database.fetch_one(select_fields(model, fields).where(
+            model.__table__.c.id == row_id))
+        if row is None:
+            return abort(404, 'Could not find ' + model.__tablename__[:-1] +
+                         ' with id ' + str(row_id))
+        return (await format_rows([row], fields, relationship))[0]
+
+    async def get_formatted(key, model, row_id, relationship):
+        fields, include = get_fieldset(
+            model.fields, [relationship], request.args)
+        if relationship not in include:
+            relationship = None
+        row = await get_row_by_id(model, row_id, fields, relationship)
+        return jsonify({'success': True, key: row}), 200
+
+    async def delete_row(model, row_id):
+        await get_row_by_id(model, row_id)
+        try:
+            # the links go with it, ON DELETE CASCADE
+            async with transaction():
+                await database.execute(model.__table__.delete().where(
+                    model.__table__.c.id == row_id))
+            count_cache.invalidate(model.__tablename__)
+        except PostgresError as e:
+            return database_error(e)
+
+    # MOVIES ROUTES
+    '''
+        GET /movies
+        same params and response as GET /movies in app.py
+    '''
+    @app.route('/movies', methods=['GET'])
+    @requires_auth('read:movies')
+    async def get_movies(token):
+        return await list_rows(
+            'movies', Movie, MOVIE_FILTERS, MOVIE_SORTS, 'actors')
+
+    '''
+        POST /movies
+        returns status code 201 and json
+        {"success": True, "movie": movie}
+    '''
+    @app.route('/movies', methods=['POST'])
+    @requires_auth('create:movies')
+    async def create_movie(token):
+        movie_data = await request.get_json()
+        if movie_data is None:
+            abort(400, 'Bad request - movie_data is required')
+        title = movie_data.get('title', None)
+        if not title:
+            abort(400, 'Bad request - title is required')
+        release_date = movie_data.get('release_date', None)
+        if not release_date:
+            abort(400, 'Bad request - release_date is required')
+        actor_ids = await get_link_ids(movie_data, 'actors', Actor, 'actor')
+        release_date = parse_date('release_date', release_date)
+        try:
+            async with transaction():
+                movie_id = await database.execute(Movie.__table__.insert(
+                ).values(title=title, release_date=release_date))
+                if actor_ids:
+                    await set_links('actors', movie_id, actor_ids,
+                                    new_owner=True)
+            count_cache.invalidate('movies')
+            movie = await get_row_by_id(Movie, movie_id, None, 'actors')
+            return jsonify({"success": True, "movie": movie}), 201
+        except PostgresError as e:
+            return database_error(e)
+
+    '''
+        POST /movies/bulk
+        same body and response as POST /movies/bulk in app.py
+    '''
+    @app.route('/movies/bulk', methods=['POST'])
+    @requires_auth('create:movies')
+    async def create_movies_bulk(token):
+        items = check_bulk_items(await request.get_json(), 'movies',
+                                 app.config['BULK_MAX_ITEMS'])
+        errors = check_items(items, check_movie)
+        if not errors:
+            found = await existing_ids(Actor, all_linked_ids(items, 'actors'))
+            errors = check_links(items, 'actors', found, 'actor')
+        if errors:
+            return bulk_errors(errors)
+        try:
+            async with transaction():
+                movie_ids = await reserve_ids(Movie, len(items))
+                await insert_rows(Movie.__table__, [{
+                    'id': movie_id,
+                    'title': item['title'],
+                    'release_date': date.fromisoformat(item['release_date'])
+                } for movie_id, item in zip(movie_ids, items)])
+                await insert_rows(movie_actor_assoc, [
+                    {'movie_id': movie_id, 'actor_id': actor_id}
+                    for movie_id, item in zip(movie_ids, items)
+                    for actor_id in get_linked_ids(item, 'actors')])
+            count_cache.invalidate('movies')
+            response = {
+                "success": True,
+                "movies": [{'index': index, 'id': movie_id}
+                           for index, movie_id in enumerate(movie_ids)],
+                "total_created": len(movie_ids)
+            }
+            return jsonify(response), 201
+        except PostgresError as e:
+            return database_error(e)
+
+    '''
+        GET /movies/movie_id
+        returns status code 200 and json
+        {"success": True, "movie": movie}
+    '''
+    @app.route('/movies/<int:movie_id>', methods=['GET'])
+    @requires_auth('read:movies')
+    async def get_movie(token, movie_id):
+        return await get_formatted('movie', Movie, movie_id, 'actors')
+
+    '''
+        PATCH /movies/movie_id
+        returns status code 200 and json
+        {"success": True, "movie": movie}
+    '''
+    @app.route('/movies/<int:movie_id>', methods=['PATCH'])
+    @requires_auth('update:movies')
+    async def update_movie(token, movie_id):
+        movie_data = await request.get_json()
+        if movie_data is None:
+            abort(400, 'Bad request - movie_data is required')
+        actor_ids = await get_link_ids(movie_data, 'actors', Actor, 'actor')
+        try:
+            await get_row_by_id(Movie, movie_id)
+        except NotFound as e:
+            # app.py reports this 404 with the status in the message
+            print(sys.exc_info())
+            abort(404, str(e))
+        values = {}
+        if movie_data.get('title', None):
+            values['title'] = movie_data['title']
+        if movie_data.get('release_date', None):
+            values['release_date'] = parse_date(
+                'release_date', movie_data['release_date'])
+        try:
+            async with transaction():
+                if values:
+                    await database.execute(Movie.__table__.update().where(
+                        Movie.__table__.c.id == movie_id).values(**values))
+                if actor_ids is not None:
+                    await set_links('actors', movie_id, actor_ids)
+            count_cache.invalidate('movies')
+            movie = await get_row_by_id(Movie, movie_id, None, 'actors')
+            return jsonify({"success": True, "movie": movie}), 200
+        except PostgresError as e:
+            return database_error(e)
+
+    '''
+        DELETE /movies/movie_id
+        returns status code 200 and json
+        {"success": True, "movie_id": id}
+    '''
+    @app.route('/movies/<int:movie_id>', methods=['DELETE'])
+    @requires_auth('delete:movies')
+    async def delete_movie(token, movie_id):
+        await delete_row(Movie, movie_id)
+        return jsonify({'success': True, 'movie_id': movie_id}), 200
+
+    # Actors ROUTES
+    '''
+        GET /actors
+        same params and response as GET /actors in app.py
+    '''
+    @app.route('/actors', methods=['GET'])
+    @requires_auth('read:actors')
+    async def get_actors(token):
+        return await list_rows(
+            'actors', Actor, ACTOR_FILTERS, ACTOR_SORTS, 'movies')
+
+    '''
+        POST /actors
+        returns status code 201 and json
+        {"success": True, "actor": actor}
+    '''
+    @app.route('/actors', methods=['POST'])
+    @requires_auth('create:actors')
+    async def create_actor(token):
+        actor_data = await request.get_json()
+        if actor_data is None:
+            abort(400, 'Bad request - actor_data is required')
+        name = actor_data.get('name', None)
+        if not name:
+            abort(400, 'Bad request - name is required')
+        age = actor_data.get('age', None)
+        if not age:
+            abort(400, 'Bad request - age is required')
+        gender = actor_data.get('gender', None)
+        if not gender:
+            abort(400, 'Bad request - gender is required')
+        movie_ids = await get_link_ids(actor_data, 'movies', Movie, 'movie')
+        try:
+            async with transaction():
+                actor_id = await database.execute(Actor.__table__.insert(
+                ).values(name=name, age=age, gender=gender))
+                if movie_ids:
+                    await set_links('movies', actor_id, movie_ids,
+                                    new_owner=True)
+            count_cache.invalidate('actors')
+            actor = await get_row_by_id(Actor, actor_id, None, 'movies')
+            return jsonify({"success": True, "actor": actor}), 201
+        except PostgresError as e:
+            return database_error(e)
+
+    '''
+        POST /actors/bulk
+        same body and response as POST /actors/bulk in app.py
+    '''
+    @app.route('/actors/bulk', methods=['POST'])
+    @requires_auth('create:actors')
+    async def create_actors_bulk(token):
+        items = check_bulk_items(await request.get_json(), 'actors',
+                                 app.config['BULK_MAX_ITEMS'])
+        errors = check_items(items, check_actor)
+        if not errors:
+            found = await existing_ids(Movie, all_linked_ids(items, 'movies'))
+            errors = check_links(items, 'movies', found, 'movie')
+        if errors:
+            return bulk_errors(errors)
+        try:
+            async with transaction():
+                actor_ids = await reserve_ids(Actor, len(items))
+                await insert_rows(Actor.__table__, [{
+                    'id': actor_id,
+                    'name': item['name'],
+                    'age': item['age'],
+                    'gender': item['gender']
+                } for actor_id, item in zip(actor_ids, items)])
+                await insert_rows(movie_actor_assoc, [
+                    {'movie_id': movie_id, 'actor_id': actor_id}
+                    for actor_id, item in zip(actor_ids, items)
+                    for movie_id in get_linked_ids(item, 'movies')])
+            count_cache.invalidate('actors')
+            response = {
+                "success": True,
+                "actors": [{'index': index, 'id': actor_id}
+                           for index, actor_id in enumerate(actor_ids)],
+                "total_created": len(actor_ids)
+            }
+            return jsonify(response), 201
+        except PostgresError as e:
+            return database_error(e)
+
+    '''
+        GET /actors/actor_id
+        returns status code 200 and json
+        {"success": True, "actor": actor}
+    '''
+    @app.route('/actors/<int:actor_id>', methods=['GET'])
+    @requires_auth('read:actors')
+    async def get_actor(token, actor_id):
+        return await get_formatted('actor', Actor, actor_id, 'movies')
+
+    '''
+        PATCH /actors/actor_id
+        returns status code 200 and json
+        {"success": True, "actor": actor}
+    '''
+    @app.route('/actors/<int:actor_id>', methods=['PATCH'])
+    @requires_auth('update:actors')
+    async def update_actor(token, actor_id):
+        actor_data = await request.get_json()
+        if actor_data is None:
+            abort(400, 'Bad request - actor_data is required')
+        await get_row_by_id(Actor, actor_id)
+        movie_ids = await get_link_ids(actor_data, 'movies', Movie, 'movie')
+        values = {}
+        for field in ('name', 'gender', 'age'):
+            if actor_data.get(field, None):
+                values[field] = actor_data[field]
+        try:
+            async with transaction():
+                if values:
+                    await database.execute(Actor.__table__.update().where(
+                        Actor.__table__.c.id == actor_id).values(**values))
+                if movie_ids is not None:
+                    await set_links('movies', actor_id, movie_ids)
+            count_cache.invalidate('actors')
+            actor = await get_row_by_id(Actor, actor_id, None, 'movies')
+            return jsonify({"success": True, "actor": actor}), 200
+        except PostgresError as e:
+            return database_error(e)
+
+    '''
+        DELETE /actors/actor_id
+        returns status code 200 and json
+        {"success": True, "actor_id": actor_id}
+    '''
+    @app.route('/actors/<int:actor_id>', methods=['DELETE'])
+    @requires_auth('delete:actors')
+    async def delete_actor(token, actor_id):
+        await delete_row(Actor, actor_id)
+        return jsonify({'success': True, 'actor_id': actor_id}), 200
+
+    # Error Handling
+    '''
+        Errors in the same json format as app.py, for the aborts of the
+        shared helpers (werkzeug) and of Quart itself
+    '''
+    DEFAULT_MESSAGES = {
+        400: 'bad request',
+        404: 'resource not found',
+        422: 'bad request',
+    }
+
+    def error_response(status_code, description):
+        if status_code == 500:
+            message = 'internal server error'
+        else:
+            message = description if description else \
+                DEFAULT_MESSAGES.get(status_code, 'error')
+        return jsonify({
+            "success": False,
+            "error": status_code,
+            "message": message
+        }), status_code
+
+    @app.errorhandler(HTTPException)
+    async def http_error(error):
+        return error_response(error.code, error.description)
+
+    @app.errorhandler(QuartHTTPException)
+    async def quart_http_error(error):
+        return error_response(error.status_code, error.description)
+
+    @app.errorhandler(AuthError)
+    async def auth_error(error):
+        return jsonify(error.error), error.status_code
+
+    return app
+
+
+app = create_app()
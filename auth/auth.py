@@ -1,8 +1,16 @@
+import hashlib
 import json
 import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
 from flask import request, _request_ctx_stack
 from functools import wraps
-from jose import jwt
+from jose import jwk, jwt
+from metrics import metrics
+from timing import server_timing
 from urllib.request import urlopen
 from dotenv import load_dotenv
 load_dotenv()
@@ -11,6 +19,16 @@ load_dotenv()
 AUTH0_URL = os.getenv('AUTH0_URL')
 ALGORITHMS = ['RS256']
 API_AUDIENCE = os.getenv('AUTH0_API_AUDIENCE')
+# JWKS_URL can point at a stub server (or a file:// url) and JWKS_FILE at a
+# local key set, so tokens can be verified without reaching Auth0
+JWKS_URL = (os.getenv('AUTH0_JWKS_URL') or
+            f'https://{AUTH0_URL}/.well-known/jwks.json')
+JWKS_FILE = os.getenv('AUTH0_JWKS_FILE')
+JWKS_CACHE_TTL = int(os.getenv('JWKS_CACHE_TTL') or 600)
+JWKS_MIN_REFRESH_INTERVAL = int(os.getenv('JWKS_MIN_REFRESH_INTERVAL') or 30)
+JWKS_FETCH_TIMEOUT = float(os.getenv('JWKS_FETCH_TIMEOUT') or 5)
+# number of verified tokens kept in memory, 0 disables the cache
+TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE') or 1024)
 # AuthError Exception
 '''
 AuthError Exception
@@ -26,10 +44,12 @@ class AuthError(Exception):
 
 # Auth Header
 
-def get_token_auth_header():
-    """Obtains the Access Token from the Authorization Header
+def get_token_auth_header(headers=None):
+    """Obtains the Access Token from the Authorization Header of the
+    request, or of headers
     """
-    auth = request.headers.get('Authorization', None)
+    headers = request.headers if headers is None else headers
+    auth = headers.get('Authorization', None)
     if not auth:
         raise AuthError({
             'code': 'authorization_header_missing',
@@ -66,6 +86,231 @@ def get_token_auth_header():
     return token
 
 
+# JWKS Cache
+'''
+JWKSCache
+Keeps the signing keys published by the identity provider in memory so that
+verifying a token does not cost an outbound HTTPS round trip
+'''
+
+
+class JWKSCache:
+    def __init__(self, url=None, path=None, ttl=JWKS_CACHE_TTL,
+                 min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL,
+                 timeout=JWKS_FETCH_TIMEOUT, clock=time.monotonic):
+        self.url = url
+        self.path = path
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self.clock = clock
+        self.fetches = 0
+        # callables run with no arguments whenever the key set changes
+        self.on_rotate = []
+        self._jwks = None
+        self._keys = {}
+        self._expires_at = None
+        self._last_fetch = None
+        self._lock = threading.Lock()
+
+    def is_stale(self):
+        return self._expires_at is None or self.clock() >= self._expires_at
+
+    def ensure_fresh(self):
+        """Reloads the key set if its ttl has passed
+        """
+        if self.is_stale():
+            self.refresh()
+
+    def get_key(self, kid):
+        """Returns the public key for kid, ready to verify signatures with,
+        or None if the key set does not have it
+
+        The key set is reloaded once its ttl has passed. An unknown kid
+        triggers one extra reload, at most once per min_refresh_interval,
+        so tokens with forged kids cannot cause a fetch storm.
+        """
+        self.ensure_fresh()
+        key = self._keys.get(kid)
+        if key is None and self.refresh(unknown_kid=True):
+            key = self._keys.get(kid)
+        return key
+
+    def refresh(self, unknown_kid=False):
+        """Reloads the key set, returns True if a reload took place
+        """
+        with self._lock:
+            now = self.clock()
+            if unknown_kid:
+                if (self._last_fetch is not None and
+                        now - self._last_fetch < self.min_refresh_interval):
+                    return False
+            elif self._expires_at is not None and now < self._expires_at:
+                # another thread refreshed while we waited for the lock
+                return False
+            self._last_fetch = now
+            self.fetches += 1
+            start = time.perf_counter()
+            result = 'error'
+            try:
+                jwks, max_age = self._fetch()
+                if jwks != self._jwks:
+                    keys = construct_keys(jwks)
+                else:
+                    keys = self._keys
+                result = 'ok'
+            except Exception:
+                print(sys.exc_info())
+                if not self._keys:
+                    raise AuthError({
+                        'code': 'jwks_unavailable',
+                        'description': 'Unable to fetch the signing keys.'
+                    }, 503)
+                # keep serving the keys we have and retry shortly
+                self._expires_at = now + self.min_refresh_interval
+                return False
+            finally:
+                metrics.observe('jwks_fetch_duration_seconds',
+                                (('result', result),),
+                                time.perf_counter() - start)
+            rotated = self._jwks is not None and jwks != self._jwks
+            self._jwks = jwks
+            self._keys = keys
+            ttl = self.ttl if max_age is None else max_age
+            self._expires_at = now + max(ttl, self.min_refresh_interval)
+        if rotated:
+            for callback in self.on_rotate:
+                callback()
+        return True
+
+    def _fetch(self):
+        """Returns the key set and the max-age the server allows it to be
+        cached for (None if it did not say)
+        """
+        if self.path:
+            with open(self.path) as jwks_file:
+                return json.load(jwks_file), None
+        with urlopen(self.url, timeout=self.timeout) as jsonurl:
+            jwks = json.loads(jsonurl.read())
+            cache_control = jsonurl.headers.get('Cache-Control') or ''
+        return jwks, parse_max_age(cache_control)
+
+
+def construct_keys(jwks):
+    """Turns a key set into a kid -> public key map,
+    skipping keys that cannot verify RS256 signatures
+    """
+    keys = {}
+    for key in jwks['keys']:
+        if ('kid' not in key or key.get('kty') != 'RSA' or
+                key.get('use', 'sig') != 'sig'):
+            continue
+        try:
+            keys[key['kid']] = jwk.construct(key, ALGORITHMS[0])
+        except Exception:
+            print(sys.exc_info())
+    return keys
+
+
+def parse_max_age(cache_control):
+    """Reads max-age from a Cache-Control header value,
+    no-cache and no-store count as a max-age of 0
+    """
+    directives = cache_control.lower()
+    if 'no-store' in directives or 'no-cache' in directives:
+        return 0
+    match = re.search(r'max-age\s*=\s*"?(\d+)', directives)
+    if match:
+        return int(match.group(1))
+    return None
+
+
+jwks_cache = JWKSCache(url=JWKS_URL, path=JWKS_FILE)
+
+
+# Token Cache
+'''
+TokenCache
+A bounded LRU of verified token payloads keyed by a digest of the token,
+so a bearer token that is sent again skips the RS256 signature check
+'''
+
+
+class TokenCache:
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.decode_seconds = 0.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        """Returns the cached payload for token, or None if it has not been
+        verified yet or its exp claim has passed
+        """
+        digest = hashlib.sha256(token.encode()).digest()
+        payload = None
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                if self.clock() < entry[1]:
+                    self._entries.move_to_end(digest)
+                    payload = entry[0]
+                else:
+                    del self._entries[digest]
+            if payload is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        # stats() only sees this process, /metrics sums every worker
+        metrics.inc('auth_token_cache_hits_total' if payload is not None
+                    else 'auth_token_cache_misses_total')
+        return payload
+
+    def set(self, token, payload, decode_seconds=0.0):
+        """Stores a verified payload until its exp claim,
+        decode_seconds is the time the full verification took
+        """
+        with self._lock:
+            self.decode_seconds += decode_seconds
+            if self.maxsize <= 0 or not isinstance(payload.get('exp'),
+                                                   (int, float)):
+                return
+            digest = hashlib.sha256(token.encode()).digest()
+            self._entries[digest] = (payload, payload['exp'])
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns the hit/miss counters and the decode time they saved
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            avg_decode = (self.decode_seconds / self.misses
+                          if self.misses else 0.0)
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'avg_decode_seconds': avg_decode,
+                'saved_seconds': self.hits * avg_decode
+            }
+
+
+token_cache = TokenCache()
+# tokens verified against keys that were rotated out must be checked again
+jwks_cache.on_rotate.append(token_cache.clear)
+
+
 def check_permissions(permission, payload):
     if 'permissions' not in payload:
         raise AuthError({
@@ -82,30 +327,19 @@ def check_permissions(permission, payload):
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_URL}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
-    if rsa_key:
+    key = jwks_cache.get_key(unverified_header['kid'])
+    if key:
         try:
             payload = jwt.decode(
                 token,
-                rsa_key,
+                key,
                 algorithms=ALGORITHMS,
                 audience=API_AUDIENCE,
                 issuer='https://' + AUTH0_URL + '/'
@@ -149,9 +383,16 @@ def requires_auth(permission=''):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            with server_timing.phase('auth'):
+                token = get_token_auth_header()
+                jwks_cache.ensure_fresh()
+                payload = token_cache.get(token)
+                if payload is None:
+                    start = time.perf_counter()
+                    payload = verify_decode_jwt(token)
+                    token_cache.set(token, payload,
+                                    time.perf_counter() - start)
+                check_permissions(permission, payload)
             return f(payload, *args, **kwargs)
 
         return wrapper
@@ -0,0 +1,127 @@
+"""Throughput of app.py against the asyncio serving mode in asgi_app.py
+
+Starts each server on the DATABASE_URL database (a local Postgres) with the
+same number of worker processes, sends the same mix of GET requests from
+concurrent keep-alive clients for a fixed time and reports requests per
+second and latency percentiles. The response cache is turned off so every
+request reaches the database.
+
+    python -m benchmarks.bench_asgi [seconds] [concurrency] [workers]
+
+Needs requirements-async.txt and ASSISTANT_TOKEN, a token with read:movies
+and read:actors.
+"""
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+from dotenv import load_dotenv
+load_dotenv()
+
+PORT = 8765
+PATHS = [
+    '/movies?limit=20',
+    '/actors?limit=20&sort=age',
+    '/movies/400',
+    '/actors?limit=5&include=movies',
+]
+SERVERS = [
+    ('gunicorn sync', ['gunicorn'], 'app:create_app()',
+     {'GUNICORN_WORKER_CLASS': 'sync'}),
+    ('gunicorn gthread x8', ['gunicorn'], 'app:create_app()',
+     {'GUNICORN_WORKER_CLASS': 'gthread', 'GUNICORN_THREADS': '8'}),
+    ('hypercorn asyncio', ['hypercorn'], 'asgi_app:app', {}),
+]
+
+
+def start(command, app, workers, env=None):
+    env = dict(os.environ, RESPONSE_CACHE_BACKEND='none', **(env or {}))
+    process = subprocess.Popen(
+        [sys.executable, '-m'] + command + [
+            '--workers', str(workers), '--bind', '127.0.0.1:%d' % PORT, app],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', PORT)
+            connection.request('GET', '/')
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(command[0] + ' did not start')
+
+
+def client(headers, deadline, latencies, errors):
+    connection = http.client.HTTPConnection('127.0.0.1', PORT)
+    count = 0
+    while time.monotonic() < deadline:
+        path = PATHS[count % len(PATHS)]
+        count += 1
+        start = time.perf_counter()
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors.append(path)
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', PORT)
+            continue
+        if response.status != 200:
+            errors.append(path)
+        latencies.append(time.perf_counter() - start)
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def measure(name, process, seconds, concurrency):
+    '''
+    loads the server started as process and prints a row of results
+    '''
+    headers = {'Authorization': 'bearer ' + os.environ['ASSISTANT_TOKEN']}
+    try:
+        # one pass over the paths so every worker has connected
+        client(headers, time.monotonic() + 1, [], [])
+        latencies = []
+        errors = []
+        deadline = time.monotonic() + seconds
+        threads = [threading.Thread(
+            target=client, args=(headers, deadline, latencies, errors))
+            for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        process.terminate()
+        process.wait()
+    latencies.sort()
+    print('%-22s %10.0f %9.1f %9.1f %9.1f %7d' % (
+        name, len(latencies) / seconds,
+        percentile(latencies, 0.5) * 1000,
+        percentile(latencies, 0.9) * 1000,
+        percentile(latencies, 0.99) * 1000, len(errors)))
+
+
+def print_header(seconds, concurrency, workers):
+    print('%d clients, %d workers, %ds per server' %
+          (concurrency, workers, seconds))
+    print('%-22s %10s %9s %9s %9s %7s' %
+          ('server', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms', 'errors'))
+
+
+def run(seconds, concurrency, workers):
+    print_header(seconds, concurrency, workers)
+    for name, command, app, env in SERVERS:
+        measure(name, start(command, app, workers, env), seconds, concurrency)
+
+
+if __name__ == '__main__':
+    args = [int(x) for x in sys.argv[1:]]
+    run(*(args + [10, 32, 2][len(args):]))
@@ -0,0 +1,96 @@
+"""Per-token cost of verifying a bearer token
+
+Compares the old verify_decode_jwt (linear scan of the key set, a fresh
+rsa_key dict and a key import inside every jwt.decode) with the pre-built
+kid -> public key map and with a verified-token cache hit.
+
+    python -m benchmarks.bench_auth [iterations]
+"""
+import sys
+import time
+import timeit
+from unittest import mock
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+from auth import auth
+
+AUTH0_URL = 'casting.test'
+API_AUDIENCE = '/casting'
+
+
+def make_keys(count):
+    private_key = rsa.generate_private_key(
+        public_exponent=65537, key_size=2048,
+        backend=default_backend()).private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption())
+    public_jwk = jwk.construct(private_key, 'RS256').public_key().to_dict()
+    jwks = {'keys': [dict(public_jwk, kid='key-%d' % i, use='sig')
+                     for i in range(count)]}
+    return private_key, jwks
+
+
+def old_verify_decode_jwt(token, jwks):
+    unverified_header = jwt.get_unverified_header(token)
+    rsa_key = {}
+    for key in jwks['keys']:
+        if key['kid'] == unverified_header['kid']:
+            rsa_key = {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key['use'],
+                'n': key['n'],
+                'e': key['e']
+            }
+    return jwt.decode(token, rsa_key, algorithms=auth.ALGORITHMS,
+                      audience=API_AUDIENCE,
+                      issuer='https://' + AUTH0_URL + '/')
+
+
+class StaticJWKSCache(auth.JWKSCache):
+    def __init__(self, jwks):
+        super().__init__(url='http://stub/jwks.json')
+        self.jwks = jwks
+
+    def _fetch(self):
+        return self.jwks, None
+
+
+def per_token_us(statement, iterations):
+    best = min(timeit.repeat(statement, number=iterations, repeat=5))
+    return best / iterations * 1e6
+
+
+def main(iterations=2000):
+    private_key, jwks = make_keys(4)
+    token = jwt.encode({
+        'iss': 'https://' + AUTH0_URL + '/',
+        'aud': API_AUDIENCE,
+        'exp': int(time.time()) + 3600,
+        'permissions': ['read:movies']
+    }, private_key, algorithm='RS256', headers={'kid': 'key-3'})
+    cache = StaticJWKSCache(jwks)
+    token_cache = auth.TokenCache()
+
+    with mock.patch.object(auth, 'AUTH0_URL', AUTH0_URL), \
+            mock.patch.object(auth, 'API_AUDIENCE', API_AUDIENCE), \
+            mock.patch.object(auth, 'jwks_cache', cache):
+        token_cache.set(token, auth.verify_decode_jwt(token))
+        results = [
+            ('rebuild rsa_key dict per call',
+             per_token_us(lambda: old_verify_decode_jwt(token, jwks),
+                          iterations)),
+            ('pre-built kid -> key map',
+             per_token_us(lambda: auth.verify_decode_jwt(token), iterations)),
+            ('verified-token cache hit',
+             per_token_us(lambda: token_cache.get(token), iterations)),
+        ]
+    for name, us in results:
+        print('%-32s %10.1f us/token' % (name, us))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,66 @@
+"""Size and time-to-last-byte of a GET /movies body with its actors
+
+Builds the body of a page of movies the way the list route does, then
+compresses it with each coding compression.py can pick. Transfer times are
+estimated for a few link speeds as compression time + bytes / bandwidth.
+The rows are built in memory, no database needed.
+
+    python -m benchmarks.bench_compression [movies]
+"""
+import sys
+import timeit
+import zlib
+from flask import Flask
+from benchmarks.bench_serializers import make_movies
+from compression import BrotliEncoder, GzipEncoder
+from models import Movie
+from serializers import json_response, row_serializer
+
+LINKS = [('2 Mbit/s', 2e6 / 8), ('10 Mbit/s', 10e6 / 8),
+         ('100 Mbit/s', 100e6 / 8)]
+
+
+def encoders():
+    yield 'identity', None
+    for level in (1, 6, 9):
+        yield 'gzip level %d' % level, GzipEncoder(level)
+    try:
+        import brotli
+    except ImportError:
+        print('brotli is not installed')
+        return
+    for quality in (1, 4, 5):
+        yield 'br quality %d' % quality, BrotliEncoder(brotli, quality)
+
+
+def run(count):
+    app = Flask(__name__)
+    app.config.from_object('config')
+    movies = make_movies(count)
+    serialize = row_serializer(Movie, Movie.fields, 'actors')
+    with app.app_context():
+        body = json_response({'success': True, 'total_movies': count},
+                             raw={'movies': serialize(movies)}).get_data()
+
+    print('%d movies with 3 actors each, %.0f kB of JSON' %
+          (count, len(body) / 1e3))
+    print('%-16s %9s %7s %8s' % ('coding', 'kB', 'ratio', 'ms') +
+          ''.join(' %12s' % name for name, bandwidth in LINKS))
+    for name, encoder in encoders():
+        if encoder is None:
+            data, seconds = body, 0
+        else:
+            data = encoder.compress(body)
+            seconds = min(timeit.repeat(lambda: encoder.compress(body),
+                                        number=1, repeat=5))
+        if name.startswith('gzip'):
+            assert zlib.decompress(data, 16 + zlib.MAX_WBITS) == body
+        print('%-16s %9.1f %6.1fx %8.1f' % (
+            name, len(data) / 1e3, len(body) / len(data), seconds * 1000) +
+            ''.join(' %10.0fms' % ((seconds + len(data) / bandwidth) * 1000)
+                    for link, bandwidth in LINKS))
+
+
+if __name__ == '__main__':
+    args = [int(x) for x in sys.argv[1:]]
+    run(*(args + [10000][len(args):]))
@@ -0,0 +1,78 @@
+"""Cost of serializing a GET /movies body of 10k movies with their actors
+
+Compares jsonify over format() dicts, the old path of the routes, with
+json_response over compiled row serializers, using the stdlib encoder and
+orjson (when installed). The rows are built in memory, no database needed.
+
+    python -m benchmarks.bench_serializers [movies] [iterations]
+"""
+import sys
+import timeit
+from datetime import date, timedelta
+from flask import Flask, jsonify
+from models import Actor, Movie
+from serializers import json_backend, json_response, row_serializer
+
+
+def make_movies(count, actors_per_movie=3):
+    actors = [Actor(name='Actor %d' % i, age=20 + i % 50,
+                    gender='female' if i % 2 else 'male') for i in range(50)]
+    for index, actor in enumerate(actors):
+        actor.id = index + 1
+    movies = []
+    for i in range(count):
+        movie = Movie(title='Movie "%d"' % i,
+                      release_date=date(2000, 1, 1) + timedelta(days=i % 7300))
+        movie.id = i + 1
+        movie.actors = [actors[(i + j) % len(actors)]
+                        for j in range(actors_per_movie)]
+        movies.append(movie)
+    return movies
+
+
+def run(count, iterations):
+    app = Flask(__name__)
+    app.config.from_object('config')
+    movies = make_movies(count)
+
+    def old():
+        response = jsonify({
+            'success': True,
+            'movies': list(map(lambda x: x.format(), movies)),
+            'total_movies': len(movies)
+        })
+        return response.get_data()
+
+    def new():
+        serialize = row_serializer(Movie, Movie.fields, 'actors')
+        response = json_response(
+            {'success': True, 'total_movies': len(movies)},
+            raw={'movies': serialize(movies)})
+        return response.get_data()
+
+    def best(case):
+        return min(timeit.repeat(case, number=1, repeat=iterations))
+
+    print('%d movies with 3 actors each, best of %d' % (count, iterations))
+    with app.app_context():
+        size = len(old())
+        cases = [('jsonify + format()', best(old))]
+        for backend in ('json', 'orjson'):
+            app.config['JSON_BACKEND'] = backend
+            try:
+                json_backend.init_app(app)
+            except RuntimeError:
+                print(backend + ' is not installed')
+                continue
+            cases.append(('compiled serializers, ' + backend, best(new)))
+
+    base = cases[0][1]
+    for name, seconds in cases:
+        print('%-36s %8.1f ms %9.0f rows/s %7.1f MB/s %5.1fx' % (
+            name, seconds * 1000, count / seconds,
+            size / seconds / 1e6, base / seconds))
+
+
+if __name__ == '__main__':
+    args = [int(x) for x in sys.argv[1:]]
+    run(*(args + [10000, 5][len(args):]))
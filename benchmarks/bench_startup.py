@@ -0,0 +1,94 @@
+"""Worker cold start: time from a new worker to its first response
+
+Measures the two ways gunicorn can start a worker:
+    fresh       a new interpreter imports app.py, builds the app and serves
+                its first request (gunicorn without preload_app)
+    preloaded   the app is built and warmed up once, then each worker is
+                forked from that process and serves its first request
+                (gunicorn.conf.py)
+The first request is GET /movies?limit=20 when ASSISTANT_TOKEN is set, GET /
+otherwise, on the DATABASE_URL database.
+
+    python -m benchmarks.bench_startup [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+def first_request(client):
+    token = os.getenv('ASSISTANT_TOKEN')
+    if token:
+        response = client.get('/movies?limit=20', headers={
+            'Authorization': 'bearer ' + token})
+    else:
+        response = client.get('/')
+    assert response.status_code == 200, response.status_code
+
+
+def fresh():
+    '''
+    runs in a new interpreter, prints the timings of each step in seconds
+    '''
+    start = time.perf_counter()
+    from app import create_app
+    imported = time.perf_counter()
+    app = create_app()
+    client = app.test_client()
+    created = time.perf_counter()
+    first_request(client)
+    served = time.perf_counter()
+    print(json.dumps({'import': imported - start, 'create_app':
+                      created - imported, 'first request': served - created}))
+
+
+def preloaded(runs):
+    from app import create_app, warm_up
+    app = create_app()
+    warm_up(app)
+    client = app.test_client()
+    timings = []
+    for i in range(runs):
+        read, write = os.pipe()
+        forked = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read)
+            first_request(client)
+            os.write(write, str(time.perf_counter() - forked).encode())
+            os._exit(0)
+        os.close(write)
+        with os.fdopen(read) as result:
+            timings.append({'first request': float(result.read())})
+        os.waitpid(pid, 0)
+    return timings
+
+
+def run(runs):
+    timings = {'fresh': [], 'preloaded': preloaded(runs)}
+    for i in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_startup', '--fresh'],
+            check=True, stdout=subprocess.PIPE).stdout
+        timings['fresh'].append(json.loads(output.splitlines()[-1]))
+
+    steps = ['import', 'create_app', 'first request']
+    print('median of %d runs, ms' % runs)
+    print('%-12s' % 'worker' + ''.join('%15s' % x for x in steps) +
+          '%10s' % 'total')
+    for mode, results in timings.items():
+        medians = [statistics.median(x.get(step, 0) for x in results) * 1000
+                   for step in steps]
+        print('%-12s' % mode + ''.join('%15.1f' % x for x in medians) +
+              '%10.1f' % sum(medians))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--fresh']:
+        fresh()
+    else:
+        args = [int(x) for x in sys.argv[1:]]
+        run(*(args + [10][len(args):]))
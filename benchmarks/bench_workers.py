@@ -0,0 +1,106 @@
+"""Throughput of app.py under each worker model of gunicorn.conf.py
+
+Starts gunicorn with the shipped config and the same number of worker
+processes for each GUNICORN_WORKER_CLASS, then loads it the same way as
+bench_asgi: the same mix of GET requests from concurrent keep-alive clients
+for a fixed time, on the DATABASE_URL database with the response cache off.
+gevent is skipped unless requirements-gevent.txt is installed.
+
+With a local Postgres every query answers in well under a millisecond, so
+the run measures CPU more than waiting. latency_ms puts a proxy in front of
+the database that holds every reply for that long, like a database on
+another host, which is where the threaded and green workers pay off.
+
+    python -m benchmarks.bench_workers [seconds] [concurrency] [workers]
+        [latency_ms]
+
+Needs ASSISTANT_TOKEN, a token with read:movies and read:actors.
+"""
+import asyncio
+import importlib.util
+import multiprocessing
+import os
+import sys
+from urllib.parse import urlsplit, urlunsplit
+from benchmarks.bench_asgi import measure, print_header, start
+
+PROXY_PORT = 8766
+
+SERVERS = [
+    ('sync', {'GUNICORN_WORKER_CLASS': 'sync'}),
+    ('gthread x4', {'GUNICORN_WORKER_CLASS': 'gthread',
+                    'GUNICORN_THREADS': '4'}),
+    ('gthread x8', {'GUNICORN_WORKER_CLASS': 'gthread',
+                    'GUNICORN_THREADS': '8'}),
+    ('gevent x100', {'GUNICORN_WORKER_CLASS': 'gevent',
+                     'GUNICORN_WORKER_CONNECTIONS': '100'}),
+]
+
+
+def serve_proxy(host, port, delay):
+    """forwards PROXY_PORT to host:port, holding each reply for delay seconds
+    """
+    async def pipe(reader, writer, wait):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                if wait:
+                    await asyncio.sleep(delay)
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection(
+            host, port)
+        await asyncio.gather(pipe(client_reader, server_writer, False),
+                             pipe(server_reader, client_writer, True))
+
+    async def main():
+        server = await asyncio.start_server(handle, '127.0.0.1', PROXY_PORT)
+        await server.serve_forever()
+
+    asyncio.run(main())
+
+
+def proxied_url(url):
+    parts = urlsplit(url)
+    netloc = parts.netloc.rsplit('@', 1)
+    netloc[-1] = '127.0.0.1:%d' % PROXY_PORT
+    return urlunsplit(parts._replace(netloc='@'.join(netloc)))
+
+
+def run(seconds, concurrency, workers, latency_ms=0):
+    proxy = None
+    base_env = {}
+    if latency_ms:
+        url = urlsplit(os.environ['DATABASE_URL'])
+        proxy = multiprocessing.Process(
+            target=serve_proxy, daemon=True,
+            args=(url.hostname, url.port or 5432, latency_ms / 1000))
+        proxy.start()
+        base_env['DATABASE_URL'] = proxied_url(os.environ['DATABASE_URL'])
+        print('database replies delayed by %d ms' % latency_ms)
+    print_header(seconds, concurrency, workers)
+    try:
+        for name, env in SERVERS:
+            if (env['GUNICORN_WORKER_CLASS'] == 'gevent' and
+                    importlib.util.find_spec('psycogreen') is None):
+                print('%-22s requirements-gevent.txt is not installed' % name)
+                continue
+            process = start(['gunicorn'], 'app:create_app()', workers,
+                            dict(base_env, **env))
+            measure(name, process, seconds, concurrency)
+    finally:
+        if proxy is not None:
+            proxy.terminate()
+
+
+if __name__ == '__main__':
+    args = [int(x) for x in sys.argv[1:]]
+    run(*(args + [10, 32, 2, 0][len(args):]))
@@ -0,0 +1,138 @@
+from datetime import date
+from flask import abort, current_app, request
+from models import existing_ids
+
+'''
+Bulk create helpers
+    Every item of a bulk request is validated, and every linked id looked up,
+    before anything is written, so a bulk request creates all of its items
+    or none of them
+'''
+
+
+def get_bulk_items(name):
+    '''
+        returns the request body, a json list of items
+        aborts with 400 if it is missing, empty or longer than BULK_MAX_ITEMS
+    '''
+    return check_bulk_items(request.get_json(), name,
+                            current_app.config['BULK_MAX_ITEMS'])
+
+
+def check_bulk_items(items, name, max_items):
+    if not isinstance(items, list) or len(items) == 0:
+        abort(400, 'Bad request - a list of ' + name + ' is required')
+    if len(items) > max_items:
+        abort(400, 'Bad request - at most ' + str(max_items) + ' ' + name +
+              ' can be created in one request')
+    return items
+
+
+def get_linked_ids(item, key):
+    '''
+        returns the ids listed under key without duplicates,
+        None if they are not a list of integers
+    '''
+    ids = item.get(key, [])
+    if not isinstance(ids, list) or not all(
+            isinstance(x, int) and not isinstance(x, bool) for x in ids):
+        return None
+    return list(dict.fromkeys(ids))
+
+
+def check_string(item, key, max_length=120):
+    value = item.get(key, None)
+    if not value:
+        return key + ' is required'
+    if not isinstance(value, str) or len(value) > max_length:
+        return key + ' must be a string of at most ' + str(max_length) + \
+            ' characters'
+    return None
+
+
+def check_movie(item):
+    '''
+        returns the first problem with a movie item, None if it is valid
+    '''
+    message = check_string(item, 'title')
+    if message:
+        return message
+    release_date = item.get('release_date', None)
+    if not release_date:
+        return 'release_date is required'
+    try:
+        date.fromisoformat(release_date)
+    except (TypeError, ValueError):
+        return 'release_date must be a YYYY-MM-DD date'
+    if get_linked_ids(item, 'actors') is None:
+        return 'actors must be a list of actor ids'
+    return None
+
+
+def check_actor(item):
+    '''
+        returns the first problem with an actor item, None if it is valid
+    '''
+    message = check_string(item, 'name')
+    if message:
+        return message
+    age = item.get('age', None)
+    if not age:
+        return 'age is required'
+    if not isinstance(age, int) or isinstance(age, bool):
+        return 'age must be an integer'
+    message = check_string(item, 'gender')
+    if message:
+        return message
+    if get_linked_ids(item, 'movies') is None:
+        return 'movies must be a list of movie ids'
+    return None
+
+
+def check_items(items, check):
+    '''
+        returns a list of {"index": int, "message": str}, one for each item
+        that check finds a problem with
+    '''
+    errors = []
+    for index, item in enumerate(items):
+        message = check(item) if isinstance(item, dict) else \
+            'item must be an object'
+        if message:
+            errors.append({'index': index, 'message': message})
+    return errors
+
+
+def all_linked_ids(items, link_key):
+    return set(x for item in items for x in get_linked_ids(item, link_key))
+
+
+def check_links(items, link_key, found, link_name):
+    '''
+        returns an error for each item that links an id not in found
+    '''
+    errors = []
+    for index, item in enumerate(items):
+        missing = [str(x) for x in get_linked_ids(item, link_key)
+                   if x not in found]
+        if missing:
+            errors.append({
+                'index': index,
+                'message': 'Could not find ' + link_name + ' with id ' +
+                ', '.join(missing)
+            })
+    return errors
+
+
+def validate_items(items, check, link_key, link_model, link_name):
+    '''
+        returns a list of {"index": int, "message": str}, one for each item
+        that cannot be created, empty if every item is valid
+
+        the linked ids of every item are looked up with a single IN query
+    '''
+    errors = check_items(items, check)
+    if errors:
+        return errors
+    found = existing_ids(link_model, all_linked_ids(items, link_key))
+    return check_links(items, link_key, found, link_name)
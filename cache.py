@@ -0,0 +1,287 @@
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, g, request
+from replicas import replica_router
+from timing import server_timing
+
+'''
+Response cache for the read routes
+    Responses are keyed by route, query params and the caller's read
+    permissions. Each entry is stored with tags naming the rows it was
+    built from (for example movie:1, actor:3, or movies for anything that
+    depends on the set of movies), and write routes invalidate the tags of
+    the rows they change, so only the affected entries are dropped.
+
+    With read replicas, a client that has just written skips the cache,
+    and responses read from a replica are only stored once the replicas
+    have had REPLICA_STICKY_SECONDS to catch up with the last invalidation.
+'''
+
+
+class MemoryBackend:
+    '''
+    In-process LRU, bounded by the total size of the cached bodies
+    '''
+
+    def __init__(self, max_bytes, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._generation = 0
+        self._invalidated_at = None
+        self._lock = threading.Lock()
+
+    def generation(self):
+        return self._generation
+
+    def last_invalidation(self):
+        return self._invalidated_at
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, tags, expires_at = entry
+                if self.clock() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+        return None
+
+    def set(self, key, value, tags, ttl, generation):
+        with self._lock:
+            # a write invalidated something while the response was built
+            if generation != self._generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            if len(value['body']) > self.max_bytes:
+                return
+            self._entries[key] = (value, tags, self.clock() + ttl)
+            self.size += len(value['body'])
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, tags, now=None):
+        with self._lock:
+            self._generation += 1
+            if now is not None:
+                self._invalidated_at = now
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tags.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def _remove(self, key):
+        value, tags, expires_at = self._entries.pop(key)
+        self.size -= len(value['body'])
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class RedisBackend:
+    '''
+    Shared backend, so a write in one worker invalidates the entries of
+    every worker. Memory is bounded by the redis server, which should run
+    with maxmemory and an allkeys-lru policy.
+    '''
+
+    def __init__(self, url, prefix='casting:cache:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(
+                'RESPONSE_CACHE_BACKEND=redis needs the redis package')
+        self.redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self):
+        return self.redis.get(self.prefix + 'generation')
+
+    def last_invalidation(self):
+        value = self.redis.get(self.prefix + 'invalidated_at')
+        return float(value) if value is not None else None
+
+    def get(self, key):
+        value = self.redis.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value, tags, ttl, generation):
+        if self.generation() != generation:
+            return
+        pipe = self.redis.pipeline()
+        pipe.set(self.prefix + key, json.dumps(value), ex=ttl)
+        for tag in tags:
+            pipe.sadd(self.prefix + 'tag:' + tag, key)
+            pipe.expire(self.prefix + 'tag:' + tag, ttl)
+        pipe.execute()
+
+    def invalidate(self, tags, now=None):
+        pipe = self.redis.pipeline()
+        pipe.incr(self.prefix + 'generation')
+        if now is not None:
+            # shared, so every worker holds back its replica responses
+            pipe.set(self.prefix + 'invalidated_at', repr(now))
+        for tag in tags:
+            tag_key = self.prefix + 'tag:' + tag
+            keys = self.redis.smembers(tag_key)
+            if keys:
+                pipe.delete(*[self.prefix + key.decode() for key in keys])
+            pipe.delete(tag_key)
+        pipe.execute()
+
+    def clear(self):
+        keys = list(self.redis.scan_iter(self.prefix + '*'))
+        if keys:
+            self.redis.delete(*keys)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class ResponseCache:
+    def __init__(self):
+        self.backend = None
+        self.ttl = 0
+
+    def init_app(self, app):
+        '''
+        picks the backend from RESPONSE_CACHE_BACKEND
+        (memory, redis or none)
+        '''
+        backend = app.config['RESPONSE_CACHE_BACKEND']
+        self.ttl = app.config['RESPONSE_CACHE_TTL']
+        if backend == 'memory':
+            self.backend = MemoryBackend(app.config['RESPONSE_CACHE_MAX_BYTES'])
+        elif backend == 'redis':
+            self.backend = RedisBackend(app.config['RESPONSE_CACHE_REDIS_URL'])
+        else:
+            self.backend = None
+
+    def cached(self, f):
+        '''
+        decorator for GET routes, goes below requires_auth so that the
+        token payload is the first argument
+        '''
+        @wraps(f)
+        def wrapper(token, *args, **kwargs):
+            if self.backend is None:
+                return f(token, *args, **kwargs)
+            key = self.make_key(token)
+            # a client that has just written reads the primary, not a
+            # response cached before its write reached the replicas
+            value = None
+            if not replica_router.reads_own_writes():
+                try:
+                    with server_timing.phase('cache'):
+                        value = self.backend.get(key)
+                except Exception:
+                    print(sys.exc_info())
+                    return f(token, *args, **kwargs)
+            if value is not None:
+                return self.make_response(value)
+
+            with server_timing.phase('cache'):
+                generation = self.backend.generation()
+            g.cache_tags = set()
+            response = current_app.make_response(f(token, *args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                value = {
+                    'status': response.status_code,
+                    'body': response.get_data(as_text=True),
+                    'mimetype': response.mimetype,
+                    'etag': response.get_etag()[0]
+                }
+                try:
+                    with server_timing.phase('cache'):
+                        if not self.may_be_stale():
+                            self.backend.set(key, value, g.cache_tags,
+                                             self.ttl, generation)
+                except Exception:
+                    print(sys.exc_info())
+            return response
+
+        return wrapper
+
+    def may_be_stale(self):
+        '''
+        True when the response was read from a replica that may not have
+        caught up with the last invalidation yet
+        '''
+        return (g.get('database_replica') is not None and
+                replica_router.may_lag(self.backend.last_invalidation()))
+
+    def make_key(self, token):
+        scope = sorted(permission for permission in token.get('permissions', [])
+                       if permission.startswith('read:'))
+        return json.dumps([request.endpoint, request.view_args,
+                           sorted(request.args.items(multi=True)), scope],
+                          sort_keys=True)
+
+    def make_response(self, value):
+        if value['etag'] and request.if_none_match.contains_weak(value['etag']):
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.response_class(
+                value['body'], status=value['status'],
+                mimetype=value['mimetype'])
+        if value['etag']:
+            response.set_etag(value['etag'])
+        return response
+
+    def tag(self, *tags):
+        '''
+        records the rows the response being built depends on
+        '''
+        if 'cache_tags' in g:
+            g.cache_tags.update(tags)
+
+    def invalidate(self, *tags):
+        if self.backend is None or not tags:
+            return
+        try:
+            with server_timing.phase('cache'):
+                self.backend.invalidate(tags, replica_router.clock())
+        except Exception:
+            print(sys.exc_info())
+
+
+response_cache = ResponseCache()
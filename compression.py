@@ -0,0 +1,137 @@
+import zlib
+from flask import request
+from timing import server_timing
+
+'''
+Response compression
+    The after_request hook compresses JSON and text bodies with the best
+    coding the client lists in Accept-Encoding: br when the brotli package
+    is installed, otherwise gzip. Bodies under COMPRESS_MIN_SIZE bytes are
+    sent as they are, the coding costs more than it saves there. Streamed
+    responses are compressed one chunk at a time and flushed after each, so
+    they stay streamed and the client can decode every batch as it lands.
+
+    When the client accepts a coding the ETag is sent weak, since the bytes
+    of the body then depend on the coding and not only on the resource.
+'''
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/')
+
+
+class GzipEncoder:
+    name = 'gzip'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        compressor = self.compressor()
+        return compressor.compress(data) + compressor.flush()
+
+    def compressor(self):
+        # wbits 16 + MAX_WBITS writes a gzip header and trailer
+        return zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def stream(self, chunks):
+        compressor = self.compressor()
+        for chunk in chunks:
+            data = compressor.compress(chunk) + \
+                compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class BrotliEncoder:
+    name = 'br'
+
+    def __init__(self, brotli, quality):
+        self.brotli = brotli
+        self.quality = quality
+
+    def compress(self, data):
+        return self.brotli.compress(data, quality=self.quality)
+
+    def stream(self, chunks):
+        compressor = self.brotli.Compressor(quality=self.quality)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+class Compressor:
+    def __init__(self):
+        self.encoders = {}
+        self.min_size = 0
+
+    def init_app(self, app):
+        '''
+        reads COMPRESS_LEVEL (gzip, 0 turns compression off),
+        COMPRESS_BROTLI_QUALITY and COMPRESS_MIN_SIZE
+        '''
+        self.encoders = {}
+        self.min_size = app.config['COMPRESS_MIN_SIZE']
+        if app.config['COMPRESS_LEVEL'] <= 0:
+            return
+        self.encoders['gzip'] = GzipEncoder(app.config['COMPRESS_LEVEL'])
+        try:
+            import brotli
+        except ImportError:
+            return
+        self.encoders['br'] = BrotliEncoder(
+            brotli, app.config['COMPRESS_BROTLI_QUALITY'])
+
+    def negotiate(self):
+        '''
+        returns the encoder for the best coding the request accepts,
+        None if it accepts none of them
+        '''
+        if not self.encoders:
+            return None
+        # br is listed first so it wins a tie in quality
+        name = request.accept_encodings.best_match(
+            [x for x in ('br', 'gzip') if x in self.encoders])
+        return self.encoders.get(name)
+
+    def compress(self, response):
+        '''
+        after_request hook, returns response with its body compressed when
+        the request accepts a coding and the body is worth compressing
+        '''
+        encoder = self.negotiate()
+        if encoder is None:
+            return response
+        if response.status_code == 304:
+            response.vary.add('Accept-Encoding')
+            self.weaken_etag(response)
+            return response
+        if (response.status_code < 200 or response.status_code == 204 or
+                response.direct_passthrough or
+                'Content-Encoding' in response.headers or
+                not response.mimetype.startswith(COMPRESSIBLE_MIMETYPES)):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        self.weaken_etag(response)
+        if response.is_streamed:
+            response.response = encoder.stream(response.iter_encoded())
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            with server_timing.phase('compress'):
+                response.set_data(encoder.compress(data))
+        response.headers['Content-Encoding'] = encoder.name
+        return response
+
+    @staticmethod
+    def weaken_etag(response):
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+
+
+compressor = Compressor()
@@ -0,0 +1,44 @@
+import hashlib
+from functools import wraps
+from flask import current_app, make_response, request
+
+'''
+Conditional GET helpers
+    Routes decorated with @conditional(version) get a strong ETag derived
+    from version(**view_args) and the query string. A request whose
+    If-None-Match matches gets a 304 before the view runs, so the route
+    does not load rows, format them or build the body.
+'''
+
+
+def make_etag(version):
+    key = '%r|%s|%s' % (version, request.path,
+                        request.query_string.decode('latin-1'))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def conditional(version):
+    '''
+        @INPUTS
+            version: callable taking the view args, returns a value that
+            changes whenever the response changes, or None when the
+            resource does not exist
+    '''
+    def conditional_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            current_version = version(**kwargs)
+            if current_version is None:
+                return f(*args, **kwargs)
+            etag = make_etag(current_version)
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+
+        return wrapper
+    return conditional_decorator
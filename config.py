@@ -0,0 +1,59 @@
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+'''
+Application settings loaded into app.config by create_app,
+each one can be overridden from the environment
+'''
+
+# GET /movies and GET /actors pagination
+DEFAULT_PAGE_SIZE = int(os.getenv('DEFAULT_PAGE_SIZE') or 50)
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE') or 200)
+# rows fetched per query when a list route streams the full table
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE') or 500)
+# response cache for the read routes: memory (per worker), redis or none
+RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND') or 'memory'
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL') or 30)
+RESPONSE_CACHE_MAX_BYTES = int(
+    os.getenv('RESPONSE_CACHE_MAX_BYTES') or 64 * 1024 * 1024)
+RESPONSE_CACHE_REDIS_URL = os.getenv('RESPONSE_CACHE_REDIS_URL')
+# largest number of items POST /movies/bulk and POST /actors/bulk accept
+BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS') or 5000)
+# seconds an exact total_movies / total_actors count is reused for
+COUNT_CACHE_TTL = int(os.getenv('COUNT_CACHE_TTL') or 5)
+# database connection pool, see db_pool.py
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE') or 5)
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW') or 10)
+# seconds to wait for a free connection before failing the request
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT') or 10)
+# seconds after which a connection is replaced, -1 to keep them forever
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE') or 1800)
+DB_POOL_PRE_PING = (os.getenv('DB_POOL_PRE_PING') or 'true') == 'true'
+# milliseconds a statement may run before postgres cancels it, 0 for no limit
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT') or 30000)
+# set to true when connecting through PgBouncer in transaction pooling mode
+DB_PGBOUNCER = (os.getenv('DB_PGBOUNCER') or 'false') == 'true'
+# encoder for the response bodies: auto (orjson when installed), orjson or json
+JSON_BACKEND = os.getenv('JSON_BACKEND') or 'auto'
+# create missing tables when the app starts, for local development only:
+# the migrations (python manage.py db upgrade) manage the schema otherwise
+DB_CREATE_ALL = (os.getenv('DB_CREATE_ALL') or 'false') == 'true'
+# read replicas for GET requests, comma separated urls, see replicas.py
+DATABASE_REPLICA_URLS = os.getenv('DATABASE_REPLICA_URLS')
+# seconds a client reads from the primary after a write
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS') or 5)
+# send a Server-Timing header with the time spent per phase, see timing.py
+SERVER_TIMING = (os.getenv('SERVER_TIMING') or 'false') == 'true'
+# GET /metrics in the Prometheus text format, see metrics.py. Set METRICS_DIR
+# to a directory the gunicorn workers share so a scrape sums all of them
+METRICS = (os.getenv('METRICS') or 'false') == 'true'
+METRICS_DIR = os.getenv('METRICS_DIR')
+# seconds between the snapshots each worker writes to METRICS_DIR
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL') or 10)
+# response compression: gzip level 1-9 (0 turns compression off), brotli
+# quality 0-11 when the brotli package is installed, and the smallest body
+# in bytes that is compressed
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL') or 6)
+COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY') or 5)
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE') or 1024)
@@ -0,0 +1,126 @@
+import json
+import threading
+import time
+from flask import abort, request
+from models import db
+
+'''
+Totals for the list routes
+    total_movies and total_actors come from a COUNT(*) query, never from
+    loading rows. Exact counts are cached per table and filter for
+    COUNT_CACHE_TTL seconds, and write routes drop a table's counts when
+    they change it. ?count=estimated answers from the planner's row
+    estimate instead, which costs the same however large the table is.
+'''
+
+
+class CountCache:
+    def __init__(self, ttl=5, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config['COUNT_CACHE_TTL']
+        self.clear()
+
+    def get(self, table, key):
+        with self._lock:
+            entry = self._entries.get((table, key))
+            if entry is None:
+                return None
+            count, expires_at = entry
+            if self.clock() >= expires_at:
+                del self._entries[(table, key)]
+                return None
+            return count
+
+    def set(self, table, key, count):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[(table, key)] = (count, self.clock() + self.ttl)
+
+    def invalidate(self, *tables):
+        with self._lock:
+            for entry in [x for x in self._entries if x[0] in tables]:
+                del self._entries[entry]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+count_cache = CountCache()
+
+
+def get_count_mode(args=None):
+    '''
+        reads ?count= from the request, or from args, exact (the default)
+        or estimated
+    '''
+    args = request.args if args is None else args
+    mode = args.get('count', 'exact')
+    if mode not in ('exact', 'estimated'):
+        abort(400, 'Bad request - count must be exact or estimated')
+    return mode
+
+
+def count_statement(model, criteria=()):
+    return db.select([db.func.count(model.id)]).where(db.and_(*criteria))
+
+
+def count_key(statement, dialect):
+    '''
+        returns the count cache key of statement, its SQL and parameters
+    '''
+    compiled = statement.compile(dialect=dialect)
+    return str(compiled) + json.dumps(compiled.params, sort_keys=True,
+                                      default=str)
+
+
+def count_rows(model, criteria=(), mode='exact'):
+    '''
+        returns the number of rows of model matching criteria
+    '''
+    table = model.__tablename__
+    if mode == 'estimated':
+        estimate = estimate_rows(model, criteria)
+        if estimate is not None:
+            return estimate
+
+    statement = count_statement(model, criteria)
+    key = count_key(statement, db.engine.dialect)
+    count = count_cache.get(table, key)
+    if count is None:
+        count = db.session.execute(statement).scalar()
+        count_cache.set(table, key, count)
+    return count
+
+
+def estimate_rows(model, criteria=()):
+    '''
+        returns the planner's estimate of the number of rows matching
+        criteria, None if there is no usable estimate
+    '''
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    if not criteria:
+        # kept up to date by autovacuum and analyze, -1 (0 before
+        # postgres 14) until the table is first analyzed
+        estimate = db.session.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = to_regclass(:table)',
+            {'table': model.__tablename__}).scalar()
+    else:
+        statement = db.session.query(model.id).filter(
+            *criteria).statement.compile(dialect=db.engine.dialect)
+        plan = db.session.connection().execute(
+            'EXPLAIN (FORMAT JSON) ' + str(statement),
+            statement.params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = plan[0]['Plan']['Plan Rows']
+    if estimate is None or estimate <= 0:
+        return None
+    return int(estimate)
@@ -0,0 +1,134 @@
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+from metrics import metrics
+
+'''
+Database connection pool settings
+    setup_db builds the engine options from the DB_* settings in config.py.
+    Connections are checked with a ping before use and recycled after
+    DB_POOL_RECYCLE seconds, so a failover costs one reconnect instead of a
+    hung worker, and every statement runs with DB_STATEMENT_TIMEOUT.
+
+    With DB_PGBOUNCER on, the app can sit behind PgBouncer in transaction
+    pooling mode, where consecutive transactions of one client can run on
+    different server connections. Session state such as a connect time
+    statement_timeout would leak between clients there, so the timeout is
+    set with SET LOCAL at the start of every transaction instead.
+'''
+
+
+class TimedQueuePool(QueuePool):
+    '''
+    QueuePool that records how long checkouts take, including waiting for
+    a connection when the pool is saturated, and how many time out
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            metrics.inc('db_pool_timeouts_total')
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            metrics.observe('db_pool_checkout_wait_seconds', (), waited)
+
+    def stats(self):
+        checked_out = self.checkedout()
+        # a negative max_overflow means the pool can always open more
+        max_connections = None
+        saturation = None
+        if self._max_overflow >= 0:
+            max_connections = self.size() + self._max_overflow
+            saturation = checked_out / max_connections
+        with self._stats_lock:
+            return {
+                'size': self.size(),
+                'checked_out': checked_out,
+                'overflow': max(self.overflow(), 0),
+                'max_connections': max_connections,
+                'saturation': saturation,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds': self.wait_seconds,
+                'max_wait_seconds': self.max_wait_seconds
+            }
+
+
+def engine_options(config, database_url):
+    '''
+    returns the SQLALCHEMY_ENGINE_OPTIONS for the DB_* settings in config
+    '''
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING']
+    }
+    timeout = config['DB_STATEMENT_TIMEOUT']
+    is_postgres = (database_url or '').startswith('postgres')
+    if timeout and is_postgres and not config['DB_PGBOUNCER']:
+        options['connect_args'] = {
+            'options': '-c statement_timeout=%d' % timeout}
+    return options
+
+
+def database_options(config):
+    '''
+    returns the asyncpg pool options for the DB_* settings in config, used by
+    the asyncio serving mode in asgi_app.py
+    '''
+    options = {
+        'min_size': config['DB_POOL_SIZE'],
+        'max_size': config['DB_POOL_SIZE'] + max(config['DB_MAX_OVERFLOW'], 0),
+        'timeout': config['DB_POOL_TIMEOUT']
+    }
+    if config['DB_POOL_RECYCLE'] > 0:
+        options['max_inactive_connection_lifetime'] = config['DB_POOL_RECYCLE']
+    if config['DB_PGBOUNCER']:
+        # prepared statements live on one server connection, which PgBouncer
+        # does not keep for a client between transactions
+        options['statement_cache_size'] = 0
+    elif config['DB_STATEMENT_TIMEOUT']:
+        options['server_settings'] = {
+            'statement_timeout': str(config['DB_STATEMENT_TIMEOUT'])}
+    return options
+
+
+def set_local_statement_timeout(session, transaction, connection):
+    '''
+    session after_begin listener, limits the statements of the transaction
+    to DB_STATEMENT_TIMEOUT milliseconds when DB_PGBOUNCER is on
+    '''
+    config = session.app.config
+    if config['DB_PGBOUNCER'] and config['DB_STATEMENT_TIMEOUT']:
+        connection.execute(
+            'SET LOCAL statement_timeout = %d' % config['DB_STATEMENT_TIMEOUT'])
+
+
+def pool_stats(engine):
+    '''
+    returns the stats of the engine's pool, None if it does not keep any
+    '''
+    if isinstance(engine.pool, TimedQueuePool):
+        return engine.pool.stats()
+    return None
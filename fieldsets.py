@@ -0,0 +1,39 @@
+from flask import abort, request
+
+'''
+Sparse fieldset helpers
+    ?fields=id,title selects the columns a list or detail route returns and
+    ?include=actors opts in to embedding a relationship. Without either
+    param the routes return every column and embed the relationship, as
+    they always have.
+'''
+
+
+def get_fieldset(fields, relationships, args=None):
+    '''
+        reads ?fields= and ?include= from the request, or from args
+        returns (fields, include), the tuple of columns to return and the
+        set of relationships to embed
+        aborts with 400 on a field or relationship the model does not have
+    '''
+    args = request.args if args is None else args
+    requested_fields = args.get('fields', None)
+    requested_include = args.get('include', None)
+    if requested_fields is None and requested_include is None:
+        return tuple(fields), set(relationships)
+
+    selected = fields
+    if requested_fields:
+        selected = tuple(field.strip()
+                         for field in requested_fields.split(','))
+        unknown = [field for field in selected if field not in fields]
+        if unknown:
+            abort(400, 'Bad request - unknown fields: ' + ', '.join(unknown))
+
+    include = set()
+    if requested_include:
+        include = set(name.strip() for name in requested_include.split(','))
+        unknown = sorted(include - set(relationships))
+        if unknown:
+            abort(400, 'Bad request - cannot include: ' + ', '.join(unknown))
+    return selected, include
@@ -0,0 +1,125 @@
+from datetime import date
+from flask import abort, request
+from sqlalchemy import inspect
+
+'''
+Filter and sort helpers
+    The list routes take filters as query params, each applied in SQL on an
+    indexed column, and ?sort=column or ?sort=-column for descending order.
+    Sorting by a column other than id walks that column's index, so with
+    filters it is only allowed when the filters use the same index;
+    otherwise the database would have to read every row that matches the
+    filters to sort them.
+'''
+
+
+def parse_date(name, value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        abort(400, 'Bad request - ' + name + ' must be a YYYY-MM-DD date')
+
+
+def parse_int(name, value):
+    try:
+        return int(value)
+    except ValueError:
+        abort(400, 'Bad request - ' + name + ' must be an integer')
+
+
+def parse_string(name, value):
+    if not value:
+        abort(400, 'Bad request - ' + name + ' cannot be empty')
+    return value
+
+
+def starts_with(column, prefix):
+    # a LIKE pattern with a constant prefix can use a
+    # varchar_pattern_ops index
+    escaped = prefix.replace('\\', '\\\\').replace(
+        '%', '\\%').replace('_', '\\_')
+    return column.like(escaped + '%', escape='\\')
+
+
+OPERATORS = {
+    '>=': lambda column, value: column >= value,
+    '<=': lambda column, value: column <= value,
+    '==': lambda column, value: column == value,
+    'prefix': starts_with,
+}
+
+'''
+param: (column, operator, parser)
+'''
+MOVIE_FILTERS = {
+    'release_from': ('release_date', '>=', parse_date),
+    'release_to': ('release_date', '<=', parse_date),
+    'title_prefix': ('title', 'prefix', parse_string),
+}
+ACTOR_FILTERS = {
+    'min_age': ('age', '>=', parse_int),
+    'max_age': ('age', '<=', parse_int),
+    'gender': ('gender', '==', parse_string),
+    'name_prefix': ('name', 'prefix', parse_string),
+}
+
+'''
+sort column: the filters it can be combined with, None for any
+'''
+MOVIE_SORTS = {
+    'id': None,
+    'release_date': {'release_from', 'release_to'},
+    'title': {'title_prefix'},
+}
+ACTOR_SORTS = {
+    'id': None,
+    'age': {'min_age', 'max_age', 'gender'},
+    'name': {'name_prefix'},
+}
+
+
+def get_filters(model, filters, sorts, args=None):
+    '''
+        reads the filter params and ?sort= from the request, or from args
+        returns (criteria, sort, descending), the list of criteria to
+        filter the query by and the column to sort by, None for id
+        aborts with 400 on an invalid value, an unknown sort column or a
+        sort that cannot use the index of the filters
+    '''
+    args = request.args if args is None else args
+    criteria = []
+    given = []
+    for name, (column, operator, parse) in filters.items():
+        value = args.get(name, None)
+        if value is None:
+            continue
+        given.append(name)
+        criteria.append(OPERATORS[operator](
+            getattr(model, column), parse(name, value)))
+
+    requested_sort = args.get('sort', 'id')
+    descending = requested_sort.startswith('-')
+    sort_name = requested_sort[1:] if descending else requested_sort
+    if sort_name not in sorts:
+        abort(400, 'Bad request - cannot sort by ' + sort_name +
+              ', sort by one of: ' + ', '.join(sorts))
+    allowed = sorts[sort_name]
+    if allowed is not None:
+        unindexed = [name for name in given if name not in allowed]
+        if unindexed:
+            abort(400, 'Bad request - sort=' + sort_name +
+                  ' cannot be combined with ' + ', '.join(unindexed))
+    sort = None if sort_name == 'id' else getattr(model, sort_name)
+    return criteria, sort, descending
+
+
+def list_columns_changed(row, filters, sorts):
+    '''
+        returns True when a pending change to row is to a column the list
+        routes filter or sort by, so the row may have moved to other list
+        pages or changed the totals of filtered lists
+    '''
+    columns = {column for column, operator, parse in filters.values()}
+    columns.update(column for column in sorts if column != 'id')
+    attrs = inspect(row).attrs
+    return any(attrs[column].history.has_changes() for column in columns)
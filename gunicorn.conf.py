@@ -0,0 +1,101 @@
+import multiprocessing
+import os
+
+'''
+gunicorn settings, read from the working directory when gunicorn starts
+    Every setting can be changed from the environment. The app spends most
+    of a request waiting on Postgres or the JWKS endpoint, so the default
+    worker model is gthread: GUNICORN_THREADS requests per worker share its
+    memory and its connection pool. GUNICORN_WORKER_CLASS=gevent runs
+    GUNICORN_WORKER_CONNECTIONS requests per worker on greenlets instead,
+    it needs requirements-gevent.txt. Keep DB_POOL_SIZE + DB_MAX_OVERFLOW at
+    least as large as the requests a worker runs at once, or the extra ones
+    wait for a connection.
+
+    With GUNICORN_PRELOAD on, the app is built once in the master and the
+    workers are forked from it, so a worker starts serving without
+    importing the app or building it. when_ready runs before the first fork
+    and does the one-off work of a first request there, leaving no database
+    connection open to be shared by the workers.
+
+    Workers are replaced after GUNICORN_MAX_REQUESTS requests (plus up to
+    GUNICORN_MAX_REQUESTS_JITTER, so they do not all restart together),
+    which bounds the memory a slow leak can take.
+
+    With METRICS on, a worker resets the metrics it inherited and starts
+    its flush thread in post_fork. With METRICS_DIR set, the metrics left by
+    an earlier run are dropped on start, a worker writes its metrics when it
+    exits and the master folds them into the totals kept for exited workers.
+'''
+
+
+def env_int(name, default):
+    return int(os.getenv(name) or default)
+
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS') or 'gthread'
+if worker_class not in ('sync', 'gthread', 'gevent'):
+    raise RuntimeError('GUNICORN_WORKER_CLASS must be sync, gthread or gevent')
+
+if worker_class == 'gevent':
+    # patched before anything imports socket, ssl or threading, which
+    # preload_app would otherwise do in the master before the workers patch
+    try:
+        from gevent import monkey
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        raise RuntimeError(
+            'GUNICORN_WORKER_CLASS=gevent needs requirements-gevent.txt')
+    monkey.patch_all()
+    # psycopg2 waits on the database through gevent, instead of blocking
+    # every greenlet of the worker
+    patch_psycopg()
+
+# imported under another name, gunicorn reads a variable named config as
+# its own setting
+import config as app_config
+
+wsgi_app = 'app:create_app()'
+# WEB_CONCURRENCY is what Heroku sets for the dyno size
+workers = env_int('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1)
+threads = env_int('GUNICORN_THREADS', 8) if worker_class == 'gthread' else 1
+worker_connections = env_int('GUNICORN_WORKER_CONNECTIONS', 100)
+preload_app = (os.getenv('GUNICORN_PRELOAD') or 'true') == 'true'
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 5000)
+max_requests_jitter = env_int('GUNICORN_MAX_REQUESTS_JITTER', 500)
+# seconds a worker may go silent before it is killed, and seconds it gets
+# to finish its requests on restart or shutdown
+timeout = env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = env_int('GUNICORN_KEEPALIVE', 5)
+METRICS_DIR = app_config.METRICS_DIR if app_config.METRICS else None
+
+
+def on_starting(server):
+    if METRICS_DIR:
+        from metrics import clear_directory
+        clear_directory(METRICS_DIR)
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from app import warm_up
+        warm_up(server.app.wsgi())
+
+
+def post_fork(server, worker):
+    # before the worker serves, so its threads never race to reset
+    from metrics import metrics
+    metrics.after_fork()
+
+
+def worker_exit(server, worker):
+    if METRICS_DIR:
+        from metrics import metrics
+        metrics.flush()
+
+
+def child_exit(server, worker):
+    if METRICS_DIR:
+        from metrics import mark_process_dead
+        mark_process_dead(METRICS_DIR, worker.pid)
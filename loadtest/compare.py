@@ -0,0 +1,70 @@
+"""Compares two load test reports
+
+    python -m loadtest.compare BASE.json NEW.json
+
+prints requests per second and p50, p95 and p99 latency of the whole run
+and of each operation in both reports, with the change from BASE to NEW,
+and the settings that differ between the two runs.
+"""
+import json
+import sys
+
+COLUMNS = ('rps', 'p50_ms', 'p95_ms', 'p99_ms')
+
+
+def change(base, new):
+    if base is None or new is None:
+        return '-'
+    if not base:
+        return 'n/a'
+    return '%+.1f%%' % ((new - base) / base * 100)
+
+
+def rows(base, new):
+    names = ['total'] + [name for name in base['operations']] + [
+        name for name in new['operations'] if name not in base['operations']]
+    for name in names:
+        if name == 'total':
+            yield name, base['total'], new['total']
+        else:
+            yield (name, base['operations'].get(name, {}),
+                   new['operations'].get(name, {}))
+
+
+def compare(base, new):
+    lines = []
+    if base['rows'] != new['rows'] or base['mix'] != new['mix']:
+        lines.append('warning: the runs have different rows or mix')
+    lines.append('%-20s' % '' + ''.join(
+        '%-30s' % column.replace('_', ' ') for column in COLUMNS))
+    lines.append('%-20s' % 'operation' + ''.join(
+        '%10s %10s %8s  ' % ('base', 'new', 'change') for column in COLUMNS))
+    for name, base_row, new_row in rows(base, new):
+        line = '%-20s' % name
+        for column in COLUMNS:
+            line += '%10s %10s %8s  ' % (
+                base_row.get(column, '-'), new_row.get(column, '-'),
+                change(base_row.get(column), new_row.get(column)))
+        lines.append(line)
+    errors = (base['total']['errors'], new['total']['errors'])
+    lines.append('errors: %d -> %d' % errors)
+    for name in ('workers', 'concurrency', 'seed'):
+        if base[name] != new[name]:
+            lines.append('%s: %s -> %s' % (name, base[name], new[name]))
+    settings = sorted(set(base['settings']) | set(new['settings']))
+    for name in settings:
+        if base['settings'].get(name) != new['settings'].get(name):
+            lines.append('%s: %s -> %s' % (name, base['settings'].get(name),
+                                           new['settings'].get(name)))
+    return '\n'.join(line.rstrip() for line in lines)
+
+
+def load(path):
+    with open(path) as report:
+        return json.load(report)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit('usage: python -m loadtest.compare BASE.json NEW.json')
+    print(compare(load(sys.argv[1]), load(sys.argv[2])))
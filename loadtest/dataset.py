@@ -0,0 +1,67 @@
+"""The rows a load test runs against
+
+seed() empties the movies, actors and links tables of the load test
+database and fills them with the same rows for the same seed, so two runs
+only differ by the code and settings under test.
+"""
+import random
+from datetime import date, timedelta
+from sqlalchemy import create_engine
+from models import db, Movie, Actor, movie_actor_assoc
+
+GENDERS = ['female', 'male', 'non-binary']
+FIRST_RELEASE = date(1970, 1, 1)
+
+
+def seed(database_url, movies=1000, actors=500, links_per_movie=4, seed=1):
+    '''
+    creates the tables if needed and replaces their rows
+    '''
+    rng = random.Random('dataset-%s' % seed)
+    engine = create_engine(database_url)
+    try:
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(
+                'TRUNCATE movies, actors, movie_actor_assoc '
+                'RESTART IDENTITY CASCADE')
+            insert(connection, Actor.__table__, [{
+                'name': 'Actor %05d' % i,
+                'age': rng.randint(18, 80),
+                'gender': rng.choice(GENDERS)
+            } for i in range(actors)])
+            insert(connection, Movie.__table__, [{
+                'title': 'Movie %05d' % i,
+                'release_date': FIRST_RELEASE + timedelta(
+                    days=rng.randrange(50 * 365))
+            } for i in range(movies)])
+            # ids restart at 1, so row i has id i + 1
+            insert(connection, movie_actor_assoc, [{
+                'movie_id': movie_id, 'actor_id': actor_id
+            } for movie_id in range(1, movies + 1)
+                for actor_id in rng.sample(
+                    range(1, actors + 1),
+                    rng.randint(0, min(links_per_movie, actors)))])
+    finally:
+        engine.dispose()
+    return ids(database_url)
+
+
+def insert(connection, table, rows):
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+def ids(database_url):
+    '''
+    returns (movie ids, actor ids) of the rows in the database
+    '''
+    engine = create_engine(database_url)
+    try:
+        with engine.connect() as connection:
+            return ([row[0] for row in connection.execute(
+                     db.select([Movie.id]).order_by(Movie.id))],
+                    [row[0] for row in connection.execute(
+                     db.select([Actor.id]).order_by(Actor.id))])
+    finally:
+        engine.dispose()
@@ -0,0 +1,135 @@
+"""Local stand-in for the Auth0 tenant
+
+Generates an RS256 keypair, signs tokens carrying the permissions of each
+role and serves the matching key set over HTTP the way the tenant serves
+/.well-known/jwks.json, so the app verifies them through its usual
+JWKSCache path without reaching Auth0.
+
+    python -m loadtest.keys DIRECTORY
+
+writes private_key.pem, jwks.json and a tokens.env file there; sourcing
+tokens.env points the app and the tests at the local key set
+(AUTH0_JWKS_FILE) and sets ASSISTANT_TOKEN, DIRECTOR_TOKEN and
+PRODUCER_TOKEN.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+AUTH0_URL = 'casting.loadtest'
+API_AUDIENCE = '/casting'
+KID = 'loadtest'
+# the permissions of the roles set up in README.md
+ROLES = {
+    'assistant': ['read:actors', 'read:movies'],
+    'director': ['create:actors', 'delete:actors', 'read:actors',
+                 'read:movies', 'update:actors', 'update:movies'],
+    'producer': ['create:actors', 'create:movies', 'delete:actors',
+                 'delete:movies', 'read:actors', 'read:movies',
+                 'update:actors', 'update:movies'],
+}
+
+
+def make_keypair():
+    '''
+    returns (private key as PEM, key set with its public key)
+    '''
+    private_key = rsa.generate_private_key(
+        public_exponent=65537, key_size=2048,
+        backend=default_backend()).private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption())
+    public_jwk = jwk.construct(private_key, 'RS256').public_key().to_dict()
+    return private_key, {'keys': [dict(public_jwk, kid=KID, use='sig')]}
+
+
+def sign_token(private_key, role, ttl=86400):
+    '''
+    returns a token for role, valid for ttl seconds
+    '''
+    return jwt.encode({
+        'iss': 'https://' + AUTH0_URL + '/',
+        'aud': API_AUDIENCE,
+        'sub': 'loadtest|' + role,
+        'exp': int(time.time()) + ttl,
+        'permissions': ROLES[role]
+    }, private_key, algorithm='RS256', headers={'kid': KID})
+
+
+def auth_env(jwks_url=None, jwks_file=None):
+    '''
+    returns the environment that makes the app trust the local key set
+    '''
+    return {'AUTH0_URL': AUTH0_URL, 'AUTH0_API_AUDIENCE': API_AUDIENCE,
+            'AUTH0_JWKS_URL': jwks_url or '', 'AUTH0_JWKS_FILE': jwks_file or ''}
+
+
+class JWKSStub:
+    '''
+    Serves jwks at /.well-known/jwks.json on a free local port, from a
+    daemon thread. fetches counts the key set requests
+    '''
+
+    def __init__(self, jwks, max_age=600):
+        body = json.dumps(jwks).encode('utf-8')
+        stub = self
+        self.fetches = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/.well-known/jwks.json':
+                    self.send_error(404)
+                    return
+                stub.fetches += 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Cache-Control', 'max-age=%d' % max_age)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d/.well-known/jwks.json' % \
+            self.server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def write_files(directory):
+    os.makedirs(directory, exist_ok=True)
+    private_key, jwks = make_keypair()
+    with open(os.path.join(directory, 'private_key.pem'), 'wb') as key_file:
+        key_file.write(private_key)
+    jwks_file = os.path.abspath(os.path.join(directory, 'jwks.json'))
+    with open(jwks_file, 'w') as jwks_json:
+        json.dump(jwks, jwks_json)
+    env = auth_env(jwks_file=jwks_file)
+    for role in ROLES:
+        env[role.upper() + '_TOKEN'] = sign_token(private_key, role)
+    with open(os.path.join(directory, 'tokens.env'), 'w') as env_file:
+        for name, value in env.items():
+            env_file.write("export %s='%s'\n" % (name, value))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit('usage: python -m loadtest.keys DIRECTORY')
+    write_files(sys.argv[1])
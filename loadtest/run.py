@@ -0,0 +1,209 @@
+"""HTTP load test of the API
+
+Seeds LOADTEST_DATABASE_URL (a local Postgres, emptied on every run), signs
+a token per role with a fresh local keypair, serves the matching key set
+from a local stub, starts the app under gunicorn with gunicorn.conf.py and
+the GUNICORN_* settings of the environment, and sends the mix of requests
+from concurrent keep-alive clients for a fixed time.
+
+    python -m loadtest.run [--seconds 30] [--concurrency 16] [--workers 2]
+        [--mix read=90,write=10] [--seed 1] [--movies 1000] [--actors 500]
+        [--output report.json]
+
+The report is JSON: requests per second, p50, p95 and p99 latency in
+milliseconds and errors for the whole run and per operation, with the
+settings it ran with. Compare two reports with python -m loadtest.compare.
+The mix takes operation names from loadtest/workload.py, or read and write
+to scale all of them: --mix read=50,write=50,delete_movie=0.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from loadtest import dataset, keys, workload
+
+HOST = '127.0.0.1'
+# the settings a report records, to tell apart the runs it is compared with
+RECORDED_SETTINGS = ('WEB_CONCURRENCY', 'GUNICORN_', 'DB_', 'RESPONSE_CACHE_',
+                     'COUNT_CACHE_', 'COMPRESS_', 'JSON_BACKEND')
+
+
+def start_server(port, workers, env):
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers),
+         '--bind', '%s:%d' % (HOST, port)],
+        env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            connection = http.client.HTTPConnection(HOST, port)
+            connection.request('GET', '/')
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    process.wait()
+    log.seek(0)
+    sys.stderr.write(log.read().decode('utf-8', 'replace')[-4000:])
+    raise RuntimeError('gunicorn did not start')
+
+
+def percentile(values, fraction):
+    '''
+    nearest rank percentile of sorted values
+    '''
+    if not values:
+        return None
+    return values[max(math.ceil(len(values) * fraction) - 1, 0)]
+
+
+def summarize(latencies, errors, seconds):
+    latencies = sorted(latencies)
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / seconds, 2),
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1] if latencies else None),
+    }
+
+
+def report(clients, seconds):
+    '''
+    returns the totals and the per operation results of clients
+    '''
+    operations = {}
+    all_latencies = []
+    all_errors = 0
+    for name in workload.OPERATIONS:
+        latencies = [x for client in clients
+                     for x in client.latencies.get(name, [])]
+        errors = sum(client.errors.get(name, 0) for client in clients)
+        if latencies or errors:
+            operations[name] = summarize(latencies, errors, seconds)
+        all_latencies += latencies
+        all_errors += errors
+    return summarize(all_latencies, all_errors, seconds), operations
+
+
+def load(clients, seconds):
+    deadline = time.monotonic() + seconds
+    threads = [threading.Thread(target=client.run, args=(deadline,))
+               for client in clients]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - started
+
+
+def run(args):
+    database_url = os.getenv('LOADTEST_DATABASE_URL')
+    if not database_url:
+        raise RuntimeError('LOADTEST_DATABASE_URL must point at a database '
+                           'the load test can empty')
+    weights = workload.parse_mix(args.mix)
+    started_at = datetime.now(timezone.utc).isoformat()
+    if args.reuse_rows:
+        movie_ids, actor_ids = dataset.ids(database_url)
+    else:
+        movie_ids, actor_ids = dataset.seed(
+            database_url, args.movies, args.actors, seed=args.seed)
+    if not movie_ids or not actor_ids:
+        raise RuntimeError('the load test needs movies and actors')
+
+    private_key, jwks = keys.make_keypair()
+    tokens = {role: keys.sign_token(private_key, role) for role in keys.ROLES}
+    stub = keys.JWKSStub(jwks).start()
+    env = dict(os.environ, DATABASE_URL=database_url,
+               DATABASE_REPLICA_URLS='', **keys.auth_env(jwks_url=stub.url))
+    process = start_server(args.port, args.workers, env)
+    try:
+        def clients(seed):
+            return workload.make_clients(
+                args.concurrency, HOST, args.port, tokens, movie_ids,
+                actor_ids, weights, seed)
+        # reaches every worker and fills their pools before measuring
+        load(clients('warmup-%s' % args.seed), args.warmup)
+        measured = clients(args.seed)
+        seconds = load(measured, args.seconds)
+    finally:
+        process.terminate()
+        process.wait()
+        stub.stop()
+
+    total, operations = report(measured, seconds)
+    return {
+        'started_at': started_at,
+        'seconds': round(seconds, 3),
+        'concurrency': args.concurrency,
+        'workers': args.workers,
+        'seed': args.seed,
+        'rows': {'movies': len(movie_ids), 'actors': len(actor_ids)},
+        'mix': weights,
+        'settings': {name: value for name, value in sorted(os.environ.items())
+                     if name.startswith(RECORDED_SETTINGS)},
+        'total': total,
+        'operations': operations,
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m loadtest.run',
+        description='HTTP load test of the API on LOADTEST_DATABASE_URL')
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int,
+                        default=int(os.getenv('WEB_CONCURRENCY') or 2))
+    parser.add_argument('--mix', default='',
+                        help='name=weight,... (operation, read or write)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--movies', type=int, default=1000)
+    parser.add_argument('--actors', type=int, default=500)
+    parser.add_argument('--reuse-rows', action='store_true',
+                        help='keep the rows of the database instead of '
+                             'seeding it')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--output', help='file to write the report to, '
+                                         'stdout by default')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        result = run(args)
+    except (RuntimeError, ValueError) as e:
+        sys.exit(str(e))
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print(text)
+    total = result['total']
+    sys.stderr.write('%.0f req/s, p50 %s ms, p95 %s ms, p99 %s ms, '
+                     '%d errors\n' % (total['rps'], total['p50_ms'],
+                                      total['p95_ms'], total['p99_ms'],
+                                      total['errors']))
+
+
+if __name__ == '__main__':
+    main()
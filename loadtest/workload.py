@@ -0,0 +1,198 @@
+"""The requests a load test sends
+
+Every route of the API is an operation with a weight; a client picks its
+next operation at random in proportion to the weights, from a generator
+seeded with the run seed and the client number, so a run with the same
+seed sends the same sequence of requests from each client. Reads use the
+seeded rows. Writes create rows, then update and delete them, so deletes
+never hit a row a read expects: a delete with nothing created yet creates
+a row instead.
+"""
+import http.client
+import json
+import random
+import time
+
+# name: (kind, weight, role), the default mix is 90% reads
+OPERATIONS = {
+    'list_movies': ('read', 30, 'assistant'),
+    'get_movie': ('read', 25, 'assistant'),
+    'list_actors': ('read', 20, 'assistant'),
+    'get_actor': ('read', 15, 'assistant'),
+    'create_movie': ('write', 2, 'producer'),
+    'update_movie': ('write', 2, 'producer'),
+    'delete_movie': ('write', 1.5, 'producer'),
+    'bulk_create_movies': ('write', 0.5, 'producer'),
+    'create_actor': ('write', 1.5, 'director'),
+    'update_actor': ('write', 1.5, 'director'),
+    'delete_actor': ('write', 1, 'director'),
+}
+BULK_SIZE = 20
+
+
+def parse_mix(text):
+    '''
+    returns {operation: weight} from the defaults and text, a comma
+    separated list of name=weight where name is an operation, or read or
+    write to scale every operation of that kind to the weight given
+    '''
+    weights = {name: weight for name, (kind, weight, role)
+               in OPERATIONS.items()}
+    kinds = {}
+    for item in filter(None, (text or '').split(',')):
+        name, _, value = item.partition('=')
+        name = name.strip()
+        try:
+            value = float(value)
+        except ValueError:
+            raise ValueError('mix weights must be numbers: ' + item)
+        if value < 0:
+            raise ValueError('mix weights must not be negative: ' + item)
+        if name in ('read', 'write'):
+            kinds[name] = value
+        elif name in OPERATIONS:
+            weights[name] = value
+        else:
+            raise ValueError('unknown operation in mix: ' + name)
+    for kind, total in kinds.items():
+        names = [name for name in weights if OPERATIONS[name][0] == kind]
+        current = sum(weights[name] for name in names)
+        for name in names:
+            weights[name] = (weights[name] * total / current if current
+                             else total / len(names))
+    if not any(weights.values()):
+        raise ValueError('the mix has no operation left')
+    return weights
+
+
+class Client:
+    '''
+    One keep-alive connection sending operations until a deadline, with
+    the latencies and errors of each kept apart from the other clients
+    '''
+
+    def __init__(self, host, port, tokens, movie_ids, actor_ids, weights,
+                 rng):
+        self.host = host
+        self.port = port
+        self.tokens = tokens
+        self.movie_ids = movie_ids
+        self.actor_ids = actor_ids
+        self.names = list(weights)
+        self.weights = [weights[name] for name in self.names]
+        self.rng = rng
+        self.created = {'movies': [], 'actors': []}
+        self.latencies = {}
+        self.errors = {}
+        self.connection = http.client.HTTPConnection(host, port)
+
+    def run(self, deadline):
+        while time.monotonic() < deadline:
+            name = self.rng.choices(self.names, self.weights)[0]
+            getattr(self, name)()
+
+    def send(self, name, method, path, body=None):
+        '''
+        sends one request and records its latency under name, returns the
+        json body of a successful response or None
+        '''
+        role = OPERATIONS[name][2]
+        headers = {'Authorization': 'bearer ' + self.tokens[role]}
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        start = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.errors[name] = self.errors.get(name, 0) + 1
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(self.host, self.port)
+            return None
+        self.latencies.setdefault(name, []).append(
+            time.perf_counter() - start)
+        if response.status not in (200, 201):
+            self.errors[name] = self.errors.get(name, 0) + 1
+            return None
+        return json.loads(data)
+
+    def list_movies(self):
+        self.send('list_movies', 'GET', self.rng.choice([
+            '/movies?limit=20',
+            '/movies?limit=20&after=%d' % self.rng.choice(self.movie_ids),
+            '/movies?limit=20&release_from=%d-01-01' %
+            self.rng.randrange(1970, 2020),
+            '/movies?limit=50&fields=id,title&include=',
+        ]))
+
+    def get_movie(self):
+        self.send('get_movie', 'GET',
+                  '/movies/%d' % self.rng.choice(self.movie_ids))
+
+    def list_actors(self):
+        self.send('list_actors', 'GET', self.rng.choice([
+            '/actors?limit=20',
+            '/actors?limit=20&sort=age',
+            '/actors?limit=20&gender=female&min_age=30',
+            '/actors?limit=5&include=movies',
+        ]))
+
+    def get_actor(self):
+        self.send('get_actor', 'GET',
+                  '/actors/%d' % self.rng.choice(self.actor_ids))
+
+    def movie(self):
+        return {'title': 'Load test movie %d' % self.rng.randrange(10 ** 6),
+                'release_date': '2021-%02d-01' % self.rng.randint(1, 12),
+                'actors': self.rng.sample(self.actor_ids,
+                                          min(2, len(self.actor_ids)))}
+
+    def create_movie(self):
+        data = self.send('create_movie', 'POST', '/movies', self.movie())
+        if data:
+            self.created['movies'].append(data['movie']['id'])
+
+    def bulk_create_movies(self):
+        data = self.send('bulk_create_movies', 'POST', '/movies/bulk',
+                         [self.movie() for i in range(BULK_SIZE)])
+        if data:
+            self.created['movies'] += [x['id'] for x in data['movies']]
+
+    def update_movie(self):
+        self.send('update_movie', 'PATCH',
+                  '/movies/%d' % self.rng.choice(self.movie_ids),
+                  {'title': 'Updated movie %d' % self.rng.randrange(10 ** 6)})
+
+    def delete_movie(self):
+        if not self.created['movies']:
+            return self.create_movie()
+        self.send('delete_movie', 'DELETE',
+                  '/movies/%d' % self.created['movies'].pop())
+
+    def create_actor(self):
+        data = self.send('create_actor', 'POST', '/actors', {
+            'name': 'Load test actor %d' % self.rng.randrange(10 ** 6),
+            'age': self.rng.randint(18, 80),
+            'gender': self.rng.choice(['female', 'male', 'non-binary'])})
+        if data:
+            self.created['actors'].append(data['actor']['id'])
+
+    def update_actor(self):
+        self.send('update_actor', 'PATCH',
+                  '/actors/%d' % self.rng.choice(self.actor_ids),
+                  {'age': self.rng.randint(18, 80)})
+
+    def delete_actor(self):
+        if not self.created['actors']:
+            return self.create_actor()
+        self.send('delete_actor', 'DELETE',
+                  '/actors/%d' % self.created['actors'].pop())
+
+
+def make_clients(count, host, port, tokens, movie_ids, actor_ids, weights,
+                 seed):
+    return [Client(host, port, tokens, movie_ids, actor_ids, weights,
+                   random.Random('client-%s-%d' % (seed, i)))
+            for i in range(count)]
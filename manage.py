@@ -1,10 +1,18 @@
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 
-from app import app
+from app import create_app
 from models import db, Movie, Actor
-migrate = Migrate(app, db)
-manager = Manager(app)
+migrate = Migrate(db=db)
+
+
+def make_app():
+    app = create_app()
+    migrate.init_app(app)
+    return app
+
+
+manager = Manager(make_app)
 
 manager.add_command('db', MigrateCommand)
 
@@ -0,0 +1,384 @@
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+'''
+Metrics
+    With METRICS on, GET /metrics answers in the Prometheus text format:
+    request latency per route, method and status, SQL statement durations,
+    connection pool checkout waits and sizes, JWKS fetches and verified
+    token cache hits and misses.
+
+    The hot path only adds to plain lists and dicts: each thread writes to
+    its own shard, so no increment takes a lock or races another thread.
+    Under gevent, greenlets never switch in the middle of an increment, so
+    they all share one shard. A scrape sums the shards of the process.
+
+    gunicorn runs several worker processes and a scrape reaches only one
+    of them, so with METRICS_DIR set each worker writes a snapshot of its
+    metrics there every METRICS_FLUSH_INTERVAL seconds and when it exits,
+    and a scrape sums the snapshots of every worker. The master folds the
+    snapshot of a worker that exits into one file, so counters never go
+    back when workers are replaced (see gunicorn.conf.py).
+'''
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0)
+
+METRICS = {
+    'http_request_duration_seconds': (
+        'histogram', 'Time to the first byte of the response, by route'),
+    'db_query_duration_seconds': (
+        'histogram', 'Time spent running each SQL statement'),
+    'db_pool_checkout_wait_seconds': (
+        'histogram', 'Time spent waiting for a database connection'),
+    'db_pool_timeouts_total': (
+        'counter', 'Connection checkouts that timed out'),
+    'jwks_fetch_duration_seconds': (
+        'histogram', 'Time spent fetching the JWKS, by result'),
+    'auth_token_cache_hits_total': (
+        'counter', 'Bearer tokens found in the verified token cache'),
+    'auth_token_cache_misses_total': (
+        'counter', 'Bearer tokens that had to be verified'),
+    'db_pool_size': (
+        'gauge', 'Connections kept open by the pools'),
+    'db_pool_checked_out': (
+        'gauge', 'Connections in use'),
+    'db_pool_overflow': (
+        'gauge', 'Connections open above the pool size'),
+}
+
+# gauges describe the processes alive now, they are not kept for the dead
+GAUGES = [name for name, (kind, text) in METRICS.items() if kind == 'gauge']
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self.flush_interval = 10
+        self.pools = None
+        self._app = None
+        self._local = threading.local()
+        self._shards = []
+        self._shared = None
+        self._pid = None
+        self._fork_lock = threading.Lock()
+
+    def init_app(self, app, pools=None):
+        '''
+        reads METRICS, METRICS_DIR and METRICS_FLUSH_INTERVAL, pools is a
+        function returning {label: engine} for the pool gauges
+        '''
+        self.enabled = app.config['METRICS']
+        self.directory = app.config['METRICS_DIR'] if self.enabled else None
+        self.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+        self.pools = pools
+        self._app = app
+        self._pid = None
+        self.reset()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        for name, listener in LISTENERS:
+            registered = event.contains(Engine, name, listener)
+            if self.enabled and not registered:
+                event.listen(Engine, name, listener)
+            elif not self.enabled and registered:
+                event.remove(Engine, name, listener)
+
+    def reset(self):
+        self._local = threading.local()
+        self._shards = []
+        self._shared = {} if green_threads() else None
+
+    def shard(self):
+        if self._shared is not None:
+            return self._shared
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            # list.append is atomic, the shard stays readable after the
+            # thread ends so its counts are not lost
+            self._shards.append(shard)
+            return shard
+
+    def inc(self, name, labels=(), value=1):
+        if not self.enabled:
+            return
+        shard = self.shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + value
+
+    def observe(self, name, labels, seconds):
+        '''
+        adds seconds to the histogram name: one count per bucket, then the
+        +Inf count and the sum
+        '''
+        if not self.enabled:
+            return
+        shard = self.shard()
+        key = (name, labels)
+        histogram = shard.get(key)
+        if histogram is None:
+            histogram = shard[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        histogram[bisect_left(BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+
+    def start(self):
+        '''
+        before_request hook
+        '''
+        if not self.enabled:
+            return
+        if self._pid != os.getpid():
+            self.after_fork()
+        g.metrics_start = time.perf_counter()
+
+    def after_fork(self):
+        '''
+        post_fork hook, and run by the first request of a process the hook
+        did not reach. A gunicorn worker starts from zero rather than from
+        what the master counted while warming up, and needs its own flush
+        thread since threads do not survive the fork
+        '''
+        if not self.enabled:
+            return
+        with self._fork_lock:
+            # the threads of a worker all see the new pid at first, only
+            # the first one to get here resets
+            if self._pid == os.getpid():
+                return
+            self.reset()
+            if self.directory:
+                threading.Thread(target=self._flush_forever,
+                                 daemon=True).start()
+            # set last, a thread that skips the lock sees the reset shards
+            self._pid = os.getpid()
+
+    def finish(self, response):
+        '''
+        after_request hook
+        '''
+        started = g.get('metrics_start') if self.enabled else None
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'none'
+            self.observe('http_request_duration_seconds', (
+                ('route', route), ('method', request.method),
+                ('status', str(response.status_code))),
+                time.perf_counter() - started)
+        return response
+
+    def snapshot(self):
+        '''
+        returns the metrics of this process, as a JSON friendly list of
+        [name, labels, value] where value is a number or a histogram
+        '''
+        totals = {}
+        shards = [self._shared] if self._shared is not None else \
+            list(self._shards)
+        for shard in shards:
+            # list() copies the items without letting another thread run
+            for key, value in list(shard.items()):
+                merge(totals, key, value)
+        for name, labels, value in self.gauges():
+            totals[(name, labels)] = value
+        return [[name, labels, value]
+                for (name, labels), value in totals.items()]
+
+    def gauges(self):
+        from db_pool import pool_stats
+        if self.pools is None:
+            return []
+        try:
+            with self._app.app_context():
+                pools = self.pools()
+        except Exception:
+            print(sys.exc_info())
+            return []
+        gauges = []
+        for label, engine in pools.items():
+            stats = pool_stats(engine)
+            if stats is None:
+                continue
+            labels = (('pool', label),)
+            gauges += [('db_pool_size', labels, stats['size']),
+                       ('db_pool_checked_out', labels, stats['checked_out']),
+                       ('db_pool_overflow', labels, stats['overflow'])]
+        return gauges
+
+    def flush(self):
+        '''
+        writes the snapshot of this process to METRICS_DIR
+        '''
+        if self.directory:
+            write_snapshot(snapshot_path(self.directory, os.getpid()),
+                           self.snapshot())
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                print(sys.exc_info())
+
+    def collect(self):
+        '''
+        returns the snapshot of every worker summed, read from METRICS_DIR
+        when it is set, of this process otherwise
+        '''
+        if not self.directory:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush()
+            snapshots = []
+            for name in os.listdir(self.directory):
+                if name.endswith('.json'):
+                    snapshots.append(read_snapshot(
+                        os.path.join(self.directory, name)))
+        totals = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot:
+                merge(totals, (name, tuple(map(tuple, labels))), value)
+        return totals
+
+    def response(self):
+        return current_app.response_class(
+            exposition(self.collect()),
+            mimetype='text/plain', content_type='text/plain; version=0.0.4')
+
+
+def snapshot_path(directory, pid):
+    return os.path.join(directory, 'worker-%d.json' % pid)
+
+
+def mark_process_dead(directory, pid):
+    '''
+    folds the snapshot of an exited worker into dead.json, run by the
+    gunicorn master
+    '''
+    path = snapshot_path(directory, pid)
+    if not os.path.exists(path):
+        return
+    dead_path = os.path.join(directory, 'dead.json')
+    totals = {}
+    for source in (dead_path, path):
+        if os.path.exists(source):
+            for name, labels, value in read_snapshot(source):
+                if name not in GAUGES:
+                    merge(totals, (name, tuple(map(tuple, labels))), value)
+    write_snapshot(dead_path, [[name, labels, value] for
+                               (name, labels), value in totals.items()])
+    os.remove(path)
+
+
+def clear_directory(directory):
+    '''
+    drops the snapshots left in directory by an earlier run
+    '''
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                os.remove(os.path.join(directory, name))
+
+
+def green_threads():
+    if 'gevent' not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched('threading')
+
+
+def merge(totals, key, value):
+    current = totals.get(key)
+    if current is None:
+        totals[key] = list(value) if isinstance(value, list) else value
+    elif isinstance(value, list):
+        totals[key] = [x + y for x, y in zip(current, value)]
+    else:
+        totals[key] = current + value
+
+
+def write_snapshot(path, snapshot):
+    # written aside and renamed, so a scrape never reads half a file
+    temporary = '%s.%d.tmp' % (path, threading.get_ident())
+    with open(temporary, 'w') as snapshot_file:
+        json.dump(snapshot, snapshot_file)
+    os.replace(temporary, path)
+
+
+def read_snapshot(path):
+    try:
+        with open(path) as snapshot_file:
+            return json.load(snapshot_file)
+    except (OSError, ValueError):
+        # the worker was folded into dead.json while we listed the files
+        return []
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (key, str(value).replace(
+        '\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels) + '}'
+
+
+def exposition(totals):
+    '''
+    returns totals in the Prometheus text format
+    '''
+    lines = []
+    for name, (kind, text) in METRICS.items():
+        series = sorted((labels, value) for (metric, labels), value
+                        in totals.items() if metric == name)
+        if not series:
+            continue
+        lines.append('# HELP %s %s' % (name, text))
+        lines.append('# TYPE %s %s' % (name, kind))
+        for labels, value in series:
+            if kind != 'histogram':
+                lines.append('%s%s %s' % (name, format_labels(labels), value))
+                continue
+            count = 0
+            for bound, bucket in zip(BUCKETS + ('+Inf',), value):
+                count += bucket
+                lines.append('%s_bucket%s %d' % (name, format_labels(
+                    labels + (('le', str(bound)),)), count))
+            lines.append('%s_sum%s %r' % (name, format_labels(labels),
+                                          value[-1]))
+            lines.append('%s_count%s %d' % (name, format_labels(labels),
+                                            count))
+    return '\n'.join(lines) + '\n'
+
+
+def before_cursor_execute(conn, cursor, statement, *args):
+    conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, *args):
+    starts = conn.info.get('metrics_start')
+    if starts:
+        metrics.observe('db_query_duration_seconds', (),
+                        time.perf_counter() - starts.pop())
+
+
+def handle_error(context):
+    # after_cursor_execute does not run for a failed statement
+    if context.connection is not None:
+        after_cursor_execute(context.connection, None, None)
+
+
+LISTENERS = [('before_cursor_execute', before_cursor_execute),
+             ('after_cursor_execute', after_cursor_execute),
+             ('handle_error', handle_error)]
+
+
+metrics = Metrics()
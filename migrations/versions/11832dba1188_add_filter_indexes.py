@@ -0,0 +1,52 @@
+"""add filter indexes
+
+Revision ID: 11832dba1188
+Revises: dcc0f383f4aa
+Create Date: 2026-10-18 11:02:17.880143
+
+Indexes for the filters of GET /movies and GET /actors, built
+concurrently like the ones in dcc0f383f4aa so the tables stay writable.
+The prefix filters are LIKE 'prefix%' matches, which can only use an
+index built with the varchar_pattern_ops operator class.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '11832dba1188'
+down_revision = 'dcc0f383f4aa'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_movies_title_pattern', 'movies', 'title varchar_pattern_ops'),
+    ('ix_actors_name_pattern', 'actors', 'name varchar_pattern_ops'),
+    ('ix_actors_age', 'actors', 'age'),
+    ('ix_actors_gender_age', 'actors', 'gender, age'),
+]
+
+
+def drop_invalid_index(name):
+    # a failed or interrupted concurrent build leaves an invalid index
+    # behind, which IF NOT EXISTS would otherwise treat as done
+    invalid = op.get_bind().execute(sa.text(
+        'SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+        'WHERE c.relname = :name AND NOT i.indisvalid'), name=name).first()
+    if invalid:
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ' + name)
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            drop_invalid_index(name)
+            op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS ' + name +
+                       ' ON ' + table + ' (' + columns + ')')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.execute('DROP INDEX CONCURRENTLY IF EXISTS ' + name)
@@ -0,0 +1,76 @@
+"""add catalog version indexes
+
+Revision ID: 5e0d7b3c9a21
+Revises: 11832dba1188
+Create Date: 2026-10-18 16:40:52.311507
+
+catalog_version() used to count every movie, actor and link to notice
+deletes. It now reads max(updated_at) through the indexes below, built
+concurrently like the ones in 11832dba1188, and the deletes counter of
+catalog_deletes, which statement level triggers bump on every DELETE or
+TRUNCATE of the three tables.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e0d7b3c9a21'
+down_revision = '11832dba1188'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_movies_updated_at', 'movies', 'updated_at'),
+    ('ix_actors_updated_at', 'actors', 'updated_at'),
+]
+TABLES = ['movies', 'actors', 'movie_actor_assoc']
+
+
+def drop_invalid_index(name):
+    # a failed or interrupted concurrent build leaves an invalid index
+    # behind, which IF NOT EXISTS would otherwise treat as done
+    invalid = op.get_bind().execute(sa.text(
+        'SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+        'WHERE c.relname = :name AND NOT i.indisvalid'), name=name).first()
+    if invalid:
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ' + name)
+
+
+def upgrade():
+    op.create_table(
+        'catalog_deletes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('deletes', sa.BigInteger(), server_default='0',
+                  nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('INSERT INTO catalog_deletes (id, deletes) VALUES (1, 0)')
+    op.execute('''
+        CREATE OR REPLACE FUNCTION count_catalog_deletes() RETURNS trigger AS $$
+        BEGIN
+            UPDATE catalog_deletes SET deletes = deletes + 1 WHERE id = 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql''')
+    for table in TABLES:
+        op.execute('CREATE TRIGGER ' + table + '_count_deletes '
+                   'AFTER DELETE OR TRUNCATE ON ' + table + ' FOR EACH '
+                   'STATEMENT EXECUTE PROCEDURE count_catalog_deletes()')
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            drop_invalid_index(name)
+            op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS ' + name +
+                       ' ON ' + table + ' (' + columns + ')')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.execute('DROP INDEX CONCURRENTLY IF EXISTS ' + name)
+    for table in TABLES:
+        op.execute('DROP TRIGGER IF EXISTS ' + table + '_count_deletes ON ' +
+                   table)
+    op.execute('DROP FUNCTION IF EXISTS count_catalog_deletes()')
+    op.drop_table('catalog_deletes')
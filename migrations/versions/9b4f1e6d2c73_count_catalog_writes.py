@@ -0,0 +1,62 @@
+"""count catalog writes
+
+Revision ID: 9b4f1e6d2c73
+Revises: 5e0d7b3c9a21
+Create Date: 2026-10-18 21:05:33.604218
+
+catalog_deletes becomes catalog_writes, bumped by every INSERT, UPDATE,
+DELETE or TRUNCATE of movies, actors and movie_actor_assoc. max(updated_at)
+missed rows written by a transaction that started before another one
+committed, since now() is the start time of the transaction.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4f1e6d2c73'
+down_revision = '5e0d7b3c9a21'
+branch_labels = None
+depends_on = None
+
+TABLES = ['movies', 'actors', 'movie_actor_assoc']
+
+
+def create_counter(name, column, events):
+    op.execute('''
+        CREATE OR REPLACE FUNCTION count_catalog_%s() RETURNS trigger AS $$
+        BEGIN
+            UPDATE catalog_%s SET %s = %s + 1 WHERE id = 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql''' % (name, name, column, column))
+    for table in TABLES:
+        op.execute('CREATE TRIGGER %s_count_%s AFTER %s ON %s FOR EACH '
+                   'STATEMENT EXECUTE PROCEDURE count_catalog_%s()' % (
+                       table, name, events, table, name))
+
+
+def drop_counter(name):
+    for table in TABLES:
+        op.execute('DROP TRIGGER IF EXISTS %s_count_%s ON %s' % (
+            table, name, table))
+    op.execute('DROP FUNCTION IF EXISTS count_catalog_%s()' % name)
+
+
+def upgrade():
+    drop_counter('deletes')
+    op.rename_table('catalog_deletes', 'catalog_writes')
+    op.alter_column('catalog_writes', 'deletes', new_column_name='writes')
+    op.execute('ALTER INDEX catalog_deletes_pkey '
+               'RENAME TO catalog_writes_pkey')
+    create_counter('writes', 'writes',
+                   'INSERT OR UPDATE OR DELETE OR TRUNCATE')
+
+
+def downgrade():
+    drop_counter('writes')
+    op.execute('ALTER INDEX catalog_writes_pkey '
+               'RENAME TO catalog_deletes_pkey')
+    op.alter_column('catalog_writes', 'writes', new_column_name='deletes')
+    op.rename_table('catalog_writes', 'catalog_deletes')
+    create_counter('deletes', 'deletes', 'DELETE OR TRUNCATE')
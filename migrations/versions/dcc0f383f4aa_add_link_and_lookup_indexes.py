@@ -0,0 +1,92 @@
+"""add link and lookup indexes
+
+Revision ID: dcc0f383f4aa
+Revises: fd4b80cc06a6
+Create Date: 2026-10-18 10:12:41.503214
+
+Indexes are built with CREATE INDEX CONCURRENTLY outside the migration
+transaction, so reads and writes to the tables carry on while they build.
+The only exclusive lock is the short one taken to attach the unique index
+as a constraint, and it gives up after lock_timeout instead of queueing
+behind long running transactions.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'dcc0f383f4aa'
+down_revision = 'fd4b80cc06a6'
+branch_labels = None
+depends_on = None
+
+UNIQUE_LINK = 'movie_actor_assoc_movie_id_actor_id_key'
+
+INDEXES = [
+    # (movie_id, actor_id) is covered by the unique index
+    ('ix_movie_actor_assoc_actor_id_movie_id', 'movie_actor_assoc',
+     'actor_id, movie_id'),
+    ('ix_movies_release_date', 'movies', 'release_date'),
+    ('ix_actors_name', 'actors', 'name'),
+]
+
+# links can be added while the unique index builds, so deduplicating and
+# building are retried a few times before giving up
+UNIQUE_ATTEMPTS = 3
+
+
+def delete_duplicate_links():
+    # keeps the oldest row of each (movie_id, actor_id) pair
+    op.execute(
+        'DELETE FROM movie_actor_assoc a USING movie_actor_assoc b '
+        'WHERE a.movie_id = b.movie_id AND a.actor_id = b.actor_id '
+        'AND a.id > b.id')
+
+
+def drop_invalid_index(name):
+    # a failed or interrupted concurrent build leaves an invalid index
+    # behind, which IF NOT EXISTS would otherwise treat as done
+    invalid = op.get_bind().execute(sa.text(
+        'SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+        'WHERE c.relname = :name AND NOT i.indisvalid'), name=name).first()
+    if invalid:
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ' + name)
+
+
+def create_index_concurrently(name, table, columns, unique=False):
+    drop_invalid_index(name)
+    op.execute('CREATE ' + ('UNIQUE ' if unique else '') +
+               'INDEX CONCURRENTLY IF NOT EXISTS ' + name +
+               ' ON ' + table + ' (' + columns + ')')
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for attempt in range(UNIQUE_ATTEMPTS):
+            delete_duplicate_links()
+            try:
+                create_index_concurrently(
+                    UNIQUE_LINK, 'movie_actor_assoc', 'movie_id, actor_id',
+                    unique=True)
+                break
+            except sa.exc.IntegrityError:
+                if attempt == UNIQUE_ATTEMPTS - 1:
+                    drop_invalid_index(UNIQUE_LINK)
+                    raise
+        for name, table, columns in INDEXES:
+            create_index_concurrently(name, table, columns)
+
+    op.execute("SET LOCAL lock_timeout = '5s'")
+    op.execute('ALTER TABLE movie_actor_assoc ADD CONSTRAINT ' + UNIQUE_LINK +
+               ' UNIQUE USING INDEX ' + UNIQUE_LINK)
+
+
+def downgrade():
+    op.execute("SET LOCAL lock_timeout = '5s'")
+    # dropping the constraint drops its index
+    op.execute('ALTER TABLE movie_actor_assoc DROP CONSTRAINT IF EXISTS ' +
+               UNIQUE_LINK)
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.execute('DROP INDEX CONCURRENTLY IF EXISTS ' + name)
@@ -1,7 +1,8 @@
 
 import json
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, DDL, create_engine, event
+from db_pool import engine_options, set_local_statement_timeout
+from replicas import RoutingSQLAlchemy
 import os
 from dotenv import load_dotenv
 load_dotenv()
@@ -9,20 +10,30 @@ load_dotenv()
 database_url = os.getenv('DATABASE_URL')
 database_path = database_url
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
 '''
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service, with the pool
+    settings from config.py (see db_pool.py). The schema is managed by the
+    migrations, tables are only created here with DB_CREATE_ALL on
 '''
 
 
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+        app.config, database_path)
     db.app = app
     db.init_app(app)
-    db.create_all()
+    if not event.contains(db.session, 'after_begin',
+                          set_local_statement_timeout):
+        event.listen(db.session, 'after_begin', set_local_statement_timeout)
+    if app.config['DB_CREATE_ALL']:
+        db.create_all()
+    # Movie.actors is a backref, it only exists once the mappers are set up
+    db.configure_mappers()
 
 
 movie_actor_assoc = db.Table(
@@ -31,9 +42,68 @@ movie_actor_assoc = db.Table(
     db.Column('movie_id', db.Integer, db.ForeignKey(
         'movies.id', ondelete="cascade")),
     db.Column('actor_id', db.Integer, db.ForeignKey(
-        'actors.id', ondelete="cascade"))
+        'actors.id', ondelete="cascade")),
+    # also serves lookups by movie_id
+    db.UniqueConstraint('movie_id', 'actor_id',
+                        name='movie_actor_assoc_movie_id_actor_id_key'),
+    db.Index('ix_movie_actor_assoc_actor_id_movie_id', 'actor_id', 'movie_id')
 )
 
+'''
+catalog_writes
+    a single row counting the statements that wrote movies, actors or
+    links. On postgres the triggers of COUNT_WRITES bump it in the writing
+    transaction, so the new count becomes visible together with the rows,
+    whichever client (app.py, asgi_app.py, psql) wrote them. Writers queue
+    on the row lock until they commit
+'''
+catalog_writes = db.Table(
+    'catalog_writes',
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('writes', db.BigInteger, nullable=False, server_default='0')
+)
+
+COUNT_WRITES = '''
+CREATE OR REPLACE FUNCTION count_catalog_writes() RETURNS trigger AS $$
+BEGIN
+    UPDATE catalog_writes SET writes = writes + 1 WHERE id = 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+''' + ''.join('''
+DROP TRIGGER IF EXISTS {0}_count_writes ON {0};
+CREATE TRIGGER {0}_count_writes
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {0}
+    FOR EACH STATEMENT EXECUTE PROCEDURE count_catalog_writes();
+'''.format(table) for table in ('movies', 'actors', 'movie_actor_assoc'))
+
+event.listen(catalog_writes, 'after_create', DDL(
+    'INSERT INTO catalog_writes (id, writes) VALUES (1, 0)'))
+# after every table, the triggers need movies, actors and their links
+event.listen(db.metadata, 'after_create',
+             DDL(COUNT_WRITES).execute_if(dialect='postgresql'))
+
+'''
+catalog_version()
+    returns a tuple that changes whenever a movie, an actor or a link between
+    them is created, updated or deleted, from catalog_writes. The latest
+    updated_at of movies and actors keeps it moving on databases created
+    without the triggers (sqlite in development), where a write that
+    started before another one committed can still be missed, since now()
+    is the start time of the transaction. Every part is a single index
+    lookup
+'''
+
+
+def catalog_version():
+    return db.session.query(
+        db.select([catalog_writes.c.writes]).where(
+            catalog_writes.c.id == 1).as_scalar(),
+        db.select([db.func.max(Movie.updated_at)]).as_scalar(),
+        db.select([db.func.max(Actor.updated_at)]).as_scalar()
+    ).one()
+
+
 '''
 Movie
 '''
@@ -41,13 +111,22 @@ Movie
 
 class Movie(db.Model):
     __tablename__ = 'movies'
+    __table_args__ = (
+        # serves ?title_prefix=, a LIKE 'prefix%' match
+        db.Index('ix_movies_title_pattern', 'title',
+                 postgresql_ops={'title': 'varchar_pattern_ops'}),
+    )
+    # columns clients can select with ?fields=
+    fields = ('id', 'title', 'release_date')
 
     id = db.Column(db.Integer, primary_key=True)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
+    # indexed for the max(updated_at) of catalog_version()
     updated_at = db.Column(
-        db.DateTime, server_default=db.func.now(), server_onupdate=db.func.now())
+        db.DateTime, server_default=db.func.now(), onupdate=db.func.now(),
+        index=True)
     title = db.Column(db.String(120), nullable=False)
-    release_date = db.Column(db.Date, nullable=False)
+    release_date = db.Column(db.Date, nullable=False, index=True)
 
     def __init__(self, title, release_date):
         self.title = title
@@ -64,6 +143,23 @@ class Movie(db.Model):
         db.session.delete(self)
         db.session.commit()
 
+    @classmethod
+    def version(cls, movie_id):
+        '''
+        returns a tuple that changes whenever the movie, one of its actors
+        or its links to them change, None if the movie does not exist
+        '''
+        return db.session.query(
+            cls.updated_at,
+            db.func.count(movie_actor_assoc.c.id),
+            db.func.max(movie_actor_assoc.c.id),
+            db.func.max(Actor.updated_at)
+        ).outerjoin(
+            movie_actor_assoc, movie_actor_assoc.c.movie_id == cls.id
+        ).outerjoin(
+            Actor, Actor.id == movie_actor_assoc.c.actor_id
+        ).filter(cls.id == movie_id).group_by(cls.id).first()
+
     def format_movie_without_actors(self):
         return {
             'id': self.id,
@@ -85,6 +181,17 @@ class Movie(db.Model):
             }
         }
 
+    def format_fields(self, fields, include_actors=False):
+        formatted = {field: getattr(self, field) for field in fields}
+        if include_actors:
+            actors = list(
+                map(lambda x: x.format_actor_without_movies(), self.actors))
+            formatted['actors'] = {
+                'actors': actors,
+                'total_actors': len(actors)
+            }
+        return formatted
+
 
 '''
 Actor
@@ -93,13 +200,24 @@ Actor
 
 class Actor(db.Model):
     __tablename__ = 'actors'
+    __table_args__ = (
+        # serves ?name_prefix=, a LIKE 'prefix%' match
+        db.Index('ix_actors_name_pattern', 'name',
+                 postgresql_ops={'name': 'varchar_pattern_ops'}),
+        # serves ?gender= alone and with ?min_age= / ?max_age= / ?sort=age
+        db.Index('ix_actors_gender_age', 'gender', 'age'),
+    )
+    # columns clients can select with ?fields=
+    fields = ('id', 'name', 'age', 'gender')
 
     id = Column(Integer, primary_key=True)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
+    # indexed for the max(updated_at) of catalog_version()
     updated_at = db.Column(
-        db.DateTime, server_default=db.func.now(), server_onupdate=db.func.now())
-    name = db.Column(db.String(120), nullable=False)
-    age = db.Column(db.Integer, nullable=False)
+        db.DateTime, server_default=db.func.now(), onupdate=db.func.now(),
+        index=True)
+    name = db.Column(db.String(120), nullable=False, index=True)
+    age = db.Column(db.Integer, nullable=False, index=True)
     gender = db.Column(db.String(120), nullable=False)
     movies = db.relationship(
         "Movie", secondary=movie_actor_assoc, backref=db.backref('actors'))
@@ -121,6 +239,23 @@ class Actor(db.Model):
         db.session.delete(self)
         db.session.commit()
 
+    @classmethod
+    def version(cls, actor_id):
+        '''
+        returns a tuple that changes whenever the actor, one of its movies
+        or its links to them change, None if the actor does not exist
+        '''
+        return db.session.query(
+            cls.updated_at,
+            db.func.count(movie_actor_assoc.c.id),
+            db.func.max(movie_actor_assoc.c.id),
+            db.func.max(Movie.updated_at)
+        ).outerjoin(
+            movie_actor_assoc, movie_actor_assoc.c.actor_id == cls.id
+        ).outerjoin(
+            Movie, Movie.id == movie_actor_assoc.c.movie_id
+        ).filter(cls.id == actor_id).group_by(cls.id).first()
+
     def format_actor_without_movies(self):
         return {
             'id': self.id,
@@ -143,3 +278,82 @@ class Actor(db.Model):
                 'total_movies': total_movies
             }
         }
+
+    def format_fields(self, fields, include_movies=False):
+        formatted = {field: getattr(self, field) for field in fields}
+        if include_movies:
+            movies = list(
+                map(lambda x: x.format_movie_without_actors(), self.movies))
+            formatted['movies'] = {
+                'movies': movies,
+                'total_movies': len(movies)
+            }
+        return formatted
+
+
+'''
+Bulk write helpers
+    Used by the bulk routes to write any number of rows and links in a fixed
+    number of statements instead of one ORM flush per row
+'''
+
+# rows per multi-row INSERT, keeps each statement well under the
+# 65535 bind parameters postgres allows
+BULK_INSERT_CHUNK = 1000
+
+
+def existing_ids(model, ids):
+    '''
+    returns the subset of ids that exist in model's table, using one IN query
+    '''
+    if not ids:
+        return set()
+    return set(row[0] for row in db.session.query(model.id).filter(
+        model.id.in_(set(ids))))
+
+
+def reserve_ids(model, count):
+    '''
+    returns count new primary keys taken from the table's id sequence, so
+    rows can be inserted with multi-row INSERTs and still be linked
+    '''
+    if count == 0:
+        return []
+    rows = db.session.execute(
+        db.select([db.func.nextval(model.__tablename__ + '_id_seq')])
+        .select_from(db.func.generate_series(1, count)))
+    return [row[0] for row in rows]
+
+
+def insert_rows(table, rows):
+    for start in range(0, len(rows), BULK_INSERT_CHUNK):
+        db.session.execute(
+            table.insert().values(rows[start:start + BULK_INSERT_CHUNK]))
+
+
+def set_links(owner_column, owner_id, ids, new_owner=False):
+    '''
+    makes ids the set of rows linked to owner_id in movie_actor_assoc, where
+    owner_column is movie_actor_assoc.c.movie_id or .actor_id, with one
+    SELECT of the current links (skipped for new owners), one bulk INSERT
+    of the added ones and one bulk DELETE of the removed ones
+    returns the sets of added and removed ids
+    '''
+    if owner_column is movie_actor_assoc.c.movie_id:
+        other_column = movie_actor_assoc.c.actor_id
+    else:
+        other_column = movie_actor_assoc.c.movie_id
+    current = set()
+    if not new_owner:
+        current = set(row[0] for row in db.session.query(other_column).filter(
+            owner_column == owner_id))
+    wanted = set(ids)
+    added = wanted - current
+    removed = current - wanted
+    insert_rows(movie_actor_assoc, [
+        {owner_column.name: owner_id, other_column.name: other_id}
+        for other_id in sorted(added)])
+    if removed:
+        db.session.execute(movie_actor_assoc.delete().where(
+            owner_column == owner_id).where(other_column.in_(removed)))
+    return added, removed
@@ -0,0 +1,151 @@
+import base64
+import json
+from datetime import date
+from flask import abort, current_app, request
+from sqlalchemy import literal, select, tuple_
+
+'''
+Keyset (cursor) pagination helpers
+    A page is the first `limit` rows whose id is greater than the `after`
+    cursor, so every page is an index range scan on the primary key and
+    costs the same however deep the client has paged
+
+    Pages can also be ordered by another column, with the id as the tie
+    breaker. The cursor of a sorted page is then an opaque token holding
+    the last row's (sort, id) value, so the next page starts after it even
+    if that row has been deleted meanwhile
+'''
+
+
+def get_page_args(args=None, config=None, sort=None):
+    '''
+        reads ?limit= and ?after= from the request, or from args
+        returns (limit, after), limit is capped at MAX_PAGE_SIZE and after
+        is read as a cursor of pages ordered by sort (see read_cursor)
+        aborts with 400 if limit is not a positive integer or after is not
+        an id or a cursor of this sort
+    '''
+    args = request.args if args is None else args
+    config = current_app.config if config is None else config
+    limit = args.get('limit', None)
+    if limit is None:
+        limit = config['DEFAULT_PAGE_SIZE']
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            abort(400, 'Bad request - limit must be a positive integer')
+        if limit < 1:
+            abort(400, 'Bad request - limit must be a positive integer')
+    limit = min(limit, config['MAX_PAGE_SIZE'])
+
+    after = args.get('after', None)
+    if after is not None:
+        try:
+            after = read_cursor(after, sort)
+        except ValueError:
+            if sort is None:
+                abort(400, 'Bad request - after must be an integer id')
+            abort(400, 'Bad request - after must be an id or the '
+                  'next_cursor of a page with the same sort')
+    return limit, after
+
+
+def make_cursor(row_id, sort=None, value=None):
+    '''
+        returns the next_cursor of a page whose last row has row_id and,
+        when the page is ordered by sort, the sort value value
+    '''
+    if sort is None:
+        return row_id
+    if isinstance(value, date):
+        value = value.isoformat()
+    text = json.dumps([sort.key, value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip('=')
+
+
+def read_cursor(cursor, sort=None):
+    '''
+        returns an id, or (sort value, id) for a cursor made by make_cursor
+        with the same sort, raises ValueError for anything else
+    '''
+    if isinstance(cursor, int) or sort is None or \
+            cursor.lstrip('-').isdigit():
+        return int(cursor)
+    # binascii, unicode and json errors are all ValueErrors
+    data = json.loads(base64.urlsafe_b64decode(
+        cursor + '=' * (-len(cursor) % 4)).decode())
+    if not isinstance(data, list) or len(data) != 3 or \
+            not isinstance(data[2], int):
+        raise ValueError('not a cursor')
+    name, value, row_id = data
+    if name != sort.key:
+        raise ValueError('a cursor of another sort')
+    python_type = sort.type.python_type
+    if python_type is date and isinstance(value, str):
+        value = date.fromisoformat(value)
+    elif not isinstance(value, python_type):
+        raise ValueError('not a cursor')
+    return value, row_id
+
+
+def after_cursor(column, after, sort=None, descending=False):
+    '''
+        returns the criterion for rows that come after the cursor after,
+        as read by read_cursor, when ordered by (sort, column)
+    '''
+    if sort is None:
+        return column < after if descending else column > after
+    if isinstance(after, tuple):
+        cursor = tuple_(literal(after[0], sort.type), literal(after[1]))
+    else:
+        # a bare id is looked up in the same statement; if that row has
+        # been deleted the comparison is null and the page is empty
+        cursor = select([sort, column]).where(
+            column == after).correlate(None)
+    key = tuple_(sort, column)
+    return key < cursor if descending else key > cursor
+
+
+def order(column, sort=None, descending=False):
+    columns = [column] if sort is None else [sort, column]
+    if descending:
+        return [x.desc() for x in columns]
+    return columns
+
+
+def paginate(query, column, limit, after=None, sort=None, descending=False):
+    '''
+        returns (items, next_cursor) for one page of query ordered by
+        (sort, column), or by column alone when sort is None
+        next_cursor is the value to pass as ?after= for the next page
+        (see make_cursor), or None when this is the last page; the rows
+        must have the sort column loaded
+    '''
+    if after is not None:
+        query = query.filter(after_cursor(column, after, sort, descending))
+    items = query.order_by(
+        *order(column, sort, descending)).limit(limit + 1).all()
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        return items, make_cursor(
+            last.id, sort, None if sort is None else getattr(last, sort.key))
+    return items, None
+
+
+def iter_batches(query, column, batch_size, after=None, sort=None,
+                 descending=False):
+    '''
+        yields lists of up to batch_size rows of query ordered as by
+        paginate, fetching one keyset page at a time so only a single
+        batch is held in memory
+    '''
+    while True:
+        batch, cursor = paginate(query, column, batch_size, after, sort,
+                                 descending)
+        if batch:
+            yield batch
+        if cursor is None:
+            return
+        after = read_cursor(cursor, sort)
@@ -0,0 +1,150 @@
+import hashlib
+import threading
+import time
+from itertools import cycle
+from flask import g, has_app_context, request
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import create_engine, orm
+from db_pool import engine_options
+
+'''
+Read replicas
+    With DATABASE_REPLICA_URLS set, GET and HEAD requests run their queries
+    on the replicas, taken in turn, while writes and everything outside a
+    request use the primary at DATABASE_URL.
+
+    A client that has just written reads from the primary for the next
+    REPLICA_STICKY_SECONDS, so it sees its own write even while the replicas
+    lag behind. Writes are remembered per Authorization header in the
+    worker that handled them, and in a cookie the client sends back to any
+    worker when it keeps cookies.
+
+    The response cache follows the same rules (see cache.py): a sticky
+    client never reads a cached response, and a response read from a
+    replica is not cached until REPLICA_STICKY_SECONDS have passed since
+    the last invalidation, so a lagging replica cannot put a stale body
+    back under a key a write has just dropped.
+'''
+
+STICKY_COOKIE = 'read_primary_until'
+
+
+class RoutingSession(SignallingSession):
+    '''
+    session that runs on the replica picked for the request, if any
+    '''
+
+    def get_bind(self, mapper=None, clause=None):
+        if has_app_context():
+            engine = g.get('database_replica')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReplicaRouter:
+    def __init__(self, clock=time.time, max_clients=10000):
+        self.clock = clock
+        self.max_clients = max_clients
+        self.sticky_seconds = 0
+        self.engines = []
+        self._replicas = None
+        self._writes = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        '''
+        opens a pool per url in DATABASE_REPLICA_URLS (comma separated),
+        with the same settings as the primary's
+        '''
+        for engine in self.engines:
+            engine.dispose()
+        urls = [x.strip() for x in
+                (app.config['DATABASE_REPLICA_URLS'] or '').split(',')]
+        self.engines = [create_engine(url, **engine_options(app.config, url))
+                        for url in urls if url]
+        self._replicas = cycle(self.engines) if self.engines else None
+        self.sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+        with self._lock:
+            self._writes.clear()
+
+    def route(self):
+        '''
+        before_request hook, picks the database the request reads from
+        '''
+        g.database_replica = None
+        if (self._replicas is None or
+                request.method not in ('GET', 'HEAD') or self.is_sticky()):
+            return
+        g.database_replica = next(self._replicas)
+
+    def record_write(self, response):
+        '''
+        after_request hook, keeps the client on the primary after a write
+        '''
+        if (self._replicas is None or self.sticky_seconds <= 0 or
+                request.method in ('GET', 'HEAD', 'OPTIONS') or
+                response.status_code >= 400):
+            return response
+        until = self.clock() + self.sticky_seconds
+        client = self.client_key()
+        if client is not None:
+            with self._lock:
+                if len(self._writes) >= self.max_clients:
+                    self._prune()
+                self._writes[client] = until
+        response.set_cookie(STICKY_COOKIE, '%d' % (until + 1),
+                            max_age=self.sticky_seconds + 1, httponly=True,
+                            samesite='Lax')
+        return response
+
+    def is_sticky(self):
+        now = self.clock()
+        try:
+            if int(request.cookies.get(STICKY_COOKIE, 0)) > now:
+                return True
+        except ValueError:
+            pass
+        client = self.client_key()
+        if client is None:
+            return False
+        with self._lock:
+            return self._writes.get(client, 0) > now
+
+    def reads_own_writes(self):
+        '''
+        True when replicas are used and the client wrote within
+        REPLICA_STICKY_SECONDS, so it must read from the primary
+        '''
+        return self._replicas is not None and self.is_sticky()
+
+    def may_lag(self, since):
+        '''
+        True when a replica may not have caught up with a write made at
+        since, a time from clock
+        '''
+        return since is not None and self.clock() < since + self.sticky_seconds
+
+    @staticmethod
+    def client_key():
+        header = request.headers.get('Authorization')
+        if not header:
+            return None
+        return hashlib.sha1(header.encode('utf-8')).hexdigest()
+
+    def _prune(self):
+        now = self.clock()
+        for client in [x for x, until in self._writes.items() if until <= now]:
+            del self._writes[client]
+        # every entry is live, drop the oldest writes
+        excess = len(self._writes) - self.max_clients + 1
+        for client in sorted(self._writes, key=self._writes.get)[:excess]:
+            del self._writes[client]
+
+
+replica_router = ReplicaRouter()
@@ -0,0 +1,172 @@
+import json
+from datetime import date
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii
+from operator import attrgetter
+from flask import current_app
+from sqlalchemy import Date, Integer, String
+from werkzeug.http import http_date
+from timing import server_timing
+
+'''
+JSON serializers
+    Routes send their bodies with json_response instead of jsonify: compact
+    whatever the debug setting, and encoded with orjson when JSON_BACKEND
+    allows it. Rows go through serializers compiled once per model, field
+    list and relationship, which write each row straight to JSON text, so
+    list routes build no dict per row and never reach the encoder's date
+    hook. Dates keep the format jsonify has always sent.
+'''
+
+
+@lru_cache(maxsize=4096)
+def format_date(value):
+    return http_date(value.timetuple())
+
+
+def default(value):
+    if isinstance(value, date):
+        return format_date(value)
+    raise TypeError(repr(value) + ' is not JSON serializable')
+
+
+class JSONBackend:
+    def __init__(self):
+        self.name = 'json'
+        self.dumps = self.stdlib_dumps
+
+    def init_app(self, app):
+        '''
+        picks the encoder from JSON_BACKEND (auto, orjson or json),
+        auto uses orjson when it is installed
+        '''
+        backend = app.config['JSON_BACKEND']
+        self.name = 'json'
+        self.dumps = self.stdlib_dumps
+        if backend in ('auto', 'orjson'):
+            try:
+                import orjson
+            except ImportError:
+                if backend == 'orjson':
+                    raise RuntimeError(
+                        'JSON_BACKEND=orjson needs the orjson package')
+                return
+            option = orjson.OPT_PASSTHROUGH_DATETIME
+
+            def orjson_dumps(value):
+                return orjson.dumps(value, default=default, option=option)
+            self.name = 'orjson'
+            self.dumps = orjson_dumps
+
+    @staticmethod
+    def stdlib_dumps(value):
+        return json.dumps(value, separators=(',', ':'),
+                          default=default).encode('utf-8')
+
+
+json_backend = JSONBackend()
+
+
+def json_response(response, status=200, raw=None):
+    '''
+        returns a json response with the body response
+        raw maps keys to values that are already JSON text, a str or a list
+        of str sent as an array, added to the body as they are
+    '''
+    with server_timing.phase('serialize'):
+        body = json_backend.dumps(response)
+        if raw:
+            fragment = ','.join(
+                encode_basestring_ascii(key) + ':' +
+                ('[' + ','.join(value) + ']' if isinstance(value, list)
+                 else value)
+                for key, value in raw.items()).encode('utf-8')
+            if body == b'{}':
+                body = b'{' + fragment + b'}'
+            else:
+                body = b'{' + fragment + b',' + body[1:]
+    return current_app.response_class(
+        body, status=status, mimetype=current_app.config['JSONIFY_MIMETYPE'])
+
+
+def encode_int(value):
+    return 'null' if value is None else str(int(value))
+
+
+def encode_string(value):
+    return 'null' if value is None else encode_basestring_ascii(value)
+
+
+@lru_cache(maxsize=16384)
+def encode_date(value):
+    return 'null' if value is None else \
+        encode_basestring_ascii(format_date(value))
+
+
+def encode_value(value):
+    return json_backend.dumps(value).decode('utf-8')
+
+
+def column_encoder(column):
+    if isinstance(column.type, Integer):
+        return encode_int
+    if isinstance(column.type, String):
+        return encode_string
+    if isinstance(column.type, Date):
+        return encode_date
+    return encode_value
+
+
+@lru_cache(maxsize=None)
+def row_serializer(model, fields, relationship=None):
+    '''
+        returns a function that turns a list of rows of model into the JSON
+        texts of row.format_fields(fields), with relationship embedded when
+        given as {relationship: [rows], "total_" + relationship: int}
+
+        a linked row shared by several rows, like an actor in many movies
+        of a page, is only written once
+    '''
+    fields = tuple(fields)
+    getter = attrgetter(*fields) if len(fields) > 1 else \
+        (lambda row: (getattr(row, fields[0]),))
+    encoders = tuple(column_encoder(model.__table__.c[field])
+                     for field in fields)
+    template = '{' + ','.join(
+        encode_basestring_ascii(field) + ':%s' for field in fields)
+    linked_serializer = None
+    if relationship:
+        linked_model = getattr(model, relationship).property.mapper.class_
+        linked_serializer = row_serializer(linked_model, linked_model.fields)
+        template += (',' if fields else '') + encode_basestring_ascii(
+            relationship) + ':{' + encode_basestring_ascii(
+            relationship) + ':[%s],' + encode_basestring_ascii(
+            'total_' + relationship) + ':%d}'
+    template += '}'
+
+    def serialize(rows):
+        with server_timing.phase('serialize'):
+            return serialize_rows(rows)
+
+    def serialize_rows(rows):
+        texts = []
+        linked_texts = {}
+        for row in rows:
+            values = [encode(value)
+                      for encode, value in zip(encoders, getter(row))]
+            if linked_serializer is not None:
+                linked = getattr(row, relationship)
+                new = [x for x in linked if id(x) not in linked_texts]
+                if new:
+                    linked_texts.update(zip(map(id, new),
+                                            linked_serializer(new)))
+                values.append(','.join(linked_texts[id(x)] for x in linked))
+                values.append(len(linked))
+            texts.append(template % tuple(values))
+        return texts
+
+    return serialize
+
+
+def serialize_row(row, fields, relationship=None):
+    return row_serializer(type(row), tuple(fields), relationship)([row])[0]
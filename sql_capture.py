@@ -0,0 +1,96 @@
+import re
+from contextlib import contextmanager
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+'''
+SQL capture
+    capture_sql() collects every SQL statement run inside its with block,
+    on any engine, replicas included, along with the request it ran in. The
+    tests use it to hold each route to a statement budget, and to flag
+    statements of the same shape run more than once in one transaction of
+    a request: that is what a lazy relationship loaded row by row (an N+1)
+    looks like, however many rows the test database has. A row loaded
+    again after a commit expired it runs in a new transaction and is not
+    flagged.
+
+    The shape of a statement is its text with the literals and parameters
+    replaced by ?, and IN lists of any length collapsed into one.
+'''
+
+LITERAL = re.compile(r"'(?:[^']|'')*'|%\(\w+\)s|%s|\?|\$\d+|\b\d+(?:\.\d+)?\b")
+IN_LIST = re.compile(r'\(\?(?:\s*,\s*\?)+\)')
+SPACES = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    '''
+    returns statement with its literals and parameters replaced by ?
+    '''
+    shape = LITERAL.sub('?', statement)
+    shape = IN_LIST.sub('(?)', shape)
+    return SPACES.sub(' ', shape).strip()
+
+
+class CapturedSQL(list):
+    '''
+    The statements run, in order. requests holds, for each statement, the
+    request and the transaction it ran in, or None outside of requests
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+        self.transactions = 0
+
+    def add(self, statement):
+        self.append(statement)
+        # the request itself rather than its id, which a later request
+        # can reuse once this one is freed
+        self.requests.append(
+            (request._get_current_object(), self.transactions)
+            if has_request_context() else None)
+
+    def end_transaction(self):
+        self.transactions += 1
+
+    def shapes(self):
+        return [statement_shape(statement) for statement in self]
+
+    def repeated(self):
+        '''
+        returns [(shape, times)] for the statement shapes run more than once
+        in the same transaction of a request, the likely N+1 queries
+        '''
+        counts = {}
+        for shape, key in zip(self.shapes(), self.requests):
+            if key is not None:
+                counts[(key, shape)] = counts.get((key, shape), 0) + 1
+        return [(shape, times) for (key, shape), times in counts.items()
+                if times > 1]
+
+
+@contextmanager
+def capture_sql():
+    '''
+    collects the SQL statements run inside the with block
+    '''
+    statements = CapturedSQL()
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.add(statement)
+
+    def end_transaction(conn):
+        statements.end_transaction()
+
+    listeners = [('before_cursor_execute', before_cursor_execute),
+                 ('commit', end_transaction),
+                 ('rollback', end_transaction)]
+    for name, listener in listeners:
+        event.listen(Engine, name, listener)
+    try:
+        yield statements
+    finally:
+        for name, listener in listeners:
+            event.remove(Engine, name, listener)
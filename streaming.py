@@ -0,0 +1,45 @@
+import sys
+from flask import Response, current_app, request, stream_with_context
+from models import db
+
+'''
+Streaming JSON responses
+    Used by the list routes when the client asks for ?stream=1, so the full
+    table can be sent without building the list or the serialized body in
+    memory
+'''
+
+
+def wants_stream(args=None):
+    args = request.args if args is None else args
+    return args.get('stream', '').lower() in ('1', 'true')
+
+
+def stream_list(key, batches, serialize):
+    '''
+        returns a response that streams the json
+        {"success": true, key: [items], "total_" + key: int}
+        one batch of rows at a time, serialize turns a batch into the list
+        of the JSON texts of its items (see serializers.py)
+    '''
+    def generate():
+        # the opening bytes go out before the first query runs
+        yield '{"success":true,"%s":[' % key
+        total = 0
+        try:
+            for batch in batches:
+                chunk = ','.join(serialize(batch))
+                yield (',' + chunk) if total else chunk
+                total += len(batch)
+                # drop the batch from the session so memory stays flat and
+                # hand the connection back to the pool between batches
+                db.session.close()
+        except:
+            # the status line has already been sent, the client sees a
+            # truncated body
+            print(sys.exc_info())
+            raise
+        yield '],"total_%s":%d}' % (key, total)
+
+    return Response(stream_with_context(generate()),
+                    mimetype=current_app.config['JSONIFY_MIMETYPE'])
@@ -1,6 +1,8 @@
-from models import setup_db, Movie, Actor
+from models import setup_db, db, Movie, Actor
 from app import create_app
-from flask_sqlalchemy import SQLAlchemy
+from cache import response_cache
+from pagination import iter_batches
+from sql_capture import capture_sql
 import json
 import unittest
 import os
@@ -8,6 +10,15 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def count_queries():
+    '''
+        collects the SQL statements run inside the with block, starting
+        from an empty session as a request served by a worker does
+    '''
+    db.session.remove()
+    return capture_sql()
+
+
 class CastingTestCase(unittest.TestCase):
     """This class represents the casting app test case"""
 
@@ -20,17 +31,19 @@ class CastingTestCase(unittest.TestCase):
         self.token_assistant = os.getenv('ASSISTANT_TOKEN')
         self.token_director = os.getenv('DIRECTOR_TOKEN')
         self.token_producer = os.getenv('PRODUCER_TOKEN')
-
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
+        capture = capture_sql()
+        self.statements = capture.__enter__()
+        self.addCleanup(capture.__exit__, None, None, None)
 
     def tearDown(self):
         """Executed after each test"""
-        pass
+        # a statement run more than once by a request is likely a
+        # relationship loaded row by row
+        self.assertEqual(self.statements.repeated(), [])
+
+    def disable_response_cache(self):
+        self.app.config['RESPONSE_CACHE_BACKEND'] = 'none'
+        response_cache.init_app(self.app)
 
     def test_get_movies(self):
         res = self.client().get('/movies', headers={
@@ -48,6 +61,555 @@ class CastingTestCase(unittest.TestCase):
 
         self.assertEqual(res.status_code, 401)
 
+    def test_get_movies_paginated(self):
+        res = self.client().get('/movies?limit=2', headers={
+            "Authorization": 'bearer '+self.token_assistant})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['movies']), 2)
+        self.assertEqual(data['total_movies'], Movie.query.count())
+        self.assertEqual(data['next_cursor'], data['movies'][-1]['id'])
+
+        res = self.client().get(
+            '/movies?limit=2&after='+str(data['next_cursor']), headers={
+                "Authorization": 'bearer '+self.token_assistant})
+        next_page = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(next_page['movies'])
+        for movie in next_page['movies']:
+            self.assertGreater(movie['id'], data['next_cursor'])
+
+    def test_get_movies_last_page(self):
+        last_movie = Movie.query.order_by(Movie.id.desc()).first()
+        res = self.client().get('/movies?after='+str(last_movie.id), headers={
+            "Authorization": 'bearer '+self.token_assistant})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['movies'], [])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_get_movies_streamed(self):
+        self.app.config['STREAM_BATCH_SIZE'] = 2
+        res = self.client().get('/movies?stream=1', headers={
+            "Authorization": 'bearer '+self.token_assistant})
+        self.assertTrue(res.is_streamed)
+        data = json.loads(res.data)
+        movie_ids = [movie.id for movie in Movie.query.order_by(Movie.id)]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual([movie['id'] for movie in data['movies']], movie_ids)
+        self.assertEqual(data['total_movies'], len(movie_ids))
+
+    def test_get_movies_query_budget(self):
+        self.disable_response_cache()
+        # catalog version (index lookups, no counts), page query, actors of
+        # the page, total count; the count is cached after the first request
+        for limit, budget in ((1, 4), (5, 3)):
+            with count_queries() as statements:
+                res = self.client().get('/movies?limit='+str(limit), headers={
+                    "Authorization": 'bearer '+self.token_assistant})
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(len(statements), budget)
+
+    def test_get_movies_query_budget_does_not_grow_with_rows(self):
+        self.disable_response_cache()
+        headers = {"Authorization": 'bearer '+self.token_assistant}
+        actors = Actor.query.limit(2).all()
+        for i in range(150):
+            movie = Movie(title='Budget movie '+str(i),
+                          release_date='2021-03-01')
+            movie.actors = actors
+            db.session.add(movie)
+        db.session.commit()
+        try:
+            self.client().get('/movies?limit=1', headers=headers)
+            with count_queries() as statements:
+                res = self.client().get('/movies?limit=200', headers=headers)
+            data = json.loads(res.data)
+        finally:
+            Movie.query.filter(Movie.title.like('Budget movie %')).delete(
+                synchronize_session=False)
+            db.session.commit()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertGreater(len(data['movies']), 150)
+        # the same version, page and actors queries as for a single row
+        self.assertEqual(len(statements), 3)
+        self.assertEqual(statements.repeated(), [])
+
+    def test_get_movie_query_budget(self):
+        self.disable_response_cache()
+        movie = Movie.query.join(Movie.actors).first()
+        with count_queries() as statements:
+            res = self.client().get('/movies/'+str(movie.id), headers={
+                "Authorization": 'bearer '+self.token_assistant})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(statements), 3)
+
+    def test_get_movies_not_modified(self):
+        self.disable_response_cache()
+        headers = {"Authorization": 'bearer '+self.token_assistant}
+        res = self.client().get('/movies', headers=headers)
+        etag = res.headers['ETag']
+
+        headers['If-None-Match'] = etag
+        with count_queries() as statements:
+            res = self.client().get('/movies', headers=headers)
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+        self.assertEqual(res.data, b'')
+        self.assertEqual(len(statements), 1)
+
+        new_movie = Movie(title='This is a new movie',
+                          release_date='2020-01-12')
+        new_movie.insert()
+        res = self.client().get('/movies', headers=headers)
+        new_movie.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_get_movies_etag_changes_with_deletes(self):
+        self.disable_response_cache()
+        headers = {"Authorization": 'bearer '+self.token_assistant}
+        deleted_movie = Movie(title='This is a deleted movie',
+                              release_date='2020-01-12')
+        deleted_movie.insert()
+        new_movie = Movie(title='This is a new movie',
+                          release_date='2020-01-12')
+        new_movie.insert()
+        res = self.client().get('/movies', headers=headers)
+        etag = res.headers['ETag']
+
+        # the delete leaves the latest updated_at and link id as they were
+        deleted_movie.delete()
+        headers['If-None-Match'] = etag
+        res = self.client().get('/movies', headers=headers)
+        new_movie.delete()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_get_movies_etag_changes_with_interleaved_writes(self):
+        self.disable_response_cache()
+        headers = {"Authorization": 'bearer '+self.token_assistant}
+        connection = db.engine.connect()
+        earlier = connection.begin()
+        # now() is fixed here, before the other write commits
+        connection.execute(db.select([db.func.now()]))
+        later_movie = Movie(title='This is a later movie',
+                            release_date='2020-01-12')
+        later_movie.insert()
+        etag = self.client().get('/movies', headers=headers).headers['ETag']
+
+        # committed after the later movie, with an older updated_at
+        earlier_id = connection.execute(Movie.__table__.insert().values(
+            title='This is an earlier movie',
+            release_date='2020-01-12')).inserted_primary_key[0]
+        earlier.commit()
+        connection.close()
+        headers['If-None-Match'] = etag
+        res = self.client().get('/movies', headers=headers)
+        Movie.query.filter(Movie.id.in_([earlier_id, later_movie.id])).delete(
+            synchronize_session=False)
+        db.session.commit()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_get_movie_etag_changes_with_actors(self):
+        self.disable_response_cache()
+        headers = {"Authorization": 'bearer '+self.token_assistant}
+        movie = Movie.query.join(Movie.actors).first()
+        movie_id = movie.id
+        actor_id = movie.actors[0].id
+        actor_age = movie.actors[0].age
+        res = self.client().get('/movies/'+str(movie_id), headers=headers)
+        etag = res.headers['ETag']
+
+        headers['If-None-Match'] = etag
+        res = self.client().get('/movies/'+str(movie_id), headers=headers)
+        self.assertEqual(res.status_code, 304)
+
+        res = self.client().patch('/actors/'+str(actor_id), json={
+            'age': 99}, headers={
+                "Authorization": 'bearer '+self.token_director})
+        self.assertEqual(res.status_code, 200)
+        res = self.client().get('/movies/'+str(movie_id), headers=headers)
+        self.client().patch('/actors/'+str(actor_id), json={
+            'age': actor_age}, headers={
+                "Authorization": 'bearer '+self.token_director})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_get_movies_cached(self):
+        headers = {"Authorization": 'bearer '+self.token_assistant}
+        res = self.client().get('/movies', headers=headers)
+        with count_queries() as statements:
+            cached_res = self.client().get('/movies', headers=headers)
+
+        self.assertEqual(cached_res.status_code, 200)
+        self.assertEqual(cached_res.data, res.data)
+        self.assertEqual(cached_res.headers['ETag'], res.headers['ETag'])
+        self.assertEqual(len(statements), 0)
+
+    def test_create_movie_invalidates_cached_movies(self):
+        headers = {"Authorization": 'bearer '+self.token_producer}
+        res = self.client().get('/movies?limit=1', headers=headers)
+        total_movies = json.loads(res.data)['total_movies']
+        res = self.client().post('/movies', json={
+            'title': 'This is a new movie which should be created',
+            'release_date': '2021-01-12'
+        }, headers=headers)
+        movie_id = json.loads(res.data)['movie']['id']
+
+        res = self.client().get('/movies?limit=1', headers=headers)
+        self.client().delete('/movies/'+str(movie_id), headers=headers)
+
+        self.assertEqual(json.loads(res.data)['total_movies'], total_movies + 1)
+
+    def test_update_actor_invalidates_cached_movies(self):
+        headers = {"Authorization": 'bearer '+self.token_director}
+        movie = Movie.query.join(Movie.actors).first()
+        movie_id = movie.id
+        actor_id = movie.actors[0].id
+        actor_name = movie.actors[0].name
+        other_movie_id = Movie.query.filter(
+            ~Movie.actors.any(Actor.id == actor_id)).first().id
+        self.client().get('/movies/'+str(movie_id), headers=headers)
+        self.client().get('/movies/'+str(other_movie_id), headers=headers)
+
+        self.client().patch('/actors/'+str(actor_id), json={
+            'name': 'Buggsy Malone'}, headers=headers)
+        res = self.client().get('/movies/'+str(movie_id), headers=headers)
+        with count_queries() as statements:
+            self.client().get('/movies/'+str(other_movie_id), headers=headers)
+        self.client().patch('/actors/'+str(actor_id), json={
+            'name': actor_name}, headers=headers)
+
+        actor_names = [actor['name'] for actor in
+                       json.loads(res.data)['movie']['actors']['actors']]
+        self.assertIn('Buggsy Malone', actor_names)
+        self.assertEqual(len(statements), 0)
+
+    def test_update_movie_title_invalidates_cached_lists(self):
+        headers = {"Authorization": 'bearer '+self.token_producer}
+        movie = Movie.query.first()
+        movie_id = movie.id
+        title = movie.title
+        path = '/movies?title_prefix=Renamed%20by%20a%20patch'
+        res = self.client().get(path, headers=headers)
+        self.assertEqual(json.loads(res.data)['movies'], [])
+
+        self.client().patch('/movies/'+str(movie_id), json={
+            'title': 'Renamed by a patch'}, headers=headers)
+        try:
+            res = self.client().get(path, headers=headers)
+        finally:
+            self.client().patch('/movies/'+str(movie_id), json={
+                'title': title}, headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual([x['id'] for x in data['movies']], [movie_id])
+        self.assertEqual(data['total_movies'], 1)
+
+    def test_update_actor_age_invalidates_cached_lists(self):
+        headers = {"Authorization": 'bearer '+self.token_director}
+        actor = Actor.query.order_by(Actor.age).first()
+        actor_id = actor.id
+        age = actor.age
+        path = '/actors?min_age=150&sort=age'
+        res = self.client().get(path, headers=headers)
+        self.assertEqual(json.loads(res.data)['actors'], [])
+
+        self.client().patch('/actors/'+str(actor_id), json={
+            'age': 151}, headers=headers)
+        try:
+            res = self.client().get(path, headers=headers)
+        finally:
+            self.client().patch('/actors/'+str(actor_id), json={
+                'age': age}, headers=headers)
+
+        self.assertEqual([x['id'] for x in json.loads(res.data)['actors']],
+                         [actor_id])
+
+    def test_update_movie_title_and_actors_invalidates_cached_lists(self):
+        headers = {"Authorization": 'bearer '+self.token_producer}
+        movie = Movie.query.join(Movie.actors).first()
+        movie_id = movie.id
+        title = movie.title
+        actor_ids = [actor.id for actor in movie.actors]
+        path = '/movies?title_prefix=Renamed%20with%20its%20actors'
+        res = self.client().get(path, headers=headers)
+        self.assertEqual(json.loads(res.data)['movies'], [])
+
+        # the links are synced after the title is set, with a SELECT that
+        # flushes it
+        self.client().patch('/movies/'+str(movie_id), json={
+            'title': 'Renamed with its actors', 'actors': actor_ids},
+            headers=headers)
+        try:
+            res = self.client().get(path, headers=headers)
+        finally:
+            self.client().patch('/movies/'+str(movie_id), json={
+                'title': title}, headers=headers)
+
+        self.assertEqual([x['id'] for x in json.loads(res.data)['movies']],
+                         [movie_id])
+
+    def test_update_actor_age_and_movies_invalidates_cached_lists(self):
+        headers = {"Authorization": 'bearer '+self.token_director}
+        actor = Actor.query.join(Actor.movies).first()
+        actor_id = actor.id
+        age = actor.age
+        movie_ids = [movie.id for movie in actor.movies]
+        path = '/actors?min_age=150&sort=age'
+        res = self.client().get(path, headers=headers)
+        self.assertEqual(json.loads(res.data)['actors'], [])
+
+        self.client().patch('/actors/'+str(actor_id), json={
+            'age': 151, 'movies': movie_ids}, headers=headers)
+        try:
+            res = self.client().get(path, headers=headers)
+        finally:
+            self.client().patch('/actors/'+str(actor_id), json={
+                'age': age}, headers=headers)
+
+        self.assertEqual([x['id'] for x in json.loads(res.data)['actors']],
+                         [actor_id])
+
+    def test_get_movies_sparse_fields(self):
+        res = self.client().get('/movies?fields=id,title', headers={
+            "Authorization": 'bearer '+self.token_assistant})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['movies'])
+        for movie in data['movies']:
+            self.assertEqual(set(movie), {'id', 'title'})
+
+    def test_get_movies_sparse_fields_query_budget(self):
+        self.disable_response_cache()
+        with count_queries() as statements:
+            res = self.client().get('/movies?fields=id,title', headers={
+                "Authorization": 'bearer '+self.token_assistant})
+
+        self.assertEqual(res.status_code, 200)
+        # version, page query, total count - no actors query
+        self.assertEqual(len(statements), 3)
+        self.assertNotIn('release_date', statements[1])
+        self.assertNotIn('movie_actor_assoc', ' '.join(statements[1:]))
+
+    def test_get_movies_include_actors(self):
+        res = self.client().get('/movies?fields=title&include=actors', headers={
+            "Authorization": 'bearer '+self.token_assistant})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        for movie in data['movies']:
+            self.assertEqual(set(movie), {'title', 'actors'})
+            self.assertEqual(movie['actors']['total_actors'],
+                             len(movie['actors']['actors']))
+
+    def test_error_get_movies_unknown_field(self):
+        res = self.client().get('/movies?fields=id,budget', headers={
+            "Authorization": 'bearer '+self.token_assistant})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(
+            data['message'], 'Bad request - unknown fields: budget')
+
+    def test_error_get_movies_invalid_limit(self):
+        res = self.client().get('/movies?limit=0', headers={
+            "Authorization": 'bearer '+self.token_assistant})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(
+            data['message'], 'Bad request - limit must be a positive integer')
+
+    def get_all_pages(self, url, key, token):
+        ids = []
+        after = None
+        while True:
+            page_url = url + ('&after=' + str(after) if after else '')
+            res = self.client().get(page_url, headers={
+                "Authorization": 'bearer '+token})
+            self.assertEqual(res.status_code, 200)
+            data = json.loads(res.data)
+            ids += [item['id'] for item in data[key]]
+            after = data['next_cursor']
+            if after is None:
+                return ids, data['total_' + key]
+
+    def test_get_movies_filtered_by_release_window(self):
+        ids, total = self.get_all_pages(
+            '/movies?release_from=2015-01-01&release_to=2019-12-31&limit=2',
+            'movies', self.token_assistant)
+        expected = [movie.id for movie in Movie.query.filter(
+            Movie.release_date >= '2015-01-01',
+            Movie.release_date <= '2019-12-31').order_by(Movie.id)]
+
+        self.assertTrue(expected)
+        self.assertEqual(ids, expected)
+        self.assertEqual(total, len(expected))
+
+    def test_get_movies_sorted_by_release_date(self):
+        ids, total = self.get_all_pages(
+            '/movies?sort=-release_date&limit=2', 'movies',
+            self.token_assistant)
+        expected = [movie.id for movie in Movie.query.order_by(
+            Movie.release_date.desc(), Movie.id.desc())]
+
+        self.assertEqual(ids, expected)
+
+    def add_cursor_movies(self):
+        movies = [Movie(title='Cursor movie ' + letter,
+                        release_date='2020-01-12') for letter in 'abc']
+        db.session.add_all(movies)
+        db.session.commit()
+        return [movie.id for movie in movies]
+
+    def test_get_movies_sorted_pages_survive_deleted_cursor_row(self):
+        headers = {"Authorization": 'bearer '+self.token_assistant}
+        first_id, second_id, third_id = self.add_cursor_movies()
+        path = '/movies?sort=title&title_prefix=Cursor%20movie&limit=1'
+        data = json.loads(self.client().get(path, headers=headers).data)
+        self.assertEqual([x['id'] for x in data['movies']], [first_id])
+
+        Movie.query.get(first_id).delete()
+        res = self.client().get(
+            path + '&after=' + data['next_cursor'], headers=headers)
+        data = json.loads(res.data)
+        Movie.query.filter(Movie.id.in_([second_id, third_id])).delete(
+            synchronize_session=False)
+        db.session.commit()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([x['id'] for x in data['movies']], [second_id])
+        self.assertIsNotNone(data['next_cursor'])
+
+    def test_sorted_batches_survive_deleted_cursor_row(self):
+        ids = self.add_cursor_movies()
+        batches = iter_batches(
+            Movie.query.filter(Movie.title.startswith('Cursor movie')),
+            Movie.id, 1, sort=Movie.title)
+        streamed = [movie.id for movie in next(batches)]
+        # the last row of the batch goes before the next one is fetched
+        Movie.query.get(ids[0]).delete()
+        for batch in batches:
+            streamed += [movie.id for movie in batch]
+            db.session.commit()
+        Movie.query.filter(Movie.id.in_(ids)).delete(
+            synchronize_session=False)
+        db.session.commit()
+
+        self.assertEqual(streamed, ids)
+
+    def test_error_get_movies_cursor_of_another_sort(self):
+        headers = {"Authorization": 'bearer '+self.token_assistant}
+        data = json.loads(self.client().get(
+            '/movies?sort=title&limit=1', headers=headers).data)
+        for after in (data['next_cursor'], 'not-a-cursor'):
+            res = self.client().get(
+                '/movies?sort=release_date&after=' + after, headers=headers)
+
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(
+                json.loads(res.data)['message'],
+                'Bad request - after must be an id or the next_cursor of a '
+                'page with the same sort')
+
+    def test_get_movies_title_prefix(self):
+        res = self.client().get('/movies?title_prefix=The', headers={
+            "Authorization": 'bearer '+self.token_assistant})
+        data = json.loads(res.data)
+        expected = [movie.id for movie in Movie.query.filter(
+            Movie.title.startswith('The')).order_by(Movie.id)]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(expected)
+        self.assertEqual([movie['id'] for movie in data['movies']], expected)
+
+        res = self.client().get('/movies?title_prefix=%25', headers={
+            "Authorization": 'bearer '+self.token_assistant})
+        self.assertEqual(json.loads(res.data)['movies'], [])
+
+    def test_error_get_movies_sort_unindexed(self):
+        res = self.client().get(
+            '/movies?sort=title&release_from=2015-01-01', headers={
+                "Authorization": 'bearer '+self.token_assistant})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(
+            data['message'],
+            'Bad request - sort=title cannot be combined with release_from')
+
+    def test_error_get_movies_invalid_release_from(self):
+        res = self.client().get('/movies?release_from=yesterday', headers={
+            "Authorization": 'bearer '+self.token_assistant})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(
+            data['message'],
+            'Bad request - release_from must be a YYYY-MM-DD date')
+
+    def test_get_movies_count_cached_until_write(self):
+        self.disable_response_cache()
+        headers = {"Authorization": 'bearer '+self.token_producer}
+        res = self.client().get('/movies?limit=1', headers=headers)
+        total_movies = json.loads(res.data)['total_movies']
+        with count_queries() as statements:
+            res = self.client().get('/movies?limit=1', headers=headers)
+        self.assertFalse(
+            [x for x in statements if x.startswith('SELECT count(')])
+
+        res = self.client().post('/movies', json={
+            'title': 'New movie', 'release_date': '2021-01-12'},
+            headers=headers)
+        movie_id = json.loads(res.data)['movie']['id']
+        res = self.client().get('/movies?limit=1', headers=headers)
+
+        self.assertEqual(json.loads(res.data)['total_movies'], total_movies + 1)
+        Movie.query.get(movie_id).delete()
+
+    def test_get_movies_estimated_count(self):
+        self.disable_response_cache()
+        headers = {"Authorization": 'bearer '+self.token_assistant}
+        with count_queries() as statements:
+            res = self.client().get('/movies?count=estimated', headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIsInstance(data['total_movies'], int)
+        self.assertFalse(
+            [x for x in statements if x.startswith('SELECT count(')])
+
+        res = self.client().get(
+            '/movies?count=estimated&release_from=2015-01-01', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertGreater(json.loads(res.data)['total_movies'], 0)
+
+    def test_error_get_movies_invalid_count(self):
+        res = self.client().get('/movies?count=roughly', headers={
+            "Authorization": 'bearer '+self.token_assistant})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(
+            data['message'], 'Bad request - count must be exact or estimated')
+
     def test_create_movie_with_actors(self):
         new_movie = {
             'title': 'This is a new movie which should be created',
@@ -137,6 +699,108 @@ class CastingTestCase(unittest.TestCase):
 
         self.assertEqual(res.status_code, 422)
 
+    def bulk_movies(self):
+        new_movies = [{
+            'title': 'Bulk movie ' + str(i),
+            'release_date': '2021-01-12',
+            'actors': [158, 159]
+        } for i in range(50)]
+        new_movies.append({'title': 'Bulk movie', 'release_date': '2021-02-01'})
+        return new_movies
+
+    def test_create_movies_bulk(self):
+        new_movies = self.bulk_movies()
+        res = self.client().post('/movies/bulk', json=new_movies, headers={
+            "Authorization": 'bearer '+self.token_producer})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(data['total_created'], 51)
+        self.assertEqual([x['index'] for x in data['movies']], list(range(51)))
+        movies = [Movie.query.get(x['id']) for x in data['movies']]
+        self.assertEqual(movies[0].title, 'Bulk movie 0')
+        self.assertEqual(len(movies[0].actors), 2)
+        self.assertEqual(len(movies[-1].actors), 0)
+        for movie in movies:
+            movie.delete()
+
+    def test_create_movies_bulk_query_budget(self):
+        new_movies = self.bulk_movies()
+        with count_queries() as statements:
+            res = self.client().post('/movies/bulk', json=new_movies, headers={
+                "Authorization": 'bearer '+self.token_producer})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 201)
+        # actor lookup, id reservation, movies insert and links insert
+        self.assertEqual(len(statements), 4)
+        Movie.query.filter(Movie.id.in_(
+            [x['id'] for x in data['movies']])).delete(
+                synchronize_session=False)
+        db.session.commit()
+
+    def test_error_create_movies_bulk_invalid_items(self):
+        total_movies = Movie.query.count()
+        new_movies = [
+            {'title': 'Bulk movie', 'release_date': '2021-01-12'},
+            {'release_date': '2021-01-12'},
+            {'title': 'Bulk movie', 'release_date': '20da20-01-12'}
+        ]
+        res = self.client().post('/movies/bulk', json=new_movies, headers={
+            "Authorization": 'bearer '+self.token_producer})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['errors'], [
+            {'index': 1, 'message': 'title is required'},
+            {'index': 2, 'message': 'release_date must be a YYYY-MM-DD date'}
+        ])
+        self.assertEqual(Movie.query.count(), total_movies)
+
+    def test_error_create_movies_bulk_actor_not_found(self):
+        total_movies = Movie.query.count()
+        new_movies = [
+            {'title': 'Bulk movie', 'release_date': '2021-01-12',
+             'actors': [158]},
+            {'title': 'Bulk movie', 'release_date': '2021-01-12',
+             'actors': [158, 999999]}
+        ]
+        res = self.client().post('/movies/bulk', json=new_movies, headers={
+            "Authorization": 'bearer '+self.token_producer})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['errors'], [
+            {'index': 1, 'message': 'Could not find actor with id 999999'}
+        ])
+        self.assertEqual(Movie.query.count(), total_movies)
+
+    def test_error_create_movies_bulk_not_a_list(self):
+        res = self.client().post('/movies/bulk', json={
+            'title': 'Bulk movie', 'release_date': '2021-01-12'}, headers={
+            "Authorization": 'bearer '+self.token_producer})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(
+            data['message'], 'Bad request - a list of movies is required')
+
+    def test_error_create_movies_bulk_too_many(self):
+        self.app.config['BULK_MAX_ITEMS'] = 2
+        new_movies = [{'title': 'Bulk movie', 'release_date': '2021-01-12'}
+                      for i in range(3)]
+        res = self.client().post('/movies/bulk', json=new_movies, headers={
+            "Authorization": 'bearer '+self.token_producer})
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_error_create_movies_bulk_no_permissions(self):
+        res = self.client().post('/movies/bulk', json=[{
+            'title': 'Bulk movie', 'release_date': '2021-01-12'}], headers={
+            "Authorization": 'bearer '+self.token_assistant})
+
+        self.assertEqual(res.status_code, 403)
+
     def test_get_movie(self):
         new_movie = {
             'title': 'This is a new movie',
@@ -281,6 +945,71 @@ class CastingTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 422)
         new_movie.delete()
 
+    def test_error_create_movie_actors_not_found(self):
+        total_movies = Movie.query.count()
+        new_movie = {
+            'title': 'New movie',
+            'release_date': '2021-01-12',
+            'actors': [158, 999998, 999999]
+        }
+        res = self.client().post('/movies', json=new_movie, headers={
+            "Authorization": 'bearer '+self.token_producer})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(
+            data['message'], 'Could not find actor with id 999998, 999999')
+        self.assertEqual(Movie.query.count(), total_movies)
+
+    def patch_movie_actors(self, movie_id, actors):
+        '''
+        replaces the actors of the movie, returns the statements it took
+        '''
+        with count_queries() as statements:
+            res = self.client().patch(
+                '/movies/'+str(movie_id), json={'actors': actors},
+                headers={"Authorization": 'bearer '+self.token_director})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            sorted(x['id'] for x in data['movie']['actors']['actors']),
+            sorted(actors))
+        return statements
+
+    def test_update_movie_replaces_actors(self):
+        new_movie = Movie(title='New movie', release_date='2020-01-12')
+        new_movie.insert()
+        movie_id = new_movie.id
+
+        self.patch_movie_actors(movie_id, [158])
+        self.patch_movie_actors(movie_id, [156, 157, 158, 159, 160, 162])
+        self.patch_movie_actors(movie_id, [158, 159])
+        self.patch_movie_actors(movie_id, [])
+        Movie.query.get(movie_id).delete()
+
+    def test_update_movie_replaces_actors_query_budget(self):
+        new_movie = Movie(title='New movie', release_date='2020-01-12')
+        new_movie.insert()
+        movie_id = new_movie.id
+        all_actors = [156, 157, 158, 159, 160, 162, 163, 164]
+
+        one = self.patch_movie_actors(movie_id, [158])
+        # the links are written with one insert and one delete however
+        # many actors there are
+        self.assertEqual(len(self.patch_movie_actors(movie_id, all_actors)),
+                         len(one))
+        Movie.query.get(movie_id).delete()
+
+    def test_error_update_movie_invalid_actors(self):
+        res = self.client().patch('/movies/400', json={
+            'actors': ['158']}, headers={
+            "Authorization": 'bearer '+self.token_director})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(
+            data['message'], 'Bad request - actors must be a list of actor ids')
+
     def test_error_update_movie_not_found(self):
         movie_id = 1111111
         updated_movie = {
@@ -368,6 +1097,135 @@ class CastingTestCase(unittest.TestCase):
 
         self.assertEqual(res.status_code, 401)
 
+    def test_get_actors_paginated(self):
+        res = self.client().get('/actors?limit=2', headers={
+            "Authorization": 'bearer '+self.token_assistant})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['actors']), 2)
+        self.assertEqual(data['total_actors'], Actor.query.count())
+        self.assertEqual(data['next_cursor'], data['actors'][-1]['id'])
+
+        res = self.client().get(
+            '/actors?limit=2&after='+str(data['next_cursor']), headers={
+                "Authorization": 'bearer '+self.token_assistant})
+        next_page = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(next_page['actors'])
+        for actor in next_page['actors']:
+            self.assertGreater(actor['id'], data['next_cursor'])
+
+    def test_get_actors_streamed(self):
+        self.app.config['STREAM_BATCH_SIZE'] = 2
+        res = self.client().get('/actors?stream=1', headers={
+            "Authorization": 'bearer '+self.token_assistant})
+        self.assertTrue(res.is_streamed)
+        data = json.loads(res.data)
+        actor_ids = [actor.id for actor in Actor.query.order_by(Actor.id)]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([actor['id'] for actor in data['actors']], actor_ids)
+        self.assertEqual(data['total_actors'], len(actor_ids))
+
+    def test_get_actors_query_budget(self):
+        self.disable_response_cache()
+        # catalog version (index lookups, no counts), page query, movies of
+        # the page, total count; the count is cached after the first request
+        for limit, budget in ((1, 4), (5, 3)):
+            with count_queries() as statements:
+                res = self.client().get('/actors?limit='+str(limit), headers={
+                    "Authorization": 'bearer '+self.token_assistant})
+
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(len(statements), budget)
+
+    def test_get_actor_query_budget(self):
+        self.disable_response_cache()
+        actor = Actor.query.join(Actor.movies).first()
+        with count_queries() as statements:
+            res = self.client().get('/actors/'+str(actor.id), headers={
+                "Authorization": 'bearer '+self.token_assistant})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(statements), 3)
+
+    def test_get_actor_not_modified(self):
+        self.disable_response_cache()
+        headers = {"Authorization": 'bearer '+self.token_assistant}
+        actor = Actor.query.first()
+        res = self.client().get('/actors/'+str(actor.id), headers=headers)
+        etag = res.headers['ETag']
+
+        headers['If-None-Match'] = etag
+        with count_queries() as statements:
+            res = self.client().get('/actors/'+str(actor.id), headers=headers)
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(len(statements), 1)
+
+    def test_get_actor_sparse_fields(self):
+        actor = Actor.query.join(Actor.movies).first()
+        res = self.client().get(
+            '/actors/'+str(actor.id)+'?fields=name&include=', headers={
+                "Authorization": 'bearer '+self.token_assistant})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['actor'], {'name': actor.name})
+
+    def test_error_get_actors_cannot_include(self):
+        res = self.client().get('/actors?include=studios', headers={
+            "Authorization": 'bearer '+self.token_assistant})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(
+            data['message'], 'Bad request - cannot include: studios')
+
+    def test_error_get_actors_invalid_cursor(self):
+        res = self.client().get('/actors?after=abc', headers={
+            "Authorization": 'bearer '+self.token_assistant})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(
+            data['message'], 'Bad request - after must be an integer id')
+
+    def test_get_actors_filtered_and_sorted_by_age(self):
+        ids, total = self.get_all_pages(
+            '/actors?gender=male&min_age=31&sort=age&limit=2', 'actors',
+            self.token_assistant)
+        expected = [actor.id for actor in Actor.query.filter(
+            Actor.gender == 'male', Actor.age >= 31).order_by(
+            Actor.age, Actor.id)]
+
+        self.assertTrue(expected)
+        self.assertEqual(ids, expected)
+        self.assertEqual(total, len(expected))
+
+    def test_get_actors_name_prefix(self):
+        res = self.client().get('/actors?name_prefix=Jen&sort=name', headers={
+            "Authorization": 'bearer '+self.token_assistant})
+        data = json.loads(res.data)
+        expected = [actor.id for actor in Actor.query.filter(
+            Actor.name.startswith('Jen')).order_by(Actor.name, Actor.id)]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(expected)
+        self.assertEqual([actor['id'] for actor in data['actors']], expected)
+
+    def test_error_get_actors_unknown_sort(self):
+        res = self.client().get('/actors?sort=gender', headers={
+            "Authorization": 'bearer '+self.token_assistant})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(
+            data['message'],
+            'Bad request - cannot sort by gender, sort by one of: id, age, name')
+
     def test_create_actor_with_movies(self):
         new_actor = {
             'name': 'Jon Actor',
@@ -489,6 +1347,43 @@ class CastingTestCase(unittest.TestCase):
         self.assertEqual(
             data['message'], 'Bad request - gender is required')
 
+    def test_create_actors_bulk(self):
+        new_actors = [{
+            'name': 'Bulk Actor ' + str(i),
+            'age': 30 + i,
+            'gender': 'female',
+            'movies': [400, 401, 401]
+        } for i in range(20)]
+        res = self.client().post('/actors/bulk', json=new_actors, headers={
+            "Authorization": 'bearer '+self.token_producer})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(data['total_created'], 20)
+        actors = [Actor.query.get(x['id']) for x in data['actors']]
+        self.assertEqual(actors[3].name, 'Bulk Actor 3')
+        self.assertEqual(actors[3].age, 33)
+        self.assertEqual(
+            sorted(movie.id for movie in actors[3].movies), [400, 401])
+        for actor in actors:
+            actor.delete()
+
+    def test_error_create_actors_bulk_invalid_items(self):
+        total_actors = Actor.query.count()
+        new_actors = [
+            {'name': 'Bulk Actor', 'age': 'dafasd', 'gender': 'male'},
+            {'name': 'Bulk Actor', 'age': 45, 'gender': 'male'}
+        ]
+        res = self.client().post('/actors/bulk', json=new_actors, headers={
+            "Authorization": 'bearer '+self.token_producer})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['errors'], [
+            {'index': 0, 'message': 'age must be an integer'}
+        ])
+        self.assertEqual(Actor.query.count(), total_actors)
+
     def test_get_actor(self):
         new_actor = {
             'name': 'Jon Actor',
@@ -561,6 +1456,34 @@ class CastingTestCase(unittest.TestCase):
         self.assertEqual(data['actor']['movies']['total_movies'], 0)
         new_actor.delete()
 
+    def test_update_actor_replaces_movies(self):
+        new_actor = Actor(name='Jon Actor', age=45, gender='male')
+        new_actor.insert()
+        actor_id = new_actor.id
+        res = self.client().patch('/actors/'+str(actor_id), json={
+            'movies': [400, 401]}, headers={
+            "Authorization": 'bearer '+self.token_director})
+        res = self.client().patch('/actors/'+str(actor_id), json={
+            'movies': [401, 402]}, headers={
+            "Authorization": 'bearer '+self.token_director})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            sorted(x['id'] for x in data['actor']['movies']['movies']),
+            [401, 402])
+        Actor.query.get(actor_id).delete()
+
+    def test_error_update_actor_movies_not_found(self):
+        res = self.client().patch('/actors/158', json={
+            'movies': [400, 999999]}, headers={
+            "Authorization": 'bearer '+self.token_director})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(
+            data['message'], 'Could not find movie with id 999999')
+
     def test_error_update_actor_not_found(self):
         actor_id = 111111
         updated_actor = {
@@ -0,0 +1,173 @@
+import asyncio
+import unittest
+import os
+from json import dumps
+import test_app
+from dotenv import load_dotenv
+load_dotenv()
+
+try:
+    from asgi_app import create_app as create_asgi_app
+except ImportError:
+    # quart, databases and asyncpg come from requirements-async.txt
+    create_asgi_app = None
+
+FLASK_ONLY = 'statement budgets, ETags and the response cache are app.py only'
+
+
+class SyncResponse:
+    def __init__(self, connection):
+        self.status_code = connection.status_code
+        self.headers = connection.headers
+        self.data = bytes(connection.response_data)
+        # bodies sent in one piece carry their length
+        self.is_streamed = 'Content-Length' not in connection.headers
+
+
+class SyncClient:
+    '''
+        runs requests through Quart's test client on loop, with the
+        interface of Flask's test client that test_app.py uses
+    '''
+
+    def __init__(self, app, loop):
+        self.app = app
+        self.loop = loop
+
+    def open(self, path, method, headers=None, json=None):
+        headers = dict(headers or {})
+        body = b''
+        if json is not None:
+            body = dumps(json).encode()
+            headers['Content-Type'] = 'application/json'
+
+        async def send():
+            # a raw connection, so the headers are the ones the app sent
+            connection = self.app.test_client().request(
+                path, method=method, headers=headers)
+            async with connection:
+                await connection.send(body)
+                await connection.send_complete()
+            return SyncResponse(connection)
+
+        return self.loop.run_until_complete(send())
+
+    def get(self, path, **kwargs):
+        return self.open(path, 'GET', **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.open(path, 'POST', **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.open(path, 'PATCH', **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.open(path, 'DELETE', **kwargs)
+
+
+@unittest.skipIf(create_asgi_app is None, 'requirements-async.txt is not '
+                 'installed')
+class AsyncCastingTestCase(test_app.CastingTestCase):
+    """This class runs the casting app test case against asgi_app.py,
+    the fixtures are still written through app.py's models"""
+
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.new_event_loop()
+        self.async_app = create_asgi_app({
+            'DATABASE_URL': os.getenv('TEST_DATABASE_URL')})
+        # what before_serving does, without an app context that would
+        # have to outlive the task it was pushed in
+        self.loop.run_until_complete(self.async_app.database.connect())
+        client = SyncClient(self.async_app, self.loop)
+        self.client = lambda: client
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.async_app.database.disconnect())
+        self.loop.close()
+        super().tearDown()
+
+    def test_get_movies_streamed(self):
+        self.async_app.config['STREAM_BATCH_SIZE'] = 2
+        super().test_get_movies_streamed()
+
+    def test_get_actors_streamed(self):
+        self.async_app.config['STREAM_BATCH_SIZE'] = 2
+        super().test_get_actors_streamed()
+
+    def test_error_create_movies_bulk_too_many(self):
+        self.async_app.config['BULK_MAX_ITEMS'] = 2
+        super().test_error_create_movies_bulk_too_many()
+
+    @unittest.skip(FLASK_ONLY)
+    def test_get_movies_query_budget(self):
+        pass
+
+    @unittest.skip(FLASK_ONLY)
+    def test_get_movies_query_budget_does_not_grow_with_rows(self):
+        pass
+
+    @unittest.skip(FLASK_ONLY)
+    def test_get_movie_query_budget(self):
+        pass
+
+    @unittest.skip(FLASK_ONLY)
+    def test_get_actors_query_budget(self):
+        pass
+
+    @unittest.skip(FLASK_ONLY)
+    def test_get_actor_query_budget(self):
+        pass
+
+    @unittest.skip(FLASK_ONLY)
+    def test_get_movies_not_modified(self):
+        pass
+
+    @unittest.skip(FLASK_ONLY)
+    def test_get_movies_etag_changes_with_deletes(self):
+        pass
+
+    @unittest.skip(FLASK_ONLY)
+    def test_get_movies_etag_changes_with_interleaved_writes(self):
+        pass
+
+    @unittest.skip(FLASK_ONLY)
+    def test_get_actor_not_modified(self):
+        pass
+
+    @unittest.skip(FLASK_ONLY)
+    def test_get_movie_etag_changes_with_actors(self):
+        pass
+
+    @unittest.skip(FLASK_ONLY)
+    def test_get_movies_cached(self):
+        pass
+
+    @unittest.skip(FLASK_ONLY)
+    def test_update_actor_invalidates_cached_movies(self):
+        pass
+
+    @unittest.skip(FLASK_ONLY)
+    def test_get_movies_sparse_fields_query_budget(self):
+        pass
+
+    @unittest.skip(FLASK_ONLY)
+    def test_get_movies_count_cached_until_write(self):
+        pass
+
+    @unittest.skip(FLASK_ONLY)
+    def test_get_movies_estimated_count(self):
+        pass
+
+    @unittest.skip(FLASK_ONLY)
+    def test_create_movies_bulk_query_budget(self):
+        pass
+
+    @unittest.skip(FLASK_ONLY)
+    def test_update_movie_replaces_actors_query_budget(self):
+        pass
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
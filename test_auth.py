@@ -0,0 +1,332 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from flask import Flask
+from jose import jwk, jwt
+from auth import auth
+from auth.auth import (AuthError, JWKSCache, TokenCache, parse_max_age,
+                       requires_auth, verify_decode_jwt)
+from metrics import metrics
+
+PRIVATE_KEY = rsa.generate_private_key(
+    public_exponent=65537, key_size=2048,
+    backend=default_backend()).private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption())
+PUBLIC_JWK = jwk.construct(PRIVATE_KEY, 'RS256').public_key().to_dict()
+
+
+def make_jwks(*kids):
+    return {'keys': [dict(PUBLIC_JWK, kid=kid, use='sig') for kid in kids]}
+
+
+def make_token(kid, **claims):
+    claims.setdefault('iss', 'https://' + auth.AUTH0_URL + '/')
+    claims.setdefault('aud', auth.API_AUDIENCE)
+    claims.setdefault('exp', int(time.time()) + 60)
+    return jwt.encode(claims, PRIVATE_KEY, algorithm='RS256',
+                      headers={'kid': kid})
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubJWKSCache(JWKSCache):
+    """JWKSCache that serves key sets from a list instead of the network"""
+
+    def __init__(self, responses, **kwargs):
+        super().__init__(url='http://stub/jwks.json', **kwargs)
+        self.responses = responses
+
+    def _fetch(self):
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class JWKSCacheTestCase(unittest.TestCase):
+    """This class represents the JWKS cache test case"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_keys_are_cached_until_ttl(self):
+        cache = StubJWKSCache([(make_jwks('a'), None), (make_jwks('b'), None)],
+                              ttl=60, clock=self.clock)
+
+        self.assertIsNotNone(cache.get_key('a'))
+        self.clock.now += 59
+        self.assertIsNotNone(cache.get_key('a'))
+        self.assertEqual(cache.fetches, 1)
+
+        self.clock.now += 1
+        self.assertIsNotNone(cache.get_key('b'))
+        self.assertEqual(cache.fetches, 2)
+
+    def test_max_age_overrides_ttl(self):
+        cache = StubJWKSCache([(make_jwks('a'), 3600), (make_jwks('a'), None)],
+                              ttl=60, clock=self.clock)
+
+        cache.get_key('a')
+        self.clock.now += 600
+        cache.get_key('a')
+
+        self.assertEqual(cache.fetches, 1)
+
+    def test_unknown_kid_refreshes_once(self):
+        cache = StubJWKSCache([(make_jwks('a'), None), (make_jwks('a', 'b'), None)],
+                              ttl=600, min_refresh_interval=30,
+                              clock=self.clock)
+        cache.get_key('a')
+        self.clock.now += 30
+
+        self.assertIsNotNone(cache.get_key('b'))
+        self.assertEqual(cache.fetches, 2)
+
+    def test_unknown_kid_refresh_is_rate_limited(self):
+        cache = StubJWKSCache([(make_jwks('a'), None), (make_jwks('a'), None)],
+                              ttl=600, min_refresh_interval=30,
+                              clock=self.clock)
+        cache.get_key('a')
+
+        for i in range(100):
+            self.assertIsNone(cache.get_key('forged-' + str(i)))
+        self.assertEqual(cache.fetches, 1)
+
+        self.clock.now += 30
+        self.assertIsNone(cache.get_key('forged'))
+        self.assertEqual(cache.fetches, 2)
+
+    def test_stale_keys_are_served_when_fetch_fails(self):
+        cache = StubJWKSCache([(make_jwks('a'), None), OSError('timed out')],
+                              ttl=60, clock=self.clock)
+        cache.get_key('a')
+        self.clock.now += 61
+
+        self.assertIsNotNone(cache.get_key('a'))
+
+    def test_error_fetch_fails_without_keys(self):
+        cache = StubJWKSCache([OSError('timed out')], clock=self.clock)
+
+        with self.assertRaises(AuthError) as context:
+            cache.get_key('a')
+        self.assertEqual(context.exception.status_code, 503)
+
+    def test_local_jwks_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json',
+                                         delete=False) as jwks_file:
+            json.dump(make_jwks('local'), jwks_file)
+        self.addCleanup(os.remove, jwks_file.name)
+        cache = JWKSCache(path=jwks_file.name, clock=self.clock)
+
+        self.assertIsNotNone(cache.get_key('local'))
+
+    def test_stub_url(self):
+        body = json.dumps(make_jwks('stub')).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Cache-Control', 'public, max-age=120')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = 'http://127.0.0.1:%d/.well-known/jwks.json' % server.server_port
+        cache = JWKSCache(url=url, ttl=600, clock=self.clock)
+
+        self.assertIsNotNone(cache.get_key('stub'))
+        self.clock.now += 121
+        cache.get_key('stub')
+        self.assertEqual(cache.fetches, 2)
+
+    def test_parse_max_age(self):
+        self.assertEqual(parse_max_age('public, max-age=86400'), 86400)
+        self.assertEqual(parse_max_age('no-store'), 0)
+        self.assertIsNone(parse_max_age(''))
+
+    def test_rotation_runs_callbacks(self):
+        cache = StubJWKSCache([(make_jwks('a'), None), (make_jwks('a'), None),
+                               (make_jwks('b'), None)],
+                              ttl=60, clock=self.clock)
+        rotations = []
+        cache.on_rotate.append(lambda: rotations.append(True))
+        cache.get_key('a')
+        self.clock.now += 60
+        cache.get_key('a')
+        self.assertEqual(rotations, [])
+
+        self.clock.now += 60
+        cache.get_key('b')
+        self.assertEqual(rotations, [True])
+
+    def test_keys_are_built_once_per_key_set(self):
+        cache = StubJWKSCache([(make_jwks('a'), None), (make_jwks('a'), None)],
+                              ttl=60, clock=self.clock)
+        key = cache.get_key('a')
+        self.clock.now += 60
+
+        self.assertIs(cache.get_key('a'), key)
+        self.assertEqual(cache.fetches, 2)
+
+    def test_keys_that_cannot_verify_rs256_are_skipped(self):
+        jwks = make_jwks('sig')
+        jwks['keys'].append(dict(PUBLIC_JWK, kid='enc', use='enc'))
+        jwks['keys'].append({'kty': 'oct', 'kid': 'hmac', 'k': 'c2VjcmV0'})
+        cache = StubJWKSCache([(jwks, None)], clock=self.clock)
+
+        self.assertIsNotNone(cache.get_key('sig'))
+        self.assertIsNone(cache.get_key('enc'))
+        self.assertIsNone(cache.get_key('hmac'))
+
+
+class VerifyDecodeJWTTestCase(unittest.TestCase):
+    """This class represents the token verification test case"""
+
+    def setUp(self):
+        for name, value in (('AUTH0_URL', 'casting.test'),
+                            ('API_AUDIENCE', '/casting')):
+            patcher = mock.patch.object(auth, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_verify_decode_jwt(self):
+        cache = StubJWKSCache([(make_jwks('a'), None)])
+        token = make_token('a', permissions=['read:movies'])
+
+        with mock.patch.object(auth, 'jwks_cache', cache):
+            payload = verify_decode_jwt(token)
+        self.assertEqual(payload['permissions'], ['read:movies'])
+
+    def test_error_verify_decode_jwt_unknown_kid(self):
+        cache = StubJWKSCache([(make_jwks('a'), None)])
+        token = make_token('b')
+
+        with mock.patch.object(auth, 'jwks_cache', cache):
+            with self.assertRaises(AuthError) as context:
+                verify_decode_jwt(token)
+        self.assertEqual(context.exception.error['description'],
+                         'Unable to find the appropriate key.')
+
+    def test_error_verify_decode_jwt_expired(self):
+        cache = StubJWKSCache([(make_jwks('a'), None)])
+        token = make_token('a', exp=int(time.time()) - 60)
+
+        with mock.patch.object(auth, 'jwks_cache', cache):
+            with self.assertRaises(AuthError) as context:
+                verify_decode_jwt(token)
+        self.assertEqual(context.exception.error['code'], 'token_expired')
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    """This class represents the verified token cache test case"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_hit_and_miss_counters(self):
+        cache = TokenCache(maxsize=10, clock=self.clock)
+        payload = {'sub': 'user', 'exp': self.clock.now + 60}
+
+        self.assertIsNone(cache.get('token'))
+        cache.set('token', payload, decode_seconds=0.002)
+        self.assertIs(cache.get('token'), payload)
+        self.assertIs(cache.get('token'), payload)
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+        self.assertAlmostEqual(stats['saved_seconds'], 0.004)
+
+    def test_hits_and_misses_are_exported(self):
+        app = Flask(__name__)
+        app.config.from_object('config')
+        app.config['METRICS'] = True
+        app.config['METRICS_DIR'] = None
+        metrics.init_app(app)
+        self.addCleanup(metrics.init_app, app)
+        self.addCleanup(app.config.__setitem__, 'METRICS', False)
+        cache = TokenCache(maxsize=10, clock=self.clock)
+        cache.set('token', {'sub': 'user', 'exp': self.clock.now + 60})
+
+        cache.get('token')
+        cache.get('token')
+        cache.get('other token')
+        totals = metrics.collect()
+
+        self.assertEqual(totals[('auth_token_cache_hits_total', ())], 2)
+        self.assertEqual(totals[('auth_token_cache_misses_total', ())], 1)
+
+    def test_entries_expire_at_exp_claim(self):
+        cache = TokenCache(maxsize=10, clock=self.clock)
+        cache.set('token', {'exp': self.clock.now + 60})
+        self.clock.now += 60
+
+        self.assertIsNone(cache.get('token'))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_tokens_without_exp_are_not_cached(self):
+        cache = TokenCache(maxsize=10, clock=self.clock)
+        cache.set('token', {'sub': 'user'})
+
+        self.assertIsNone(cache.get('token'))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TokenCache(maxsize=2, clock=self.clock)
+        exp = self.clock.now + 60
+        cache.set('a', {'exp': exp})
+        cache.set('b', {'exp': exp})
+        cache.get('a')
+        cache.set('c', {'exp': exp})
+
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_requires_auth_skips_decode_for_repeat_tokens(self):
+        app = Flask(__name__)
+        cache = TokenCache(maxsize=10)
+        payload = {'exp': cache.clock() + 60, 'permissions': ['read:movies']}
+
+        @requires_auth('read:movies')
+        def view(token):
+            return token
+
+        with mock.patch.object(auth, 'token_cache', cache), \
+                mock.patch.object(auth.jwks_cache, 'ensure_fresh'), \
+                mock.patch.object(auth, 'verify_decode_jwt',
+                                  return_value=payload) as verify:
+            for i in range(3):
+                with app.test_request_context(
+                        headers={'Authorization': 'Bearer token'}):
+                    self.assertIs(view(), payload)
+
+        self.assertEqual(verify.call_count, 1)
+        self.assertEqual(cache.stats()['hits'], 2)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+from cache import MemoryBackend
+from counts import CountCache
+
+
+def make_value(body):
+    return {'status': 200, 'body': body, 'mimetype': 'application/json',
+            'etag': None}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class MemoryBackendTestCase(unittest.TestCase):
+    """This class represents the in-process response cache test case"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.backend = MemoryBackend(max_bytes=10, clock=self.clock)
+
+    def set(self, key, body, tags=(), ttl=60):
+        self.backend.set(key, make_value(body), set(tags), ttl,
+                         self.backend.generation())
+
+    def test_get_returns_stored_value(self):
+        self.set('a', '1234')
+
+        self.assertEqual(self.backend.get('a')['body'], '1234')
+        self.assertIsNone(self.backend.get('b'))
+        self.assertEqual(self.backend.stats()['hits'], 1)
+        self.assertEqual(self.backend.stats()['misses'], 1)
+
+    def test_entries_expire(self):
+        self.set('a', '1234', ttl=30)
+        self.clock.now += 30
+
+        self.assertIsNone(self.backend.get('a'))
+        self.assertEqual(self.backend.stats()['bytes'], 0)
+
+    def test_least_recently_used_is_evicted_over_max_bytes(self):
+        self.set('a', '1234')
+        self.set('b', '1234')
+        self.backend.get('a')
+        self.set('c', '1234')
+
+        self.assertIsNotNone(self.backend.get('a'))
+        self.assertIsNone(self.backend.get('b'))
+        self.assertIsNotNone(self.backend.get('c'))
+        self.assertLessEqual(self.backend.stats()['bytes'], 10)
+
+    def test_invalidate_drops_only_tagged_entries(self):
+        self.set('movie-1', '1', tags=['movie:1', 'actor:3'])
+        self.set('movie-2', '2', tags=['movie:2'])
+        self.set('actor-3', '3', tags=['actor:3', 'movie:1'])
+
+        self.backend.invalidate(['actor:3'])
+
+        self.assertIsNone(self.backend.get('movie-1'))
+        self.assertIsNone(self.backend.get('actor-3'))
+        self.assertIsNotNone(self.backend.get('movie-2'))
+
+    def test_set_is_skipped_after_concurrent_invalidation(self):
+        generation = self.backend.generation()
+        self.backend.invalidate(['movie:1'])
+        self.backend.set('movie-1', make_value('1'), {'movie:1'}, 60,
+                         generation)
+
+        self.assertIsNone(self.backend.get('movie-1'))
+
+
+class CountCacheTestCase(unittest.TestCase):
+    """This class represents the row count cache test case"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = CountCache(ttl=5, clock=self.clock)
+
+    def test_counts_expire_after_ttl(self):
+        self.cache.set('movies', 'all', 10)
+        self.clock.now += 4
+        self.assertEqual(self.cache.get('movies', 'all'), 10)
+
+        self.clock.now += 1
+        self.assertIsNone(self.cache.get('movies', 'all'))
+
+    def test_invalidate_drops_the_table_counts(self):
+        self.cache.set('movies', 'all', 10)
+        self.cache.set('movies', 'filtered', 2)
+        self.cache.set('actors', 'all', 7)
+        self.cache.invalidate('movies')
+
+        self.assertIsNone(self.cache.get('movies', 'all'))
+        self.assertIsNone(self.cache.get('movies', 'filtered'))
+        self.assertEqual(self.cache.get('actors', 'all'), 7)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
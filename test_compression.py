@@ -0,0 +1,120 @@
+import gzip
+import json
+import unittest
+import zlib
+from flask import Flask, Response
+from compression import compressor
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CompressionTestCase(unittest.TestCase):
+    """This class represents the response compression test case"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.from_object('config')
+        self.app.config['COMPRESS_MIN_SIZE'] = 1024
+        self.body = {'movies': [{'id': i, 'title': 'Movie %d' % i}
+                                for i in range(200)]}
+        self.chunks = []
+
+        @self.app.route('/large')
+        def large():
+            response = self.app.response_class(
+                json.dumps(self.body), mimetype='application/json')
+            response.set_etag('abc')
+            return response
+
+        @self.app.route('/small')
+        def small():
+            return self.app.response_class(
+                '{"success":true}', mimetype='application/json')
+
+        @self.app.route('/stream')
+        def stream():
+            def generate():
+                for chunk in ('{"movies":[', '{"id":1}', ',{"id":2}', ']}'):
+                    self.chunks.append(chunk)
+                    yield chunk
+            return Response(generate(), mimetype='application/json')
+
+        self.app.after_request(compressor.compress)
+        compressor.init_app(self.app)
+        self.client = self.app.test_client()
+
+    def test_gzip(self):
+        res = self.client.get('/large', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+        self.assertEqual(res.headers['ETag'], 'W/"abc"')
+        self.assertEqual(int(res.headers['Content-Length']), len(res.data))
+        self.assertLess(len(res.data), len(json.dumps(self.body)))
+        self.assertEqual(json.loads(gzip.decompress(res.data)), self.body)
+
+    def test_no_accept_encoding(self):
+        res = self.client.get('/large')
+
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertEqual(res.headers['ETag'], '"abc"')
+        self.assertEqual(json.loads(res.data), self.body)
+
+    def test_below_min_size(self):
+        res = self.client.get('/small', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+        self.assertEqual(res.data, b'{"success":true}')
+
+    def test_level_zero(self):
+        self.app.config['COMPRESS_LEVEL'] = 0
+        compressor.init_app(self.app)
+        res = self.client.get('/large', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertNotIn('Content-Encoding', res.headers)
+
+    def test_streamed_gzip(self):
+        res = self.client.get('/stream', headers={'Accept-Encoding': 'gzip'},
+                              buffered=False)
+
+        self.assertTrue(res.is_streamed)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', res.headers)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = b''
+        for data in res.response:
+            # every chunk is flushed, so it decodes before the next is made
+            body += decompressor.decompress(data)
+            self.assertEqual(body.decode('utf-8'), ''.join(self.chunks))
+        self.assertEqual(json.loads(body), {'movies': [{'id': 1}, {'id': 2}]})
+
+    @unittest.skipUnless(brotli, 'brotli is not installed')
+    def test_brotli(self):
+        res = self.client.get('/large',
+                              headers={'Accept-Encoding': 'gzip, br'})
+
+        self.assertEqual(res.headers['Content-Encoding'], 'br')
+        self.assertEqual(json.loads(brotli.decompress(res.data)), self.body)
+
+        res = self.client.get('/large',
+                              headers={'Accept-Encoding': 'gzip, br;q=0.5'})
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+
+    @unittest.skipUnless(brotli, 'brotli is not installed')
+    def test_streamed_brotli(self):
+        res = self.client.get('/stream', headers={'Accept-Encoding': 'br'},
+                              buffered=False)
+
+        self.assertTrue(res.is_streamed)
+        self.assertEqual(res.headers['Content-Encoding'], 'br')
+        self.assertEqual(json.loads(brotli.decompress(b''.join(res.response))),
+                         {'movies': [{'id': 1}, {'id': 2}]})
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import sqlite3
+import unittest
+from sqlalchemy import exc
+from app import create_app
+from db_pool import TimedQueuePool, database_options, engine_options
+from models import db
+from dotenv import load_dotenv
+load_dotenv()
+
+CONFIG = {
+    'DB_POOL_SIZE': 5,
+    'DB_MAX_OVERFLOW': 10,
+    'DB_POOL_TIMEOUT': 10,
+    'DB_POOL_RECYCLE': 1800,
+    'DB_POOL_PRE_PING': True,
+    'DB_STATEMENT_TIMEOUT': 30000,
+    'DB_PGBOUNCER': False
+}
+
+
+class TimedQueuePoolTestCase(unittest.TestCase):
+    """This class represents the connection pool stats test case"""
+
+    def make_pool(self, **kwargs):
+        return TimedQueuePool(lambda: sqlite3.connect(':memory:'), **kwargs)
+
+    def test_stats_count_checkouts(self):
+        pool = self.make_pool(pool_size=2, max_overflow=2)
+        first = pool.connect()
+        second = pool.connect()
+
+        stats = pool.stats()
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['checked_out'], 2)
+        self.assertEqual(stats['max_connections'], 4)
+        self.assertEqual(stats['saturation'], 0.5)
+        first.close()
+        second.close()
+        self.assertEqual(pool.stats()['checked_out'], 0)
+
+    def test_stats_count_timeouts(self):
+        pool = self.make_pool(pool_size=1, max_overflow=0, timeout=0.05)
+        connection = pool.connect()
+
+        with self.assertRaises(exc.TimeoutError):
+            pool.connect()
+        stats = pool.stats()
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertEqual(stats['saturation'], 1.0)
+        self.assertGreaterEqual(stats['max_wait_seconds'], 0.05)
+        connection.close()
+
+
+class EngineOptionsTestCase(unittest.TestCase):
+    """This class represents the engine options test case"""
+
+    def test_statement_timeout_is_a_connect_option(self):
+        options = engine_options(CONFIG, 'postgresql://localhost/casting')
+
+        self.assertIs(options['poolclass'], TimedQueuePool)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'],
+                         {'options': '-c statement_timeout=30000'})
+
+    def test_pgbouncer_has_no_connect_options(self):
+        options = engine_options(dict(CONFIG, DB_PGBOUNCER=True),
+                                 'postgresql://localhost/casting')
+
+        self.assertNotIn('connect_args', options)
+
+    def test_database_options(self):
+        options = database_options(CONFIG)
+
+        self.assertEqual(options['max_size'], 15)
+        self.assertEqual(options['server_settings'],
+                         {'statement_timeout': '30000'})
+
+        options = database_options(dict(CONFIG, DB_PGBOUNCER=True))
+        self.assertNotIn('server_settings', options)
+        self.assertEqual(options['statement_cache_size'], 0)
+
+
+class StatementTimeoutTestCase(unittest.TestCase):
+    """This class represents the statement timeout test case"""
+
+    def assert_statement_timeout(self, test_config):
+        app = create_app(test_config)
+        with app.app_context():
+            # drop any session an earlier test left bound to another engine
+            db.session.remove()
+            self.assertEqual(
+                db.session.execute('SHOW statement_timeout').scalar(), '50ms')
+            with self.assertRaises(exc.OperationalError):
+                db.session.execute('SELECT pg_sleep(1)')
+            db.session.rollback()
+            db.session.remove()
+
+    def test_statement_timeout(self):
+        self.assert_statement_timeout({'DB_STATEMENT_TIMEOUT': 50})
+
+    def test_statement_timeout_with_pgbouncer(self):
+        self.assert_statement_timeout(
+            {'DB_STATEMENT_TIMEOUT': 50, 'DB_PGBOUNCER': True})
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
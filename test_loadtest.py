@@ -0,0 +1,115 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from auth import auth
+from auth.auth import JWKSCache, check_permissions, verify_decode_jwt
+from loadtest import compare, keys, run, workload
+
+
+class LoadTestKeysTestCase(unittest.TestCase):
+    """This class represents the local token and key set test case"""
+
+    def test_tokens_verify_through_the_stub(self):
+        private_key, jwks = keys.make_keypair()
+        stub = keys.JWKSStub(jwks).start()
+        try:
+            with mock.patch.object(auth, 'AUTH0_URL', keys.AUTH0_URL), \
+                    mock.patch.object(auth, 'API_AUDIENCE',
+                                      keys.API_AUDIENCE), \
+                    mock.patch.object(auth, 'jwks_cache',
+                                      JWKSCache(url=stub.url)):
+                for role, permissions in keys.ROLES.items():
+                    payload = verify_decode_jwt(
+                        keys.sign_token(private_key, role))
+                    self.assertEqual(payload['permissions'], permissions)
+                    self.assertTrue(check_permissions(permissions[0],
+                                                      payload))
+        finally:
+            stub.stop()
+
+        self.assertEqual(stub.fetches, 1)
+
+    def test_write_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            keys.write_files(directory)
+            with open(os.path.join(directory, 'tokens.env')) as env_file:
+                env = env_file.read()
+            with open(os.path.join(directory, 'jwks.json')) as jwks_file:
+                jwks = json.load(jwks_file)
+
+        self.assertEqual(jwks['keys'][0]['kid'], keys.KID)
+        for name in ('AUTH0_JWKS_FILE', 'ASSISTANT_TOKEN', 'DIRECTOR_TOKEN',
+                     'PRODUCER_TOKEN'):
+            self.assertIn('export ' + name + "='", env)
+
+
+class LoadTestWorkloadTestCase(unittest.TestCase):
+    """This class represents the load test mix and report test case"""
+
+    def test_default_mix(self):
+        weights = workload.parse_mix('')
+        reads = sum(weight for name, weight in weights.items()
+                    if workload.OPERATIONS[name][0] == 'read')
+
+        self.assertEqual(set(weights), set(workload.OPERATIONS))
+        self.assertAlmostEqual(reads / sum(weights.values()), 0.9)
+
+    def test_mix_scales_kinds_and_sets_operations(self):
+        weights = workload.parse_mix('read=50,write=50,delete_movie=0')
+        writes = [name for name in weights
+                  if workload.OPERATIONS[name][0] == 'write']
+
+        self.assertEqual(weights['delete_movie'], 0)
+        self.assertAlmostEqual(sum(weights[name] for name in writes), 50)
+        self.assertAlmostEqual(sum(weights.values()), 100)
+
+    def test_mix_errors(self):
+        for mix in ('list_everything=1', 'read=lots', 'write=-1',
+                    'read=0,write=0'):
+            with self.assertRaises(ValueError):
+                workload.parse_mix(mix)
+
+    def test_same_seed_same_requests(self):
+        def operations(seed):
+            client = workload.make_clients(
+                1, '127.0.0.1', 1, {}, [1], [1], workload.parse_mix(''),
+                seed)[0]
+            return [client.rng.choices(client.names, client.weights)[0]
+                    for i in range(50)]
+
+        self.assertEqual(operations(1), operations(1))
+        self.assertNotEqual(operations(1), operations(2))
+
+    def test_summarize(self):
+        latencies = [x / 1000 for x in range(100, 0, -1)]
+        summary = run.summarize(latencies, 2, 10)
+
+        self.assertEqual(summary['requests'], 100)
+        self.assertEqual(summary['errors'], 2)
+        self.assertEqual(summary['rps'], 10)
+        self.assertEqual(summary['p50_ms'], 50)
+        self.assertEqual(summary['p95_ms'], 95)
+        self.assertEqual(summary['p99_ms'], 99)
+        self.assertIsNone(run.summarize([], 0, 10)['p50_ms'])
+
+    def test_compare(self):
+        def report(rps, p99, settings):
+            row = {'rps': rps, 'p50_ms': 10, 'p95_ms': 20, 'p99_ms': p99,
+                   'errors': 0}
+            return {'rows': {}, 'mix': {}, 'workers': 2, 'concurrency': 16,
+                    'seed': 1, 'settings': settings, 'total': row,
+                    'operations': {'get_movie': row}}
+        text = compare.compare(
+            report(100, 40, {}),
+            report(150, 30, {'GUNICORN_WORKER_CLASS': 'gevent'}))
+
+        self.assertIn('+50.0%', text)
+        self.assertIn('-25.0%', text)
+        self.assertIn('GUNICORN_WORKER_CLASS: None -> gevent', text)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from flask import Flask
+from app import create_app
+from metrics import (BUCKETS, clear_directory, exposition, mark_process_dead,
+                     metrics, read_snapshot, snapshot_path, write_snapshot)
+from models import setup_db
+from dotenv import load_dotenv
+load_dotenv()
+
+
+def sample(text, line):
+    '''
+    returns the value of the sample line (name and labels) in text
+    '''
+    match = re.search('^' + re.escape(line) + r' (\S+)$', text, re.M)
+    return float(match.group(1)) if match else None
+
+
+class MetricsTestCase(unittest.TestCase):
+    """This class represents the metrics registry test case"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.config.from_object('config')
+        self.app.config['METRICS'] = True
+        self.app.config['METRICS_DIR'] = None
+        metrics.init_app(self.app)
+
+    def tearDown(self):
+        self.app.config['METRICS'] = False
+        metrics.init_app(self.app)
+        shutil.rmtree(self.directory)
+
+    def test_histogram_exposition(self):
+        labels = (('route', '/movies'), ('method', 'GET'))
+        for seconds in (0.0005, 0.001, 0.02, 60):
+            metrics.observe('http_request_duration_seconds', labels, seconds)
+        metrics.inc('db_pool_timeouts_total', (), 2)
+        text = exposition(metrics.collect())
+
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        bucket = 'http_request_duration_seconds_bucket{route="/movies",' \
+            'method="GET",le="%s"}'
+        self.assertEqual(sample(text, bucket % '0.001'), 2)
+        self.assertEqual(sample(text, bucket % '0.025'), 3)
+        self.assertEqual(sample(text, bucket % '10.0'), 3)
+        self.assertEqual(sample(text, bucket % '+Inf'), 4)
+        self.assertEqual(sample(
+            text, 'http_request_duration_seconds_count{route="/movies",'
+            'method="GET"}'), 4)
+        self.assertAlmostEqual(sample(
+            text, 'http_request_duration_seconds_sum{route="/movies",'
+            'method="GET"}'), 60.0215)
+        self.assertEqual(sample(text, 'db_pool_timeouts_total'), 2)
+
+    def test_label_escaping(self):
+        metrics.observe('jwks_fetch_duration_seconds',
+                        (('result', 'a "b"\\\n'),), 0.1)
+        text = exposition(metrics.collect())
+
+        self.assertIn('result="a \\"b\\"\\\\\\n"', text)
+
+    def test_threads_write_their_own_shard(self):
+        def work():
+            for i in range(1000):
+                metrics.inc('db_pool_timeouts_total')
+        threads = [threading.Thread(target=work) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(metrics.collect()[('db_pool_timeouts_total', ())],
+                         8000)
+
+    def test_one_reset_and_flush_thread_per_process(self):
+        self.app.config['METRICS_DIR'] = self.directory
+        metrics.init_app(self.app)
+        metrics.inc('db_pool_timeouts_total')
+        barrier = threading.Barrier(8)
+
+        def first_request():
+            barrier.wait()
+            metrics.after_fork()
+            metrics.inc('db_pool_timeouts_total')
+        with mock.patch.object(metrics, '_flush_forever') as flush_forever:
+            threads = [threading.Thread(target=first_request)
+                       for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            metrics.after_fork()
+
+        self.assertEqual(flush_forever.call_count, 1)
+        # what was counted before the fork is dropped, nothing after it
+        self.assertEqual(metrics.collect()[('db_pool_timeouts_total', ())], 8)
+
+    def test_workers_and_dead_workers_are_summed(self):
+        self.app.config['METRICS_DIR'] = self.directory
+        metrics.init_app(self.app)
+        metrics.inc('db_pool_timeouts_total')
+        for pid, count in ((101, 2), (102, 3)):
+            write_snapshot(snapshot_path(self.directory, pid), [
+                ['db_pool_timeouts_total', [], count],
+                ['db_pool_size', [['pool', 'primary']], 5]])
+        mark_process_dead(self.directory, 101)
+        mark_process_dead(self.directory, 102)
+        write_snapshot(snapshot_path(self.directory, 103), [
+            ['db_pool_timeouts_total', [], 4],
+            ['db_pool_size', [['pool', 'primary']], 5]])
+        totals = metrics.collect()
+
+        self.assertEqual(totals[('db_pool_timeouts_total', ())], 10)
+        # gauges of exited workers are dropped
+        self.assertEqual(totals[('db_pool_size', (('pool', 'primary'),))], 5)
+        self.assertEqual(read_snapshot(os.path.join(
+            self.directory, 'dead.json')), [['db_pool_timeouts_total', [], 5]])
+
+        clear_directory(self.directory)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_disabled(self):
+        self.app.config['METRICS'] = False
+        metrics.init_app(self.app)
+        metrics.inc('db_pool_timeouts_total')
+
+        self.assertEqual(metrics.collect(), {})
+
+
+class MetricsEndpointTestCase(unittest.TestCase):
+    """This class represents the /metrics endpoint test case"""
+
+    def setUp(self):
+        self.app = create_app({'METRICS': True,
+                               'RESPONSE_CACHE_BACKEND': 'none'})
+        setup_db(self.app, os.getenv('TEST_DATABASE_URL'))
+        self.client = self.app.test_client
+        self.headers = {
+            'Authorization': 'bearer ' + os.getenv('ASSISTANT_TOKEN')}
+
+    def tearDown(self):
+        self.app.config['METRICS'] = False
+        metrics.init_app(self.app)
+
+    def test_metrics(self):
+        self.client().get('/movies?limit=2', headers=self.headers)
+        self.client().get('/movies/0', headers=self.headers)
+        res = self.client().get('/metrics')
+        text = res.data.decode('utf-8')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.content_type.startswith('text/plain'))
+        self.assertEqual(sample(
+            text, 'http_request_duration_seconds_count{route="/movies",'
+            'method="GET",status="200"}'), 1)
+        self.assertEqual(sample(
+            text, 'http_request_duration_seconds_count{'
+            'route="/movies/<int:movie_id>",method="GET",status="404"}'), 1)
+        self.assertGreaterEqual(sample(
+            text, 'db_query_duration_seconds_count'), 2)
+        self.assertGreaterEqual(sample(
+            text, 'db_pool_checkout_wait_seconds_count'), 1)
+        self.assertIsNotNone(sample(
+            text, 'db_pool_size{pool="primary"}'))
+        self.assertEqual(len(BUCKETS) + 3, len(re.findall(
+            '^db_query_duration_seconds', text, re.M)))
+
+    def test_disabled(self):
+        self.app.config['METRICS'] = False
+        metrics.init_app(self.app)
+
+        self.assertEqual(self.client().get('/metrics').status_code, 404)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import date
+from sqlalchemy import create_engine
+from app import create_app
+from cache import response_cache
+from models import setup_db, db, Movie
+from replicas import STICKY_COOKIE, replica_router
+from dotenv import load_dotenv
+load_dotenv()
+
+REPLICA_MOVIE_ID = 900001
+
+
+class ReplicaTestCase(unittest.TestCase):
+    """This class represents the read replica routing test case
+
+    The replica is a sqlite database that only holds one movie, so a
+    response shows which database the request read from.
+    """
+
+    def setUp(self):
+        handle, self.replica_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        replica_url = 'sqlite:///' + self.replica_path
+        engine = create_engine(replica_url)
+        db.metadata.create_all(engine)
+        engine.execute(Movie.__table__.insert().values(
+            id=REPLICA_MOVIE_ID, title='Only on the replica',
+            release_date=date(2021, 1, 12)))
+        engine.dispose()
+
+        self.app = create_app({'DATABASE_REPLICA_URLS': replica_url,
+                               'RESPONSE_CACHE_BACKEND': 'none'})
+        setup_db(self.app, os.getenv('TEST_DATABASE_URL'))
+        self.client = self.app.test_client
+        self.token_producer = os.getenv('PRODUCER_TOKEN')
+        self.token_assistant = os.getenv('ASSISTANT_TOKEN')
+        self.now = 1000000.0
+        replica_router.clock = lambda: self.now
+
+    def tearDown(self):
+        replica_router.clock = self.default_clock
+        self.app.config['DATABASE_REPLICA_URLS'] = None
+        replica_router.init_app(self.app)
+        self.app.config['RESPONSE_CACHE_BACKEND'] = 'none'
+        response_cache.init_app(self.app)
+        os.remove(self.replica_path)
+
+    default_clock = replica_router.clock
+
+    def get_movie(self, client, movie_id, token):
+        return client.get('/movies/' + str(movie_id), headers={
+            'Authorization': 'bearer ' + token})
+
+    def test_get_reads_replica(self):
+        res = self.get_movie(self.client(), REPLICA_MOVIE_ID,
+                             self.token_assistant)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['movie']['title'], 'Only on the replica')
+
+    def test_outside_request_uses_primary(self):
+        with self.app.app_context():
+            self.assertIsNone(Movie.query.get(REPLICA_MOVIE_ID))
+
+    def test_write_goes_to_primary_and_sticks(self):
+        headers = {'Authorization': 'bearer ' + self.token_producer}
+        client = self.client()
+        res = client.post('/movies', json={
+            'title': 'Written to the primary',
+            'release_date': '2021-01-12'
+        }, headers=headers)
+        movie_id = json.loads(res.data)['movie']['id']
+        try:
+            self.assertEqual(res.status_code, 201)
+            self.assertIn(STICKY_COOKIE, res.headers['Set-Cookie'])
+            # the writer reads its write, with or without the cookie
+            self.assertEqual(self.get_movie(
+                client, movie_id, self.token_producer).status_code, 200)
+            self.assertEqual(self.get_movie(
+                self.client(), movie_id, self.token_producer).status_code, 200)
+            # other clients read the replica
+            self.assertEqual(self.get_movie(
+                self.client(), movie_id, self.token_assistant).status_code, 404)
+
+            self.now += self.app.config['REPLICA_STICKY_SECONDS'] + 2
+            self.assertEqual(self.get_movie(
+                client, movie_id, self.token_producer).status_code, 404)
+        finally:
+            with self.app.app_context():
+                Movie.query.filter(Movie.id == movie_id).delete()
+                db.session.commit()
+
+    def test_response_cache_keeps_read_your_writes(self):
+        self.app.config['RESPONSE_CACHE_BACKEND'] = 'memory'
+        response_cache.init_app(self.app)
+        producer = {'Authorization': 'bearer ' + self.token_producer}
+        assistant = {'Authorization': 'bearer ' + self.token_assistant}
+        client = self.client()
+        res = client.post('/movies', json={
+            'title': 'Written to the primary',
+            'release_date': '2021-01-12'
+        }, headers=producer)
+        movie_id = json.loads(res.data)['movie']['id']
+
+        def movie_ids(res):
+            return [x['id'] for x in json.loads(res.data)['movies']]
+        try:
+            # another client reads the lagging replica, under the key the
+            # writer reads next, and the stale list is not stored
+            res = self.client().get('/movies', headers=assistant)
+            self.assertEqual(movie_ids(res), [REPLICA_MOVIE_ID])
+            self.assertEqual(response_cache.backend.stats()['entries'], 0)
+
+            res = client.get('/movies', headers=producer)
+            self.assertIn(movie_id, movie_ids(res))
+            res = self.client().get('/movies', headers=producer)
+            self.assertIn(movie_id, movie_ids(res))
+
+            # once the replicas have caught up, replica reads are cached
+            self.now += self.app.config['REPLICA_STICKY_SECONDS'] + 2
+            response_cache.backend.clear()
+            self.client().get('/movies', headers=assistant)
+            self.assertEqual(response_cache.backend.stats()['entries'], 1)
+        finally:
+            with self.app.app_context():
+                Movie.query.filter(Movie.id == movie_id).delete()
+                db.session.commit()
+
+    def test_failed_write_does_not_stick(self):
+        res = self.client().post('/movies', json={'title': 'No date'},
+                                 headers={'Authorization':
+                                          'bearer ' + self.token_producer})
+
+        self.assertEqual(res.status_code, 400)
+        self.assertNotIn('Set-Cookie', res.headers)
+        self.assertEqual(self.get_movie(
+            self.client(), REPLICA_MOVIE_ID,
+            self.token_producer).status_code, 200)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
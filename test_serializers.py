@@ -0,0 +1,66 @@
+import json
+import unittest
+from datetime import date
+from flask import Flask
+from models import Actor, Movie
+from serializers import (json_backend, json_response, row_serializer,
+                         serialize_row)
+
+
+class SerializersTestCase(unittest.TestCase):
+    """This class represents the json serializers test case"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.from_object('config')
+        self.actors = [Actor(name='Jon "Jonny" Actor', age=45, gender='male'),
+                       Actor(name='Zoë Actor', age=30, gender='female')]
+        for index, actor in enumerate(self.actors):
+            actor.id = index + 1
+        self.movie = Movie(title='Café\n100%', release_date=date(2021, 1, 12))
+        self.movie.id = 7
+        self.movie.actors = self.actors
+
+    def test_matches_format(self):
+        with self.app.app_context():
+            expected = json.loads(self.app.json_encoder().encode(
+                self.movie.format()))
+
+            self.assertEqual(json.loads(serialize_row(
+                self.movie, Movie.fields, 'actors')), expected)
+            self.assertEqual(json.loads(serialize_row(
+                self.movie, ['title'])), {'title': 'Café\n100%'})
+            self.assertEqual(expected['release_date'],
+                             'Tue, 12 Jan 2021 00:00:00 GMT')
+
+    def test_shared_linked_rows(self):
+        other = Movie(title='Other', release_date=date(2020, 1, 1))
+        other.id = 8
+        other.actors = self.actors[1:]
+        serialize = row_serializer(Movie, ('id',), 'actors')
+
+        movies = [json.loads(x) for x in serialize([self.movie, other])]
+        self.assertEqual(movies[0]['actors']['total_actors'], 2)
+        self.assertEqual(movies[1]['actors']['actors'],
+                         movies[0]['actors']['actors'][1:])
+
+    def test_json_response_raw(self):
+        for backend in ('json', 'auto'):
+            self.app.config['JSON_BACKEND'] = backend
+            json_backend.init_app(self.app)
+            with self.app.app_context():
+                response = json_response(
+                    {'success': True, 'next_cursor': None}, 201,
+                    raw={'movies': ['{"id":1}', '{"id":2}']})
+
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.mimetype, 'application/json')
+            self.assertNotIn(b' ', response.data)
+            self.assertEqual(json.loads(response.data), {
+                'success': True, 'next_cursor': None,
+                'movies': [{'id': 1}, {'id': 2}]})
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
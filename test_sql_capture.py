@@ -0,0 +1,57 @@
+import os
+import unittest
+from app import create_app
+from models import setup_db, db, Movie
+from sql_capture import capture_sql, statement_shape
+from dotenv import load_dotenv
+load_dotenv()
+
+
+class SQLCaptureTestCase(unittest.TestCase):
+    """This class represents the SQL capture helper test case"""
+
+    def setUp(self):
+        self.app = create_app()
+        setup_db(self.app, os.getenv('TEST_DATABASE_URL'))
+        db.session.remove()
+
+    def test_statement_shape(self):
+        self.assertEqual(
+            statement_shape("SELECT * FROM movies\n WHERE id IN "
+                            "(%(id_1)s, %(id_2)s) AND title = 'It''s' "
+                            "LIMIT 10"),
+            'SELECT * FROM movies WHERE id IN (?) AND title = ? LIMIT ?')
+        self.assertEqual(statement_shape('WHERE id = %(param_1)s'),
+                         statement_shape('WHERE id = 12'))
+
+    def test_lazy_loads_are_repeated(self):
+        with capture_sql() as statements:
+            with self.app.test_request_context('/movies'):
+                for movie in Movie.query.limit(3).all():
+                    movie.actors
+
+        repeated = statements.repeated()
+        self.assertEqual(len(statements), 4)
+        self.assertEqual(len(repeated), 1)
+        self.assertIn('movie_actor_assoc', repeated[0][0])
+        self.assertEqual(repeated[0][1], 3)
+
+    def test_repeats_across_requests_or_commits(self):
+        with capture_sql() as statements:
+            for i in range(2):
+                with self.app.test_request_context('/movies'):
+                    Movie.query.first()
+            with self.app.test_request_context('/movies'):
+                Movie.query.first()
+                db.session.commit()
+                Movie.query.first()
+            Movie.query.first()
+            Movie.query.first()
+
+        self.assertEqual(len(statements), 6)
+        self.assertEqual(statements.repeated(), [])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
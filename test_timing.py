@@ -0,0 +1,102 @@
+import os
+import re
+import unittest
+from app import create_app
+from models import setup_db
+from timing import RequestTimer, server_timing
+from dotenv import load_dotenv
+load_dotenv()
+
+
+def parse_header(header):
+    '''
+    returns {name: (duration in ms, description)} for a Server-Timing header
+    '''
+    metrics = {}
+    for metric in header.split(', '):
+        name, *params = metric.split(';')
+        params = dict(param.split('=', 1) for param in params)
+        metrics[name] = (float(params['dur']), params.get('desc'))
+    return metrics
+
+
+class RequestTimerTestCase(unittest.TestCase):
+    """This class represents the per phase request timer test case"""
+
+    def setUp(self):
+        self.now = 0.0
+        self.timer = RequestTimer(clock=lambda: self.now)
+
+    def test_phases_are_exclusive(self):
+        self.now += 0.001
+        self.timer.enter('serialize')
+        self.now += 0.002
+        self.timer.enter('db')
+        self.now += 0.004
+        self.timer.exit()
+        self.now += 0.001
+        self.timer.exit()
+        self.timer.enter('db')
+        self.now += 0.002
+        self.timer.exit()
+        self.now += 0.001
+
+        self.assertEqual(parse_header(self.timer.header()), {
+            'app': (2.0, None),
+            'serialize': (3.0, None),
+            'db': (6.0, '"2 queries"'),
+            'total': (11.0, None)
+        })
+
+
+class ServerTimingTestCase(unittest.TestCase):
+    """This class represents the Server-Timing header test case"""
+
+    def setUp(self):
+        self.app = create_app({'SERVER_TIMING': True,
+                               'RESPONSE_CACHE_BACKEND': 'none'})
+        setup_db(self.app, os.getenv('TEST_DATABASE_URL'))
+        self.client = self.app.test_client
+        self.headers = {
+            'Authorization': 'bearer ' + os.getenv('ASSISTANT_TOKEN')}
+
+    def tearDown(self):
+        self.app.config['SERVER_TIMING'] = False
+        server_timing.init_app(self.app)
+
+    def test_list_phases(self):
+        res = self.client().get('/movies?limit=2&include=actors',
+                                headers=self.headers)
+        metrics = parse_header(res.headers['Server-Timing'])
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Timing-Allow-Origin'], '*')
+        for name in ('auth', 'db', 'serialize', 'app', 'total'):
+            self.assertIn(name, metrics)
+        queries = int(re.match(r'"(\d+) queries"', metrics['db'][1]).group(1))
+        # the catalog version, the page, the actors of the page, the count
+        self.assertGreaterEqual(queries, 3)
+        self.assertAlmostEqual(metrics['total'][0], sum(
+            duration for name, (duration, desc) in metrics.items()
+            if name != 'total'), delta=0.1)
+
+    def test_error_response(self):
+        res = self.client().get('/movies')
+        metrics = parse_header(res.headers['Server-Timing'])
+
+        self.assertEqual(res.status_code, 401)
+        self.assertIn('auth', metrics)
+        self.assertNotIn('db', metrics)
+
+    def test_disabled(self):
+        self.app.config['SERVER_TIMING'] = False
+        server_timing.init_app(self.app)
+        res = self.client().get('/movies?limit=2', headers=self.headers)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('Server-Timing', res.headers)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import time
+from contextlib import nullcontext
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+'''
+Server-Timing
+    With SERVER_TIMING on, every response carries a Server-Timing header
+    that splits the time the worker spent on the request into phases:
+        auth        reading and verifying the token
+        cache       response cache lookups and stores
+        db          SQL statements, with their count, wherever they ran,
+                    lazy relationship loads included
+        serialize   writing the rows and the body as JSON
+        compress    compressing the body
+        app         everything else: routing, query building, the ORM
+        total       the sum of the above
+    Phases do not overlap: time spent in a query run while serializing
+    counts for db, not serialize. Streamed responses send the header before
+    the body, so it only covers the work done before the first byte.
+
+    With SERVER_TIMING off no listener is registered and phase() hands out
+    a shared no-op context manager.
+'''
+
+NO_PHASE = nullcontext()
+
+
+class RequestTimer:
+    '''
+    Exclusive time per phase for one request: the clock is always charged
+    to the innermost phase entered, or to app outside of any
+    '''
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.durations = {}
+        self.counts = {}
+        self.stack = []
+        self.last = clock()
+
+    def enter(self, name):
+        self.charge()
+        self.stack.append(name)
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def exit(self):
+        self.charge()
+        self.stack.pop()
+
+    def charge(self):
+        now = self.clock()
+        name = self.stack[-1] if self.stack else 'app'
+        self.durations[name] = self.durations.get(name, 0.0) + now - self.last
+        self.last = now
+
+    def phase(self, name):
+        return TimedPhase(self, name)
+
+    def header(self):
+        self.charge()
+        metrics = []
+        for name, seconds in self.durations.items():
+            metric = '%s;dur=%.2f' % (name, seconds * 1000)
+            if name == 'db':
+                metric += ';desc="%d queries"' % self.counts['db']
+            metrics.append(metric)
+        metrics.append('total;dur=%.2f' %
+                       (sum(self.durations.values()) * 1000))
+        return ', '.join(metrics)
+
+
+class TimedPhase:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.timer.enter(self.name)
+
+    def __exit__(self, *exc_info):
+        self.timer.exit()
+
+
+def before_cursor_execute(conn, cursor, statement, *args):
+    timer = g.get('server_timing') if has_app_context() else None
+    if timer is not None:
+        timer.enter('db')
+
+
+def after_cursor_execute(conn, cursor, statement, *args):
+    timer = g.get('server_timing') if has_app_context() else None
+    if timer is not None and timer.stack and timer.stack[-1] == 'db':
+        timer.exit()
+
+
+def handle_error(context):
+    # after_cursor_execute does not run for a failed statement
+    after_cursor_execute(None, None, None)
+
+
+LISTENERS = [('before_cursor_execute', before_cursor_execute),
+             ('after_cursor_execute', after_cursor_execute),
+             ('handle_error', handle_error)]
+
+
+class ServerTiming:
+    def __init__(self):
+        self.enabled = False
+
+    def init_app(self, app):
+        '''
+        turns the header on or off from SERVER_TIMING, the SQL listeners
+        are registered on every engine, replicas included, only when on
+        '''
+        self.enabled = app.config['SERVER_TIMING']
+        for name, listener in LISTENERS:
+            registered = event.contains(Engine, name, listener)
+            if self.enabled and not registered:
+                event.listen(Engine, name, listener)
+            elif not self.enabled and registered:
+                event.remove(Engine, name, listener)
+
+    def start(self):
+        '''
+        before_request hook, starts timing the request
+        '''
+        if self.enabled:
+            g.server_timing = RequestTimer()
+
+    def phase(self, name):
+        '''
+        returns a context manager that charges the time spent in its block
+        to name
+        '''
+        if not self.enabled:
+            return NO_PHASE
+        timer = g.get('server_timing') if has_app_context() else None
+        if timer is None:
+            return NO_PHASE
+        return timer.phase(name)
+
+    def finish(self, response):
+        '''
+        after_request hook, runs last so that the header covers the other
+        hooks too
+        '''
+        timer = g.get('server_timing') if self.enabled else None
+        if timer is not None:
+            response.headers['Server-Timing'] = timer.header()
+            response.headers['Timing-Allow-Origin'] = '*'
+        return response
+
+
+server_timing = ServerTiming()